@@ -5,6 +5,9 @@ import requests
 from django.conf import settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
+import logging
+
+logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 # @permission_classes([IsAuthenticated])
@@ -32,7 +35,6 @@ User = get_user_model()
 @api_view(['POST'])
 def gitlab_callback(request):
     code = request.data.get('code')
-    print(f"Received code: {code}")
     
     data = {
         'client_id': settings.GITLAB_CLIENT_ID,
@@ -42,19 +44,12 @@ def gitlab_callback(request):
         'redirect_uri': settings.GITLAB_REDIRECT_URI
     }
     
-    print("OAuth Request Data:", {  # Debug print
-        'client_id': data['client_id'],
-        'client_secret': data['client_secret'][:4] + '...',  # Show only first 4 chars
-        'code': code,
-        'redirect_uri': data['redirect_uri']
-    })
-    
     response = requests.post(
         'https://gitlab.com/oauth/token',
         data=data
     )
 
-    print(f"GitLab Response:", response.text)  # Print full response
+    logger.info("GitLab OAuth token exchange", extra={'status_code': response.status_code})
 
     if response.status_code == 200:
         access_token = response.json().get('access_token')
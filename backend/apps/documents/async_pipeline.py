@@ -0,0 +1,152 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .models import Document, InvalidStageTransition
+from .extraction import extract_text
+from .tasks import mark_failed, process_batch, process_document, stage_changed
+from .revisions import agenerate_revision, plan_revision, save_page_hashes
+from .uploads import release_copies
+from apps.tickets.chunking import build_sections
+from apps.telemetry.tracing import stage
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_in_flight = set()
+_limit = None
+
+
+def bind_event_loop(loop):
+    """
+    Remember the ASGI server's event loop so sync views can hand documents to it
+    """
+    global _loop, _limit
+    _loop = loop
+    _limit = asyncio.Semaphore(settings.ASYNC_PROCESSING_MAX_IN_FLIGHT)
+
+
+async def drain(timeout=None):
+    """
+    Wait for documents still being processed on the event loop, e.g. on shutdown
+    """
+    pending = [asyncio.wrap_future(future) for future in list(_in_flight)]
+    if pending:
+        logger.info("Waiting for in-flight documents", extra={'count': len(pending)})
+        await asyncio.wait(pending, timeout=timeout)
+
+
+def schedule_processing(document_id):
+    """
+    Start processing an uploaded document.
+
+    With DOCUMENT_PROCESSING_BACKEND = 'asgi' and a bound event loop, the
+    document is processed as a coroutine on the server's loop, so waiting on
+    OpenAI costs no thread or worker slot. Otherwise it is queued on Celery.
+    """
+    if not _submit(aprocess_document(document_id)):
+        process_document.delay(document_id)
+
+
+def schedule_batch(document_ids):
+    """
+    Start processing a bulk ingestion batch with at most
+    BULK_PROCESSING_CONCURRENCY documents in flight, on the event loop or
+    in one Celery task
+    """
+    if document_ids and not _submit(aprocess_batch(document_ids)):
+        process_batch.delay(document_ids)
+
+
+def _submit(coroutine):
+    """
+    Run a coroutine on the bound event loop when the ASGI backend is selected
+    """
+    if settings.DOCUMENT_PROCESSING_BACKEND == 'asgi' and _loop is not None and _loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(coroutine, _loop)
+        _in_flight.add(future)
+        future.add_done_callback(_in_flight.discard)
+        return True
+    coroutine.close()
+    return False
+
+
+async def aprocess_batch(document_ids):
+    limit = asyncio.Semaphore(settings.BULK_PROCESSING_CONCURRENCY)
+
+    async def process(document_id):
+        async with limit:
+            await aprocess_document(document_id)
+
+    await asyncio.gather(*(process(document_id) for document_id in document_ids))
+
+
+async def aprocess_document(document_id):
+    """
+    Async counterpart of tasks.process_document. Extraction is CPU-bound and
+    runs in a thread; generation awaits the OpenAI calls on the event loop.
+    """
+    try:
+        document = await Document.objects.defer('content', 'search_vector').aget(id=document_id)
+    except Document.DoesNotExist:
+        logger.warning("Document no longer exists, skipping processing", extra={'document_id': document_id})
+        return
+
+    transition_to = sync_to_async(document.transition_to)
+
+    async with _limit or contextlib.nullcontext():
+        with stage('pipeline.process_document', document_id=document_id):
+            try:
+                await transition_to('EXTRACTING')
+
+                content, timings = await asyncio.to_thread(extract_text, document.file.path, document.file_name)
+                logger.info("Extracted document", extra={
+                    'document_id': document.id,
+                    'format': timings['format'],
+                    'page_count': timings['page_count'],
+                    'extract_seconds': round(timings['total_seconds'], 3),
+                    'content_chars': len(content)
+                })
+
+                if not content.strip():
+                    await transition_to(
+                        'FAILED',
+                        jira_status='ERROR',
+                        processing_error='Document uploaded but no text content extracted'
+                    )
+                    return
+
+                await transition_to('GENERATING', content=content)
+                await sync_to_async(save_page_hashes)(document, timings['pages'])
+                sections = await asyncio.to_thread(build_sections, content, timings['pages'], settings.AI_CHUNK_TOKENS)
+                plan = await sync_to_async(plan_revision)(document, sections)
+                results = await agenerate_revision(document, plan)
+
+                if results['errors']:
+                    logger.warning("Document generated with stage errors", extra={
+                        'document_id': document.id,
+                        'stage_errors': results['errors']
+                    })
+
+                await transition_to(
+                    'PROCESSED',
+                    jira_status='PROCESSED',
+                    scope_summary=results['scope_summary'],
+                    clarifying_questions=results['clarifying_questions'],
+                    processing_error="; ".join(
+                        f"{name}: {error}" for name, error in results['errors'].items()
+                    ) or None
+                )
+                logger.info("Processed document", extra={
+                    'document_id': document.id,
+                    'tickets_count': len(results['tickets'])
+                })
+
+            except InvalidStageTransition as e:
+                stage_changed(document, e)
+            except Exception as e:
+                logger.exception("Document processing error", extra={'document_id': document.id})
+                await sync_to_async(mark_failed)(document, e)
+            finally:
+                await sync_to_async(release_copies)(document)
@@ -0,0 +1,123 @@
+from django.conf import settings
+from jira import JIRA
+from requests.adapters import HTTPAdapter
+import gitlab
+import hashlib
+import logging
+import os
+import requests
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _secret(name):
+    """
+    Current value of a credential setting. When <NAME>_FILE names a file
+    (e.g. a mounted secret) it is re-read on every lookup, so a rotated
+    secret is picked up without a restart; plain settings are fixed when
+    the process starts.
+    """
+    path = os.getenv(f'{name}_FILE')
+    if path:
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError as e:
+            logger.warning("Cannot read credential file, using the setting", extra={'setting': name, 'error': str(e)})
+    return getattr(settings, name)
+
+
+def _fingerprint(*credentials):
+    return hashlib.sha256("\0".join(str(value) for value in credentials).encode('utf-8')).hexdigest()
+
+
+def _mount_pool(session):
+    """
+    Size the session's keep-alive connection pool for the push worker threads
+    """
+    adapter = HTTPAdapter(
+        pool_connections=settings.API_CLIENT_POOL_CONNECTIONS,
+        pool_maxsize=settings.API_CLIENT_POOL_MAXSIZE
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _timeout():
+    return (settings.API_CLIENT_CONNECT_TIMEOUT, settings.API_CLIENT_READ_TIMEOUT)
+
+
+def _build_jira(url, email, token):
+    jira = JIRA(
+        server=url,
+        basic_auth=(email, token),
+        timeout=_timeout(),
+        get_server_info=False,
+        # push.call_with_retries is the only retry policy
+        max_retries=0
+    )
+    _mount_pool(jira._session)
+    return jira
+
+
+def _build_gitlab(url, token):
+    return gitlab.Gitlab(
+        url=url,
+        private_token=token,
+        per_page=100,
+        api_version='4',
+        timeout=_timeout(),
+        session=_mount_pool(requests.Session()),
+        # push.call_with_retries is the only retry policy
+        retry_transient_errors=False
+    )
+
+
+def _get_client(name, credentials, build):
+    fingerprint = _fingerprint(*credentials)
+    with _lock:
+        cached = _clients.get(name)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+        # Superseded clients are left for in-flight callers and garbage collected
+        client = build(*credentials)
+        _clients[name] = (fingerprint, client)
+    return client
+
+
+def get_jira_client():
+    """
+    Shared JIRA client, rebuilt when its credentials change. Set
+    JIRA_API_TOKEN_FILE (or JIRA_EMAIL_FILE) to rotate without a restart;
+    a 401 also drops the client so its session is rebuilt on the next call.
+    """
+    return _get_client(
+        'jira',
+        (settings.JIRA_URL, _secret('JIRA_EMAIL'), _secret('JIRA_API_TOKEN')),
+        _build_jira
+    )
+
+
+def get_gitlab_client():
+    """
+    Shared python-gitlab client, rebuilt when GITLAB_TOKEN (or the file named
+    by GITLAB_TOKEN_FILE) changes and dropped after a 401 like the Jira client
+    """
+    return _get_client(
+        'gitlab',
+        (settings.GITLAB_URL, _secret('GITLAB_TOKEN')),
+        _build_gitlab
+    )
+
+
+def invalidate_client(name):
+    """
+    Drop a cached client, e.g. after the service rejected its credentials
+    """
+    with _lock:
+        _clients.pop(name, None)
@@ -0,0 +1,229 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from django.conf import settings
+from apps.telemetry.metrics import extraction_bytes, extraction_chars, extraction_duration
+from apps.telemetry.tracing import stage
+from . import formats
+import fitz
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def page_hash(text):
+    """
+    Hash of a page's text that ignores whitespace-only differences
+    """
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+def iter_pages(file_path, start=0, stop=None):
+    """
+    Yield (page_number, text, seconds) for each page in [start, stop), one page at a time
+    """
+    with fitz.open(file_path) as pdf_document:
+        stop = pdf_document.page_count if stop is None else min(stop, pdf_document.page_count)
+        for page_num in range(start, stop):
+            started = time.perf_counter()
+            text = pdf_document[page_num].get_text()
+            yield page_num, text, time.perf_counter() - started
+
+
+def _extract_range(file_path, start, stop):
+    """
+    Worker entry point: extract one page range in a separate process
+    """
+    return list(iter_pages(file_path, start, stop))
+
+
+def page_ranges(page_count, pages_per_chunk):
+    """
+    Split [0, page_count) into contiguous ranges of at most pages_per_chunk pages
+    """
+    return [
+        (start, min(start + pages_per_chunk, page_count))
+        for start in range(0, page_count, pages_per_chunk)
+    ]
+
+
+def extract_pages(file_path):
+    """
+    Extract every page of a PDF, fanning large documents out over a process
+    pool. Returns a list of (page_number, text, seconds) in page order.
+    """
+    with fitz.open(file_path) as pdf_document:
+        page_count = pdf_document.page_count
+
+    if page_count < settings.PDF_PARALLEL_THRESHOLD_PAGES:
+        return list(iter_pages(file_path))
+
+    ranges = page_ranges(page_count, settings.PDF_PAGES_PER_WORKER_CHUNK)
+    try:
+        with ProcessPoolExecutor(max_workers=min(settings.PDF_EXTRACTION_WORKERS, len(ranges))) as executor:
+            chunks = executor.map(
+                _extract_range,
+                [file_path] * len(ranges),
+                [start for start, _ in ranges],
+                [stop for _, stop in ranges],
+            )
+            return [page for chunk in chunks for page in chunk]
+    except AssertionError:
+        # Daemonic processes (e.g. Celery prefork children) may not spawn a pool
+        logger.warning("Process pool unavailable, extracting pages serially", extra={'page_count': page_count})
+        return list(iter_pages(file_path))
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+# name: label for metrics and pools; extract(file_path, max_chars) returns
+# ([(unit_number, text, seconds), ...], truncated) with 1-based unit numbers
+# and must be picklable; pooled: whether it runs in the format's own worker pool
+Extractor = namedtuple('Extractor', ['name', 'extensions', 'extract', 'pooled'])
+
+EXTRACTORS = {}
+
+
+def register(mime_types, extractor):
+    for mime_type in mime_types:
+        EXTRACTORS[mime_type] = extractor
+
+
+def _extract_pdf(file_path, max_chars):
+    units, total = [], 0
+    for page_num, text, seconds in extract_pages(file_path):
+        number = page_num + 1
+        if total + len(text) > max_chars:
+            units.append((number, text[:max_chars - total], seconds))
+            return units, True
+        units.append((number, text, seconds))
+        total += len(text)
+    return units, False
+
+
+# PDFs fan large page ranges out over their own process pool in extract_pages;
+# plain text is cheap enough to read in the calling thread
+register([formats.PDF], Extractor('pdf', ('.pdf',), _extract_pdf, False))
+register([formats.DOCX], Extractor('docx', ('.docx',), partial(formats.extract_units, 'docx'), True))
+register([formats.PPTX], Extractor('pptx', ('.pptx',), partial(formats.extract_units, 'pptx'), True))
+register([formats.XLSX], Extractor('xlsx', ('.xlsx',), partial(formats.extract_units, 'xlsx'), True))
+register(
+    [formats.TEXT, 'text/markdown', 'text/csv'],
+    Extractor('text', ('.txt', '.md', '.markdown', '.csv'), partial(formats.extract_units, 'text'), False)
+)
+
+SUPPORTED_EXTENSIONS = {extension for extractor in EXTRACTORS.values() for extension in extractor.extensions}
+
+
+def is_supported(file_name):
+    """
+    Whether an upload's extension belongs to a format that gets extracted
+    """
+    return os.path.splitext(file_name.lower())[1] in SUPPORTED_EXTENSIONS
+
+
+def get_extractor(file_path, file_name=None):
+    mime_type = formats.sniff_mime_type(file_path, file_name)
+    try:
+        return EXTRACTORS[mime_type]
+    except KeyError:
+        raise UnsupportedFormat(f"Unsupported document format: {mime_type}")
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(name):
+    """
+    The worker pool for one format. Each format has its own pool, so slow
+    spreadsheets queue behind each other rather than in front of a DOCX.
+    """
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = ProcessPoolExecutor(
+                max_workers=settings.EXTRACTION_POOL_WORKERS.get(name, 1),
+                # Spawned rather than forked: a forked worker starts with the
+                # parent's whole address space, which already counts against
+                # the memory limit. A spawned one only imports formats.
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=formats.limit_memory,
+                initargs=(settings.EXTRACTION_WORKER_MEMORY_MB,),
+                # Recycle workers so memory held by parsers does not build up
+                max_tasks_per_child=settings.EXTRACTION_TASKS_PER_WORKER,
+            )
+        return _pools[name]
+
+
+def _run_extractor(extractor, file_path):
+    max_chars = settings.EXTRACTION_MAX_CHARS
+    if not extractor.pooled:
+        return extractor.extract(file_path, max_chars)
+
+    try:
+        future = _pool(extractor.name).submit(extractor.extract, file_path, max_chars)
+    except AssertionError:
+        # Daemonic processes (e.g. Celery prefork children) may not spawn a pool
+        logger.warning("Process pool unavailable, extracting in process", extra={'format': extractor.name})
+        return extractor.extract(file_path, max_chars)
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        with _pools_lock:
+            _pools.pop(extractor.name, None)
+        raise
+
+
+def extract_text(file_path, file_name=None):
+    """
+    Extract the full text of an uploaded document of any registered format,
+    detected from its content rather than trusted from its name.
+
+    Returns (content, timings) where content joins unit texts (pages,
+    slides, blocks of rows or paragraphs) with newlines in a single pass
+    and timings holds, per unit, the extraction seconds, the unit's
+    [start, end) span in content and a hash of its text.
+    """
+    started = time.perf_counter()
+    extractor = get_extractor(file_path, file_name)
+    with stage(f'extract.{extractor.name}') as span:
+        pages, truncated = _run_extractor(extractor, file_path)
+        content = "".join(f"{text}\n" for _, text, _ in pages)
+        span.set_attribute('page_count', len(pages))
+
+    if truncated:
+        logger.warning("Extracted text truncated", extra={
+            'format': extractor.name,
+            'max_chars': settings.EXTRACTION_MAX_CHARS
+        })
+
+    page_timings, offset = [], 0
+    for page_num, text, seconds in pages:
+        page_timings.append({
+            'page': page_num,
+            'seconds': seconds,
+            'start': offset,
+            'end': offset + len(text),
+            'hash': page_hash(text),
+        })
+        offset += len(text) + 1
+    timings = {
+        'format': extractor.name,
+        'page_count': len(pages),
+        'total_seconds': time.perf_counter() - started,
+        'truncated': truncated,
+        'pages': page_timings,
+    }
+    extraction_duration.observe(timings['total_seconds'], format=extractor.name)
+    extraction_bytes.inc(os.path.getsize(file_path), format=extractor.name)
+    extraction_chars.inc(len(content), format=extractor.name)
+    return content, timings
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from urllib.parse import quote
+import os
+import re
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _parse_range(header, size):
+    """
+    Parse a single-range Range header into (start, end) inclusive.
+    Returns None when the header should be ignored and 'unsatisfiable'
+    when it cannot be served.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Malformed or multi-range: fall back to the full body
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def serve_file(request, path, name, content_type):
+    """
+    Serve a stored file with ETag/Last-Modified validation and byte-range support.
+
+    ``name`` is the file's storage name (relative to MEDIA_ROOT). When
+    FILE_DELIVERY_MODE is 'x-accel' or 'x-sendfile' the body is left to the
+    front proxy, which also handles Range requests itself.
+    """
+    stat = os.stat(path)
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    validators = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in validators.items():
+            not_modified[header] = value
+        return not_modified
+
+    mode = settings.FILE_DELIVERY_MODE
+    if mode in ('x-accel', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            # Percent-encoded so spaces, '?', '#' and non-latin-1 names reach the proxy intact
+            response['X-Accel-Redirect'] = settings.FILE_ACCEL_REDIRECT_PREFIX + quote(name)
+        else:
+            response['X-Sendfile'] = quote(path)
+    else:
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if range_header and request.headers.get('If-Range', etag) in (etag, validators['Last-Modified']):
+            byte_range = _parse_range(range_header, stat.st_size)
+
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(path, start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = StreamingHttpResponse(
+                _read_range(path, 0, stat.st_size), content_type=content_type
+            )
+            response['Content-Length'] = str(stat.st_size)
+
+    for header, value in validators.items():
+        response[header] = value
+    response['Content-Disposition'] = content_disposition_header(False, os.path.basename(name))
+    return response
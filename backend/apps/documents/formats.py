@@ -0,0 +1,168 @@
+"""
+Format detection and text readers for non-PDF documents.
+
+Each reader is a generator of (unit_number, text) pairs, where a unit is a
+slide, a block of spreadsheet rows or a run of paragraphs, so a document is
+read and handed on piece by piece instead of as one string. This module
+does not import Django: extract_units runs in the per-format worker
+processes started by extraction.py.
+"""
+import codecs
+import mimetypes
+import time
+import zipfile
+
+PDF = 'application/pdf'
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+TEXT = 'text/plain'
+
+# Part every OOXML package of the type must contain
+OOXML_MARKERS = (
+    ('word/document.xml', DOCX),
+    ('ppt/presentation.xml', PPTX),
+    ('xl/workbook.xml', XLSX),
+)
+
+SNIFF_BYTES = 8192
+# Paragraphs and rows are grouped into units of about this many characters
+UNIT_CHARS = 4000
+
+
+def limit_memory(megabytes):
+    """
+    Worker initializer: cap the address space so one huge document fails
+    with MemoryError in its worker instead of exhausting the host
+    """
+    try:
+        import resource
+
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def sniff_mime_type(file_path, file_name=None):
+    """
+    Detect a file's MIME type from its leading bytes (and, for zip-based
+    Office files, the parts it contains), falling back to the file name
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+
+    if head.startswith(b'%PDF-'):
+        return PDF
+    if head.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            names = set()
+        for marker, mime_type in OOXML_MARKERS:
+            if marker in names:
+                return mime_type
+        return 'application/zip'
+    if head and b'\x00' not in head:
+        try:
+            # Incremental so a multi-byte character cut off at the end is not an error
+            codecs.getincrementaldecoder('utf-8')().decode(head)
+            return TEXT
+        except UnicodeDecodeError:
+            pass
+    return mimetypes.guess_type(file_name or file_path)[0] or 'application/octet-stream'
+
+
+def group_units(parts, start=1):
+    """
+    Join consecutive text parts into units of about UNIT_CHARS characters
+    """
+    number, buffer, size = start, [], 0
+    for part in parts:
+        if not part:
+            continue
+        buffer.append(part)
+        size += len(part) + 1
+        if size >= UNIT_CHARS:
+            yield number, "\n".join(buffer)
+            number, buffer, size = number + 1, [], 0
+    if buffer:
+        yield number, "\n".join(buffer)
+
+
+def iter_text_units(file_path):
+    with open(file_path, encoding='utf-8', errors='replace') as f:
+        yield from group_units(line.rstrip('\n') for line in f)
+
+
+def iter_docx_units(file_path):
+    import docx2txt
+
+    yield from group_units(docx2txt.process(file_path).splitlines())
+
+
+def iter_pptx_units(file_path):
+    from pptx import Presentation
+
+    for number, slide in enumerate(Presentation(file_path).slides, 1):
+        parts = []
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                parts.append(shape.text_frame.text)
+            elif shape.has_table:
+                parts.extend(
+                    "\t".join(cell.text for cell in row.cells) for row in shape.table.rows
+                )
+        if slide.has_notes_slide:
+            parts.append(slide.notes_slide.notes_text_frame.text)
+        yield number, "\n".join(part for part in parts if part)
+
+
+def iter_xlsx_units(file_path):
+    from openpyxl import load_workbook
+
+    # Read-only mode streams rows from the sheet XML instead of loading the workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        number = 1
+        for sheet in workbook.worksheets:
+            rows = (
+                "\t".join('' if value is None else str(value) for value in row)
+                for row in sheet.iter_rows(values_only=True)
+                if any(value is not None for value in row)
+            )
+            for number, text in group_units(rows, start=number):
+                yield number, f"{sheet.title}\n{text}"
+            number += 1
+    finally:
+        workbook.close()
+
+
+READERS = {
+    'docx': iter_docx_units,
+    'pptx': iter_pptx_units,
+    'xlsx': iter_xlsx_units,
+    'text': iter_text_units,
+}
+
+
+def extract_units(reader, file_path, max_chars):
+    """
+    Read a document unit by unit, stopping once max_chars characters have
+    been collected. Returns ([(unit_number, text, seconds), ...], truncated).
+    """
+    units, total = [], 0
+    iterator = READERS[reader](file_path)
+    while True:
+        started = time.perf_counter()
+        try:
+            number, text = next(iterator)
+        except StopIteration:
+            return units, False
+        if total + len(text) > max_chars:
+            units.append((number, text[:max_chars - total], time.perf_counter() - started))
+            iterator.close()
+            return units, True
+        units.append((number, text, time.perf_counter() - started))
+        total += len(text)
@@ -0,0 +1,182 @@
+from collections import Counter
+from django.conf import settings
+from django.core.files.storage import default_storage
+from apps.telemetry.tracing import stage
+from .extraction import is_supported
+from .models import Document, IngestionBatch
+from .uploads import UploadError, release_copies, reuse_processed_document
+import hashlib
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Stages of a document that is queued or being processed
+IN_PROGRESS_STAGES = ('UPLOADED', 'EXTRACTING', 'GENERATING')
+
+
+def store_stream(stream, file_name):
+    """
+    Copy a file-like object into document storage one chunk at a time.
+    Returns (storage_name, content_hash); the size limit is enforced on the
+    bytes actually read, not the size an archive claims.
+    """
+    name = default_storage.get_available_name(f'documents/{file_name}')
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(path, 'wb') as destination:
+            for chunk in iter(lambda: stream.read(settings.UPLOAD_CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > settings.UPLOAD_MAX_SIZE:
+                    raise UploadError(f'File exceeds the {settings.UPLOAD_MAX_SIZE} byte limit', 413)
+                digest.update(chunk)
+                destination.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return name, digest.hexdigest()
+
+
+def iter_members(uploaded_file):
+    """
+    Yield (file_name, stream) for an uploaded file, or for each member of an
+    uploaded zip archive. Members are decompressed as they are read, and
+    the archive itself stays in Django's temporary upload file on disk.
+    """
+    if not uploaded_file.name.lower().endswith('.zip'):
+        yield os.path.basename(uploaded_file.name), uploaded_file
+        return
+
+    try:
+        archive = zipfile.ZipFile(uploaded_file)
+    except zipfile.BadZipFile:
+        raise UploadError(f'{uploaded_file.name} is not a valid zip archive')
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            with archive.open(info) as member:
+                yield os.path.basename(info.filename), member
+
+
+def ingest_files(uploaded_files):
+    """
+    Store every supported document from the uploaded files and archives and create their
+    Documents in one bulk INSERT under a new IngestionBatch.
+
+    Files identical to an already processed document reuse its results, and
+    files identical to one still in progress, including earlier files of the
+    same batch, wait on it (see uploads.release_copies). Returns
+    (batch, document_ids) where document_ids still need processing.
+    """
+    batch = IngestionBatch.objects.create()
+    pending, skipped = [], []
+
+    with stage('ingest.store_files', batch_id=str(batch.id)):
+        for uploaded_file in uploaded_files:
+            try:
+                for file_name, stream in iter_members(uploaded_file):
+                    if not is_supported(file_name):
+                        skipped.append({'file_name': file_name, 'reason': 'Unsupported file format'})
+                        continue
+                    if len(pending) >= settings.BULK_INGEST_MAX_FILES:
+                        skipped.append({'file_name': file_name, 'reason': 'Batch file limit reached'})
+                        continue
+                    try:
+                        storage_name, content_hash = store_stream(stream, file_name)
+                    except UploadError as e:
+                        skipped.append({'file_name': file_name, 'reason': str(e)})
+                        continue
+                    pending.append(Document(
+                        file=storage_name,
+                        file_name=file_name,
+                        content_hash=content_hash,
+                        batch=batch,
+                        jira_status='UNPROCESSED'
+                    ))
+            except UploadError as e:
+                skipped.append({'file_name': uploaded_file.name, 'reason': str(e)})
+
+    # Each content hash is processed at most once: files identical to a
+    # processed document reuse its results, and the rest wait on an
+    # identical document still in progress, or on the batch's first copy
+    hashes = {document.content_hash for document in pending}
+    # Oldest first, so the most recently processed copy of each hash wins
+    processed = {
+        source.content_hash: source
+        for source in Document.objects.filter(
+            content_hash__in=hashes, processing_stage='PROCESSED'
+        ).defer('search_vector').order_by('uploaded_at')
+    }
+    # Waiting copies are not sources; the newest document in progress wins
+    in_progress = {
+        source.content_hash: source
+        for source in Document.objects.filter(
+            content_hash__in=hashes - processed.keys(), processing_stage__in=IN_PROGRESS_STAGES
+        ).exclude(
+            processing_stage='UPLOADED', copy_of__isnull=False
+        ).only('id', 'content_hash').order_by('uploaded_at')
+    }
+    for document in pending:
+        document.copy_of = in_progress.get(document.content_hash)
+
+    documents = Document.objects.bulk_create(pending)
+
+    to_process, leaders, followers = [], {}, []
+    for document in documents:
+        source = processed.get(document.content_hash)
+        if source:
+            reuse_processed_document(document, source)
+        elif document.copy_of_id is None and document.content_hash in leaders:
+            document.copy_of_id = leaders[document.content_hash]
+            followers.append(document)
+        elif document.copy_of_id is None:
+            leaders[document.content_hash] = document.id
+            to_process.append(document.id)
+    if followers:
+        Document.objects.bulk_update(followers, ['copy_of'])
+
+    # A source that finished while this batch was being stored has already
+    # released its copies, so release the ones added since
+    for source in Document.objects.filter(
+        pk__in={source.pk for source in in_progress.values()}, processing_stage__in=('PROCESSED', 'FAILED')
+    ).only('id'):
+        release_copies(source)
+
+    batch.total_files = len(documents)
+    batch.skipped = skipped
+    batch.save(update_fields=['total_files', 'skipped'])
+    logger.info("Ingested batch", extra={
+        'batch_id': str(batch.id),
+        'documents': len(documents),
+        'deduplicated': len(documents) - len(to_process),
+        'skipped': len(skipped)
+    })
+    return batch, to_process
+
+
+def batch_progress(batch):
+    """
+    Aggregate and per-document processing progress of a batch
+    """
+    documents = list(batch.documents.order_by('id').values(
+        'id', 'file_name', 'processing_stage', 'jira_status', 'processing_error'
+    ))
+    stages = Counter(document['processing_stage'] for document in documents)
+    finished = stages['PROCESSED'] + stages['FAILED']
+    return {
+        'batch_id': str(batch.id),
+        'created_at': batch.created_at,
+        'total': len(documents),
+        'finished': finished,
+        'failed': stages['FAILED'],
+        'percent_complete': round(100 * finished / len(documents), 1) if documents else 100.0,
+        'stages': dict(stages),
+        'skipped': batch.skipped,
+        'documents': documents,
+    }
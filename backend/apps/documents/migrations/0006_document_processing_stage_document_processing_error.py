@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_document_clarifying_questions_document_scope_summary_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='processing_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processing_stage',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('EXTRACTING', 'Extracting'), ('GENERATING_TICKETS', 'Generating Tickets'), ('GENERATING_SUMMARY', 'Generating Summary'), ('GENERATING_QUESTIONS', 'Generating Questions'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='QUEUED', max_length=30),
+        ),
+    ]
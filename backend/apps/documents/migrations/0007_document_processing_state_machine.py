@@ -0,0 +1,54 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+STAGE_MAPPING = {
+    'QUEUED': 'UPLOADED',
+    'GENERATING_TICKETS': 'GENERATING',
+    'GENERATING_SUMMARY': 'GENERATING',
+    'GENERATING_QUESTIONS': 'GENERATING',
+    'COMPLETED': 'PROCESSED',
+}
+
+
+def map_processing_stages(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    for old, new in STAGE_MAPPING.items():
+        Document.objects.filter(processing_stage=old).update(processing_stage=new)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_document_processing_stage_document_processing_error'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='extracting_finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='extracting_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='generating_finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='generating_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='processing_stage',
+            field=models.CharField(choices=[('UPLOADED', 'Uploaded'), ('EXTRACTING', 'Extracting'), ('GENERATING', 'Generating'), ('PROCESSED', 'Processed'), ('FAILED', 'Failed')], default='UPLOADED', max_length=30),
+        ),
+        migrations.RunPython(map_processing_stages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:20
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_processing_state_machine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('total_size', models.BigIntegerField(blank=True, null=True)),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('received_bytes', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('COMPLETED', 'Completed')], default='ACTIVE', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.document')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_content_hash_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['jira_status', 'uploaded_at'], name='document_status_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['uploaded_at', 'id'], name='document_uploaded_id_idx'),
+        ),
+    ]
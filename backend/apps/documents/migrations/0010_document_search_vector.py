@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('file_name'), models.Value('-'), models.Value(' ')), models.Value('.'), models.Value(' ')), models.Value('_'), models.Value(' ')), config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector(django.db.models.functions.text.Left('content', 200000), config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='document_search_idx'),
+        ),
+    ]
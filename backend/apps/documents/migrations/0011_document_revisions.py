@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_document_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='previous_revision',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='documents.document'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='previous_revision',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.document'),
+        ),
+        migrations.CreateModel(
+            name='DocumentPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='documents.document')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('document', 'number'), name='document_page_number_unique')],
+            },
+        ),
+    ]
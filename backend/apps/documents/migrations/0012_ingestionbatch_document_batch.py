@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:05
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_document_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('total_files', models.PositiveIntegerField(default=0)),
+                ('skipped', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='documents', to='documents.ingestionbatch'),
+        ),
+    ]
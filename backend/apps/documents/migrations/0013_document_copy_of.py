@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_ingestionbatch_document_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='copy_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copies', to='documents.document'),
+        ),
+    ]
@@ -1,6 +1,59 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Left, Replace
+from django.utils import timezone
+from apps.telemetry.tracing import stage as trace_stage
+import uuid
+
+
+class InvalidStageTransition(Exception):
+    pass
+
+
+# Only the head of very long documents is indexed, keeping each tsvector
+# well under PostgreSQL's 1 MB limit
+SEARCH_CONTENT_CHARS = 200000
+
+
+def searchable_file_name():
+    # The english parser keeps 'invoice-export.pdf' as one file lexeme, so
+    # separators are turned into spaces to index the words of the name
+    expression = models.F('file_name')
+    for separator in ('-', '.', '_'):
+        expression = Replace(expression, models.Value(separator), models.Value(' '))
+    return expression
+
+
+class IngestionBatch(models.Model):
+    # Documents uploaded together through the bulk ingestion endpoint
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    total_files = models.PositiveIntegerField(default=0)
+    skipped = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
 
 class Document(models.Model):
+    PROCESSING_STAGE_CHOICES = [
+        ('UPLOADED', 'Uploaded'),
+        ('EXTRACTING', 'Extracting'),
+        ('GENERATING', 'Generating'),
+        ('PROCESSED', 'Processed'),
+        ('FAILED', 'Failed')
+    ]
+
+    # Allowed processing_stage transitions; FAILED is reachable from any stage
+    STAGE_TRANSITIONS = {
+        'UPLOADED': {'EXTRACTING'},
+        'EXTRACTING': {'GENERATING'},
+        'GENERATING': {'PROCESSED'},
+        'PROCESSED': {'EXTRACTING'},
+        'FAILED': {'EXTRACTING'},
+    }
+
+    # Stages whose start and end times are recorded
+    TIMED_STAGES = ('EXTRACTING', 'GENERATING')
+
     file = models.FileField(upload_to='documents/', null=True, blank=True)
     file_name = models.CharField(max_length=255, default='untitled')
     content = models.TextField(null=True, blank=True)
@@ -18,6 +71,113 @@ class Document(models.Model):
     )
     scope_summary = models.TextField(null=True, blank=True)
     clarifying_questions = models.TextField(null=True, blank=True)
+    processing_stage = models.CharField(max_length=30, choices=PROCESSING_STAGE_CHOICES, default='UPLOADED')
+    processing_error = models.TextField(null=True, blank=True)
+    extracting_started_at = models.DateTimeField(null=True, blank=True)
+    extracting_finished_at = models.DateTimeField(null=True, blank=True)
+    generating_started_at = models.DateTimeField(null=True, blank=True)
+    generating_finished_at = models.DateTimeField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    previous_revision = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='revisions'
+    )
+    batch = models.ForeignKey(
+        IngestionBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='documents'
+    )
+    # Identical document this one waits on instead of being processed itself
+    copy_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='copies'
+    )
+    # Maintained by PostgreSQL on every write, so it never drifts from the text
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector(searchable_file_name(), weight='A', config='english')
+            + SearchVector(Left('content', SEARCH_CONTENT_CHARS), weight='B', config='english')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['jira_status', 'uploaded_at'], name='document_status_uploaded_idx'),
+            models.Index(fields=['uploaded_at', 'id'], name='document_uploaded_id_idx'),
+            GinIndex(fields=['search_vector'], name='document_search_idx'),
+        ]
 
     def __str__(self):
         return f"{self.file_name} ({self.jira_status})"
+
+    def transition_to(self, stage, **fields):
+        """
+        Move to a new processing stage, writing only the stage, its
+        timestamps and the given fields in a single UPDATE. The update is
+        conditional on the stage still being the one loaded, so concurrent
+        workers cannot both advance the same document.
+        """
+        current = self.processing_stage
+        if stage != 'FAILED' and stage not in self.STAGE_TRANSITIONS.get(current, set()):
+            raise InvalidStageTransition(f"Cannot move document {self.pk} from {current} to {stage}")
+
+        now = timezone.now()
+        updates = dict(fields, processing_stage=stage)
+        if current in self.TIMED_STAGES:
+            updates[f'{current.lower()}_finished_at'] = now
+        if stage in self.TIMED_STAGES:
+            updates[f'{stage.lower()}_started_at'] = now
+            updates[f'{stage.lower()}_finished_at'] = None
+        if stage == 'EXTRACTING':
+            updates.update(generating_started_at=None, generating_finished_at=None)
+            updates.setdefault('processing_error', None)
+
+        with trace_stage('db.document_transition', document_id=self.pk, to_stage=stage):
+            updated = Document.objects.filter(pk=self.pk, processing_stage=current).update(**updates)
+        if not updated:
+            raise InvalidStageTransition(f"Document {self.pk} is no longer in stage {current}")
+
+        for name, value in updates.items():
+            setattr(self, name, value)
+
+    def stage_durations(self):
+        """
+        Seconds spent in each timed stage, None for stages not yet finished
+        """
+        durations = {}
+        for stage in self.TIMED_STAGES:
+            started = getattr(self, f'{stage.lower()}_started_at')
+            finished = getattr(self, f'{stage.lower()}_finished_at')
+            durations[stage.lower()] = (finished - started).total_seconds() if started and finished else None
+        return durations
+
+
+class DocumentPage(models.Model):
+    # Hash of each extracted page, so a later revision can tell which pages changed
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField()
+    content_hash = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'number'], name='document_page_number_unique'),
+        ]
+
+
+class UploadSession(models.Model):
+    STATUS_CHOICES = [
+        ('ACTIVE', 'Active'),
+        ('COMPLETED', 'Completed')
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField(null=True, blank=True)
+    chunk_size = models.PositiveIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    previous_revision = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.received_bytes} bytes, {self.status})"
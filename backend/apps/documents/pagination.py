@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class DocumentCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-uploaded_at', '-id')
+
+
+class SearchResultsPagination(PageNumberPagination):
+    # Results are ordered by rank, which has no stable cursor, so pages are numbered
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
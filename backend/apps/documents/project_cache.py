@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from .clients import get_jira_client, get_gitlab_client
+from apps.telemetry.tracing import stage
+import hashlib
+import json
+import time
+
+
+def fetch_jira_projects():
+    return [{
+        'value': project.key,
+        'label': project.name
+    } for project in get_jira_client().projects()]
+
+
+def fetch_gitlab_projects():
+    # iterator=True walks the pages lazily instead of building every page's objects up front
+    return [{
+        'value': str(project.id),
+        'label': project.path_with_namespace
+    } for project in get_gitlab_client().projects.list(membership=True, iterator=True, simple=True)]
+
+
+FETCHERS = {
+    'jira': fetch_jira_projects,
+    'gitlab': fetch_gitlab_projects,
+}
+
+
+def _cache_key(service):
+    return f'project-listing:{service}'
+
+
+def refresh_listing(service):
+    """
+    Fetch a project listing from its service and store it with its ETag
+    """
+    with stage(f'{service}.list_projects'):
+        data = FETCHERS[service]()
+    entry = {
+        'data': data,
+        'etag': hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:32],
+        'fetched_at': time.time(),
+    }
+    cache.set(_cache_key(service), entry, timeout=settings.PROJECT_LISTING_STALE_TTL)
+    cache.delete(f'{_cache_key(service)}:refreshing')
+    return entry
+
+
+def get_listing(service, force_refresh=False):
+    """
+    Return the cached project listing for a service.
+
+    Entries younger than PROJECT_LISTING_TTL are served as is. Older entries
+    are still served, but a background refresh is queued (at most one per
+    service at a time). A missing entry or force_refresh fetches synchronously.
+    """
+    entry = None if force_refresh else cache.get(_cache_key(service))
+    if entry is None:
+        return refresh_listing(service)
+
+    if time.time() - entry['fetched_at'] > settings.PROJECT_LISTING_TTL:
+        if cache.add(f'{_cache_key(service)}:refreshing', True, timeout=settings.PROJECT_LISTING_TTL):
+            from .tasks import refresh_project_listing
+            refresh_project_listing.delay(service)
+
+    return entry
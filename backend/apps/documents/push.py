@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from apps.telemetry.tracing import stage
+from .clients import invalidate_client
+import logging
+import random
+import requests
+import threading
+import time
+import urllib3
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# A 5xx to a create may come after the issue was made, so creates only retry
+# responses that guarantee nothing was written
+CREATE_RETRYABLE_STATUS_CODES = {429}
+
+
+class RateLimiter:
+    """
+    Process-wide limiter spacing calls to a service at most rate_per_second apart
+    """
+
+    def __init__(self, service, rate_per_second):
+        self.service = service
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+jira_limiter = RateLimiter('jira', settings.JIRA_REQUESTS_PER_SECOND)
+gitlab_limiter = RateLimiter('gitlab', settings.GITLAB_REQUESTS_PER_SECOND)
+
+
+def _status_code(error):
+    """
+    HTTP status of a JIRA, python-gitlab or requests error, if it carries one
+    """
+    for attr in ('status_code', 'response_code'):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _not_sent(error):
+    """
+    True for connection errors raised before the request reached the server
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', None)
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+def _retryable(error, idempotent):
+    if _not_sent(error):
+        return True
+    statuses = RETRYABLE_STATUS_CODES if idempotent else CREATE_RETRYABLE_STATUS_CODES
+    return _status_code(error) in statuses
+
+
+def call_with_retries(func, limiter, *args, idempotent=False, **kwargs):
+    """
+    Call func under the service's rate limit, retrying with exponential
+    backoff and jitter and honouring Retry-After when present. Every call
+    retries 429s and connections that were never made; only idempotent
+    calls also retry 5xx responses.
+    """
+    attempt = 0
+    while True:
+        limiter.wait()
+        try:
+            with stage(f'{limiter.service}.{func.__name__}', attempt=attempt + 1):
+                return func(*args, **kwargs)
+        except Exception as e:
+            attempt += 1
+            if _status_code(e) == 401:
+                invalidate_client(limiter.service)
+            if not _retryable(e, idempotent) or attempt >= settings.PUSH_MAX_RETRIES:
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = settings.PUSH_RETRY_BASE_DELAY * (2 ** (attempt - 1))
+                delay += random.uniform(0, delay)
+            logger.warning("Retrying push call", extra={
+                'service': limiter.service,
+                'status_code': _status_code(e),
+                'delay_seconds': round(delay, 2),
+                'attempt': attempt
+            })
+            time.sleep(delay)
+
+
+def _jira_fields(jira_project, ticket):
+    return {
+        'project': {'key': jira_project},
+        'summary': ticket.title,
+        'description': ticket.description,
+        'issuetype': {'name': 'Task'},
+    }
+
+
+def push_to_jira(jira, jira_project, tickets, results):
+    """
+    Create Jira issues through the bulk endpoint, in batches of JIRA_BULK_BATCH_SIZE
+    """
+    batch_size = settings.JIRA_BULK_BATCH_SIZE
+    for start in range(0, len(tickets), batch_size):
+        batch = tickets[start:start + batch_size]
+        try:
+            created = call_with_retries(
+                jira.create_issues,
+                jira_limiter,
+                field_list=[_jira_fields(jira_project, ticket) for ticket in batch],
+                prefetch=False
+            )
+        except Exception as e:
+            for ticket in batch:
+                results[ticket.id]['errors'].append(f"Jira: {str(e)}")
+            continue
+
+        for ticket, outcome in zip(batch, created):
+            if outcome.get('status') == 'Success' and outcome.get('issue') is not None:
+                results[ticket.id]['jira_key'] = outcome['issue'].key
+            else:
+                results[ticket.id]['errors'].append(f"Jira: {outcome.get('error')}")
+
+
+def _create_gitlab_issue(gitlab_project, ticket, jira_key):
+    description = ticket.description
+    if jira_key:
+        description = f"{description}\n\nJira Reference: {jira_key}"
+    return call_with_retries(
+        gitlab_project.issues.create,
+        gitlab_limiter,
+        {
+            'title': ticket.title,
+            'description': description,
+            'labels': [ticket.priority.lower()]
+        }
+    )
+
+
+def push_to_gitlab(gitlab_project, tickets, results):
+    """
+    Create GitLab issues concurrently on a pool of GITLAB_PUSH_CONCURRENCY threads
+    """
+    with ThreadPoolExecutor(max_workers=settings.GITLAB_PUSH_CONCURRENCY) as executor:
+        futures = {
+            ticket.id: executor.submit(
+                _create_gitlab_issue, gitlab_project, ticket, results[ticket.id]['jira_key']
+            )
+            for ticket in tickets
+        }
+        for ticket_id, future in futures.items():
+            try:
+                results[ticket_id]['gitlab_iid'] = future.result().iid
+            except Exception as e:
+                results[ticket_id]['errors'].append(f"GitLab: {str(e)}")
+
+
+def push_tickets(tickets, jira, jira_project, gitlab_project):
+    """
+    Push tickets to Jira (bulk) and then GitLab (concurrently), returning
+    one result per ticket with its Jira key, GitLab iid and any errors
+    """
+    tickets = list(tickets)
+    results = {
+        ticket.id: {'ticket_id': ticket.id, 'jira_key': None, 'gitlab_iid': None, 'errors': []}
+        for ticket in tickets
+    }
+    push_to_jira(jira, jira_project, tickets, results)
+    push_to_gitlab(gitlab_project, tickets, results)
+    return list(results.values())
@@ -0,0 +1,111 @@
+from collections import namedtuple
+from django.db import transaction
+from apps.tickets.dedup import store_buckets
+from apps.tickets.models import Ticket
+from apps.tickets.orchestration import arun_generation_stages, run_generation_stages
+from apps.telemetry.tracing import stage
+from .models import Document, DocumentPage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# previous: the processed predecessor (or None); carried: tickets copied from
+# it for unchanged sections; changed: sections that still need generating
+RevisionPlan = namedtuple('RevisionPlan', ['previous', 'carried', 'changed'])
+
+
+def save_page_hashes(document, pages):
+    """
+    Store the per-page hashes from extraction, replacing any from an earlier run
+    """
+    with transaction.atomic():
+        DocumentPage.objects.filter(document=document).delete()
+        DocumentPage.objects.bulk_create([
+            DocumentPage(document=document, number=page['page'], content_hash=page['hash'])
+            for page in pages
+        ])
+
+
+def plan_revision(document, sections):
+    """
+    Compare a document's sections with its previous revision. Tickets the
+    predecessor generated from a section with the same hash are copied over
+    unchanged; only the remaining sections are returned for generation.
+    """
+    previous = None
+    if document.previous_revision_id:
+        previous = Document.objects.filter(
+            pk=document.previous_revision_id, processing_stage='PROCESSED'
+        ).only('id', 'scope_summary', 'clarifying_questions').first()
+    if previous is None:
+        return RevisionPlan(None, [], sections)
+
+    with stage('revision.carry_over', document_id=document.pk, previous_id=previous.pk):
+        hashes = {section.hash for section in sections}
+        previous_tickets = list(
+            Ticket.objects.filter(document=previous, source_hash__in=hashes).defer('search_vector').order_by('created_at')
+        )
+        with transaction.atomic():
+            carried = Ticket.objects.bulk_create([
+                Ticket(
+                    document=document,
+                    title=ticket.title,
+                    description=ticket.description,
+                    priority=ticket.priority,
+                    status=ticket.status,
+                    estimated_hours=ticket.estimated_hours,
+                    source_hash=ticket.source_hash,
+                    minhash=ticket.minhash,
+                    duplicate_of_id=ticket.duplicate_of_id,
+                    duplicate_score=ticket.duplicate_score
+                )
+                for ticket in previous_tickets
+            ])
+            store_buckets(carried)
+
+    reused = {ticket.source_hash for ticket in previous_tickets}
+    changed = [section for section in sections if section.hash not in reused]
+    logger.info("Planned revision", extra={
+        'document_id': document.pk,
+        'previous_id': previous.pk,
+        'sections': len(sections),
+        'changed_sections': len(changed),
+        'carried_tickets': len(carried)
+    })
+    return RevisionPlan(previous, carried, changed)
+
+
+def _unchanged_results(plan):
+    return {
+        'tickets': plan.carried,
+        'scope_summary': plan.previous.scope_summary,
+        'clarifying_questions': plan.previous.clarifying_questions,
+        'errors': {},
+    }
+
+
+def generate_revision(document, plan):
+    """
+    Run generation for the changed sections only. A revision with no changed
+    section also reuses its predecessor's scope summary and questions.
+    """
+    if plan.previous and not plan.changed:
+        return _unchanged_results(plan)
+    # The combined call prompts with the whole content and would tag tickets
+    # for unchanged text with the changed section's hash
+    results = run_generation_stages(document, single_call=False if plan.previous else None, sections=plan.changed)
+    results['tickets'] = plan.carried + results['tickets']
+    return results
+
+
+async def agenerate_revision(document, plan):
+    """
+    Async counterpart of generate_revision
+    """
+    if plan.previous and not plan.changed:
+        return _unchanged_results(plan)
+    results = await arun_generation_stages(
+        document, single_call=False if plan.previous else None, sections=plan.changed
+    )
+    results['tickets'] = plan.carried + results['tickets']
+    return results
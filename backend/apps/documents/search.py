@@ -0,0 +1,89 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F
+from django.db.models.functions import Left
+from apps.telemetry.tracing import stage
+from .models import SEARCH_CONTENT_CHARS, Document
+import html
+
+SEARCH_CONFIG = 'english'
+
+# ts_headline returns the stored text unescaped, so matches are delimited
+# with private-use characters and turned into <mark> after escaping
+MARK_START, MARK_STOP = '\ue000', '\ue001'
+
+HEADLINE_OPTIONS = {
+    'start_sel': MARK_START,
+    'stop_sel': MARK_STOP,
+    'max_words': 35,
+    'min_words': 15,
+    'max_fragments': 2,
+    'fragment_delimiter': ' … ',
+}
+
+
+def build_query(text):
+    """
+    Parse user input with websearch syntax: quoted phrases, OR and -exclusions
+    """
+    return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+
+def ranked(queryset, query):
+    """
+    Filter a model with a ``search_vector`` column to rows matching the query,
+    best match first. The match uses the GIN index and the rank is computed
+    from the stored vector, so no text is re-parsed.
+    """
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', '-id')
+
+
+def search_documents(query):
+    return ranked(
+        Document.objects.only('id', 'file_name', 'uploaded_at', 'jira_status', 'processing_stage'),
+        query
+    )
+
+
+def attach_document_headlines(documents, query):
+    # Only the indexed head of the content can contain the match
+    return attach_headlines(documents, query, headline=Left('content', SEARCH_CONTENT_CHARS))
+
+
+def render_headline(value):
+    """
+    HTML-escape a headline and wrap its matches in <mark>
+    """
+    if value is None:
+        return None
+    return html.escape(value).replace(MARK_START, '<mark>').replace(MARK_STOP, '</mark>')
+
+
+def attach_headlines(objects, query, **fields):
+    """
+    Set highlighted, HTML-escaped snippets on one page of results, e.g.
+    ``attach_headlines(page, query, title_headline='title')``.
+
+    Headlines re-parse the source text, so they are built in a second query
+    for the page's rows only rather than for every match before the sort.
+    """
+    if not objects:
+        return objects
+    model = type(objects[0])
+    expressions = {
+        name: SearchHeadline(
+            source,
+            query,
+            config=SEARCH_CONFIG,
+            **HEADLINE_OPTIONS
+        )
+        for name, source in fields.items()
+    }
+    with stage('search.headlines', model=model.__name__, rows=len(objects)):
+        rows = model.objects.filter(pk__in=[obj.pk for obj in objects]).values('pk', **expressions)
+        headlines = {row.pop('pk'): row for row in rows}
+    for obj in objects:
+        for name, value in headlines.get(obj.pk, {}).items():
+            setattr(obj, name, render_headline(value))
+    return objects
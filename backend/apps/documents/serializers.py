@@ -7,8 +7,29 @@ class DocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ['id', 'file_name', 'content', 'uploaded_at', 'jira_status', 'tickets', 'scope_summary', 'clarifying_questions']
+        fields = ['id', 'file_name', 'content', 'uploaded_at', 'jira_status', 'tickets', 'scope_summary', 'clarifying_questions',
+                  'processing_stage', 'processing_error', 'extracting_started_at', 'extracting_finished_at',
+                  'generating_started_at', 'generating_finished_at', 'previous_revision']
+        read_only_fields = ['processing_stage', 'processing_error', 'extracting_started_at', 'extracting_finished_at',
+                            'generating_started_at', 'generating_finished_at', 'previous_revision']
 
     def create(self, validated_data):
         document = Document.objects.create(**validated_data)
         return document
+
+
+class DocumentListSerializer(serializers.ModelSerializer):
+    tickets_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Document
+        fields = ['id', 'file_name', 'uploaded_at', 'jira_status', 'processing_stage', 'tickets_count']
+
+
+class DocumentSearchSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True, default='')
+
+    class Meta:
+        model = Document
+        fields = ['id', 'file_name', 'uploaded_at', 'jira_status', 'processing_stage', 'rank', 'headline']
@@ -1,29 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
 from celery import shared_task
-from .models import Document
-from tickets.models import Ticket
-import time
+from django.conf import settings
+from .models import Document, InvalidStageTransition
+from .extraction import extract_text
+from .project_cache import FETCHERS, refresh_listing
+from .revisions import generate_revision, plan_revision, save_page_hashes
+from .uploads import expire_sessions, release_copies
+from apps.tickets.ai_service import run_in_worker
+from apps.tickets.chunking import build_sections
+from apps.telemetry.tracing import stage
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def stage_changed(document, error):
+    """
+    Log that another worker moved the document on (e.g. a redelivered task
+    racing the original), which is left to finish it
+    """
+    logger.warning("Document stage changed under this task, leaving it", extra={
+        'document_id': document.id,
+        'error': str(error)
+    })
+
+
+def mark_failed(document, error):
+    """
+    Record a processing failure. The update is conditional on the stage this
+    task last set, so a document another worker has moved on is not failed.
+    """
+    try:
+        document.transition_to('FAILED', jira_status='ERROR', processing_error=str(error))
+    except InvalidStageTransition as e:
+        stage_changed(document, e)
+
 
 @shared_task
 def process_document(document_id):
+    """
+    Extract text from an uploaded document and generate tickets, scope summary
+    and clarifying questions for it.
+
+    Each stage change is a single UPDATE through Document.transition_to, so
+    the large content column is written once, together with the move to
+    GENERATING. For a revision of a processed document, tickets of
+    unchanged sections are carried over and only changed sections are sent
+    to the model. Identical documents waiting on this one are settled
+    when it finishes.
+    """
     try:
-        document = Document.objects.get(id=document_id)
-        document.jira_status = 'PROCESSING'
-        document.save()
-
-        # TODO: Implement actual document processing and ticket generation
-        # This is a placeholder that creates a sample ticket
-        Ticket.objects.create(
-            document=document,
-            title='Sample Ticket',
-            description='This is a sample ticket generated from the document.',
-            priority='MEDIUM',
-            estimate='2 hours'
-        )
-
-        document.jira_status = 'COMPLETED'
-        document.save()
-
-    except Exception as e:
-        document.jira_status = 'FAILED'
-        document.error_message = str(e)
-        document.save() 
\ No newline at end of file
+        document = Document.objects.defer('content', 'search_vector').get(id=document_id)
+    except Document.DoesNotExist:
+        logger.warning("Document no longer exists, skipping processing", extra={'document_id': document_id})
+        return
+
+    with stage('pipeline.process_document', document_id=document_id):
+        try:
+            document.transition_to('EXTRACTING')
+            file_path = document.file.path
+
+            content, timings = extract_text(file_path, document.file_name)
+            logger.info("Extracted document", extra={
+                'document_id': document.id,
+                'format': timings['format'],
+                'page_count': timings['page_count'],
+                'extract_seconds': round(timings['total_seconds'], 3),
+                'content_chars': len(content)
+            })
+
+            if not content.strip():
+                document.transition_to(
+                    'FAILED',
+                    jira_status='ERROR',
+                    processing_error='Document uploaded but no text content extracted'
+                )
+                return
+
+            document.transition_to('GENERATING', content=content)
+            save_page_hashes(document, timings['pages'])
+            # Only sections that changed since the previous revision are regenerated
+            sections = build_sections(content, timings['pages'], settings.AI_CHUNK_TOKENS)
+            results = generate_revision(document, plan_revision(document, sections))
+            tickets = results['tickets']
+
+            if results['errors']:
+                logger.warning("Document generated with stage errors", extra={
+                    'document_id': document.id,
+                    'stage_errors': results['errors']
+                })
+
+            document.transition_to(
+                'PROCESSED',
+                jira_status='PROCESSED',
+                scope_summary=results['scope_summary'],
+                clarifying_questions=results['clarifying_questions'],
+                processing_error="; ".join(
+                    f"{name}: {error}" for name, error in results['errors'].items()
+                ) or None
+            )
+            logger.info("Processed document", extra={'document_id': document.id, 'tickets_count': len(tickets)})
+
+        except InvalidStageTransition as e:
+            stage_changed(document, e)
+        except Exception as e:
+            logger.exception("Document processing error", extra={'document_id': document.id})
+            mark_failed(document, e)
+        finally:
+            # Identical uploads waiting on this document share its outcome
+            release_copies(document)
+
+
+@shared_task
+def process_batch(document_ids):
+    """
+    Process a bulk ingestion batch, at most BULK_PROCESSING_CONCURRENCY
+    documents at a time, inside one worker task
+    """
+    if not document_ids:
+        return
+    with ThreadPoolExecutor(max_workers=min(settings.BULK_PROCESSING_CONCURRENCY, len(document_ids))) as executor:
+        # process_document handles and records its own failures
+        list(executor.map(lambda document_id: run_in_worker(process_document, document_id), document_ids))
+
+
+@shared_task
+def refresh_project_listing(service):
+    """
+    Refresh one cached Jira or GitLab project listing
+    """
+    refresh_listing(service)
+
+
+@shared_task
+def refresh_project_listings():
+    """
+    Periodic refresh of every cached project listing, so dropdowns rarely wait on a fetch
+    """
+    for service in FETCHERS:
+        try:
+            refresh_listing(service)
+        except Exception:
+            logger.exception("Failed to refresh project listing", extra={'service': service})
+
+
+@shared_task
+def expire_upload_sessions():
+    """
+    Periodic cleanup of abandoned upload sessions and their part files
+    """
+    expire_sessions()
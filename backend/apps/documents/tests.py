@@ -0,0 +1,767 @@
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.testing import QueryBudgetMixin
+from apps.tickets.models import Ticket
+from .extraction import extract_text, get_extractor, is_supported
+from .file_delivery import _parse_range, serve_file
+from .models import Document, InvalidStageTransition, UploadSession
+from .project_cache import refresh_listing
+from .uploads import release_copies
+from . import clients, push
+from openpyxl import Workbook
+import hashlib
+import io
+import json
+import os
+import requests
+import tempfile
+import threading
+import zipfile
+
+
+class DocumentQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        documents = Document.objects.bulk_create([
+            Document(
+                file_name=f'spec-{i}.pdf',
+                content='x' * 1000,
+                jira_status='PROCESSED' if i % 2 else 'UNPROCESSED',
+                processing_stage='PROCESSED'
+            )
+            for i in range(25)
+        ])
+        Ticket.objects.bulk_create([
+            Ticket(document=document, title=f'Ticket {j}', description='Do the thing')
+            for document in documents
+            for j in range(3)
+        ])
+        cls.document = documents[0]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_runs_constant_queries(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get('/api/documents/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['tickets_count'], 3)
+        self.assertNotIn('content', response.data['results'][0])
+
+    def test_retrieve_prefetches_tickets(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(f'/api/documents/{self.document.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['tickets']), 3)
+
+    def test_status_budget(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(f'/api/documents/{self.document.id}/status/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_content_budget(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(f'/api/documents/{self.document.id}/content/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_status_filter_uses_index(self):
+        queryset = Document.objects.filter(jira_status='PROCESSED').order_by('-uploaded_at')
+        self.assertUsesIndex(queryset, 'document_status_uploaded_idx')
+
+    def test_list_ordering_uses_index(self):
+        queryset = Document.objects.order_by('-uploaded_at', '-id')[:20]
+        self.assertUsesIndex(queryset, 'document_uploaded_id_idx')
+
+
+class DocumentStateMachineTests(TestCase):
+
+    def setUp(self):
+        self.document = Document.objects.create(file_name='spec.pdf', content='Build a login page')
+
+    def test_transition_is_one_update_of_the_changed_columns(self):
+        with self.assertNumQueries(1) as queries:
+            self.document.transition_to('EXTRACTING')
+        sql = queries.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertNotIn('"content"', sql)
+
+        self.document.transition_to('GENERATING', content='Build a login page and a logout button')
+        self.document.transition_to('PROCESSED', jira_status='PROCESSED')
+
+        stored = Document.objects.get(pk=self.document.pk)
+        self.assertEqual(stored.processing_stage, 'PROCESSED')
+        self.assertEqual(stored.content, 'Build a login page and a logout button')
+        durations = stored.stage_durations()
+        self.assertGreaterEqual(durations['extracting'], 0)
+        self.assertGreaterEqual(durations['generating'], 0)
+
+    def test_invalid_transition_is_rejected_without_a_query(self):
+        with self.assertNumQueries(0), self.assertRaises(InvalidStageTransition):
+            self.document.transition_to('PROCESSED')
+        self.assertEqual(Document.objects.get(pk=self.document.pk).processing_stage, 'UPLOADED')
+
+    def test_transition_from_a_stale_stage_is_rejected(self):
+        stale = Document.objects.get(pk=self.document.pk)
+        self.document.transition_to('EXTRACTING')
+
+        with self.assertRaises(InvalidStageTransition):
+            stale.transition_to('EXTRACTING')
+        self.assertEqual(stale.processing_stage, 'UPLOADED')
+
+        # FAILED is allowed from any stage, but still only from the one loaded
+        with self.assertRaises(InvalidStageTransition):
+            stale.transition_to('FAILED')
+        self.assertEqual(Document.objects.get(pk=self.document.pk).processing_stage, 'EXTRACTING')
+
+
+class DocumentSearchTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # 'export' only appears in the best match's name, so it outranks the
+        # document that mentions it in the body through the weight-A name
+        cls.best = Document.objects.create(file_name='invoice-export.pdf', content='Send invoices to accounting every night.')
+        cls.other = Document.objects.create(file_name='spec.pdf', content='The admin can export user lists.')
+        Document.objects.create(file_name='notes.pdf', content='Nothing relevant here.')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_search_ranks_and_highlights(self):
+        # count, ranked page, headlines for the page
+        with self.assertMaxQueries(3):
+            response = self.client.get('/api/documents/search/', {'q': 'export invoice'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['id'], self.best.id)
+        self.assertIn('<mark>', response.data['results'][0]['headline'])
+
+        response = self.client.get('/api/documents/search/', {'q': 'export'})
+        self.assertEqual([result['id'] for result in response.data['results']], [self.best.id, self.other.id])
+
+    def test_headline_escapes_stored_text(self):
+        Document.objects.create(file_name='notes.txt', content='<script>alert(1)</script> export & import')
+
+        response = self.client.get('/api/documents/search/', {'q': 'import'})
+
+        headline = response.data['results'][0]['headline']
+        self.assertNotIn('<script>', headline)
+        self.assertIn('&lt;script&gt;', headline)
+        self.assertIn('<mark>import</mark>', headline)
+
+    def test_search_requires_query(self):
+        response = self.client.get('/api/documents/search/', {'q': ' '})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_uses_gin_index(self):
+        from .search import build_query, search_documents
+        self.assertUsesIndex(search_documents(build_query('export')), 'document_search_idx')
+
+
+class RevisionTests(TestCase):
+
+    def test_unchanged_sections_carry_tickets_over(self):
+        from apps.tickets.chunking import Section
+        from .revisions import plan_revision
+
+        previous = Document.objects.create(file_name='spec-v1.pdf', processing_stage='PROCESSED')
+        Ticket.objects.create(document=previous, title='Login page', description='Build it', source_hash='a' * 64)
+        Ticket.objects.create(document=previous, title='Old billing', description='Remove it', source_hash='b' * 64)
+        revision = Document.objects.create(file_name='spec-v2.pdf', previous_revision=previous)
+
+        unchanged = Section('a' * 64, 'Login text', [1])
+        edited = Section('c' * 64, 'New billing text', [2])
+        plan = plan_revision(revision, [unchanged, edited])
+
+        self.assertEqual(plan.previous.id, previous.id)
+        self.assertEqual([ticket.title for ticket in plan.carried], ['Login page'])
+        self.assertEqual(plan.carried[0].document_id, revision.id)
+        self.assertEqual(plan.changed, [edited])
+
+    @mock.patch('apps.documents.revisions.run_generation_stages')
+    def test_revision_never_uses_the_single_call_path(self, run_generation_stages):
+        from apps.tickets.chunking import Section
+        from .revisions import RevisionPlan, generate_revision
+
+        run_generation_stages.return_value = {'tickets': [], 'scope_summary': '', 'clarifying_questions': '', 'errors': {}}
+        previous = Document.objects.create(file_name='spec-v1.pdf', processing_stage='PROCESSED')
+        revision = Document.objects.create(file_name='spec-v2.pdf', previous_revision=previous)
+        edited = Section('c' * 64, 'New billing text', [2])
+
+        generate_revision(revision, RevisionPlan(previous, [], [edited]))
+
+        self.assertIs(run_generation_stages.call_args.kwargs['single_call'], False)
+
+    def test_reused_upload_keeps_section_and_page_hashes(self):
+        from .models import DocumentPage
+        from .uploads import reuse_processed_document
+
+        source = Document.objects.create(file_name='spec.pdf', processing_stage='PROCESSED', content='Login')
+        Ticket.objects.create(document=source, title='Login page', description='Build it', source_hash='a' * 64)
+        DocumentPage.objects.create(document=source, number=1, content_hash='p' * 64)
+        upload = Document.objects.create(file_name='spec-copy.pdf')
+
+        reuse_processed_document(upload, source)
+
+        copy = upload.tickets.get()
+        self.assertEqual(copy.source_hash, 'a' * 64)
+        self.assertIsNone(copy.duplicate_of_id)
+        self.assertEqual(list(upload.pages.values_list('content_hash', flat=True)), ['p' * 64])
+
+    def test_without_previous_revision_everything_is_generated(self):
+        from apps.tickets.chunking import Section
+        from .revisions import plan_revision
+
+        document = Document.objects.create(file_name='spec.pdf')
+        sections = [Section('a' * 64, 'Text', [1])]
+        self.assertEqual(plan_revision(document, sections), (None, [], sections))
+
+
+class ProcessDocumentTests(TestCase):
+
+    def setUp(self):
+        self.document = Document.objects.create(file_name='spec.pdf', file='documents/spec.pdf')
+
+    @mock.patch('apps.documents.tasks.extract_text', side_effect=ValueError('corrupt file'))
+    def test_error_marks_the_document_failed(self, extract_text):
+        from .tasks import process_document
+
+        process_document(self.document.id)
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.processing_stage, 'FAILED')
+        self.assertEqual(self.document.processing_error, 'corrupt file')
+
+    def test_waiting_copies_reuse_the_processed_result(self):
+        from .tasks import process_document
+
+        copy = Document.objects.create(file_name='copy.pdf', copy_of=self.document)
+        results = {'tickets': [], 'scope_summary': 'Export invoices', 'clarifying_questions': None, 'errors': {}}
+        with mock.patch('apps.documents.tasks.extract_text', return_value=('Export invoices', {
+            'format': 'pdf', 'page_count': 1, 'total_seconds': 0.0, 'pages': []
+        })), mock.patch('apps.documents.tasks.build_sections', return_value=[]), \
+                mock.patch('apps.documents.tasks.generate_revision', return_value=results):
+            process_document(self.document.id)
+
+        copy.refresh_from_db()
+        self.assertEqual(copy.processing_stage, 'PROCESSED')
+        self.assertEqual(copy.scope_summary, 'Export invoices')
+
+    def test_error_leaves_a_document_another_worker_moved_on(self):
+        from .tasks import process_document
+
+        def extract(*args):
+            # A redelivered copy of the task moves the document on meanwhile
+            Document.objects.filter(pk=self.document.pk).update(processing_stage='GENERATING')
+            raise ValueError('corrupt file')
+
+        with mock.patch('apps.documents.tasks.extract_text', side_effect=extract):
+            process_document(self.document.id)
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.processing_stage, 'GENERATING')
+        self.assertIsNone(self.document.processing_error)
+
+
+class UploadSessionTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=media_root.name, UPLOAD_CHUNK_SIZE=4)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def upload(self, data):
+        from .uploads import append_chunk, start_session
+
+        session = start_session('spec.txt', total_size=len(data))
+        for offset in range(0, len(data), 4):
+            append_chunk(session.pk, offset, data[offset:offset + 4])
+        return session
+
+    def test_content_hash_does_not_depend_on_chunk_size(self):
+        from .uploads import finalize_session, hash_chunks
+
+        data = b'Export invoices to CSV'
+        document, source = finalize_session(self.upload(data).pk)
+
+        self.assertIsNone(source)
+        self.assertEqual(document.content_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(hash_chunks([data[:5], data[5:]]), document.content_hash)
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_failed_insert_leaves_the_part_file(self):
+        from .uploads import finalize_session, part_path
+
+        session = self.upload(b'Export invoices')
+        with mock.patch('apps.documents.uploads.Document.objects.create', side_effect=DatabaseError('insert failed')):
+            with self.assertRaises(DatabaseError):
+                finalize_session(session.pk)
+
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'ACTIVE')
+        self.assertTrue(os.path.exists(part_path(session)))
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'uploads')), [f'{session.pk}.part'])
+
+    @override_settings(UPLOAD_SESSION_TTL=3600)
+    def test_abandoned_sessions_expire_with_their_part_files(self):
+        from .uploads import expire_sessions, part_path
+
+        abandoned, active = self.upload(b'Export'), self.upload(b'Import')
+        UploadSession.objects.filter(pk=abandoned.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(expire_sessions(), 1)
+        self.assertFalse(UploadSession.objects.filter(pk=abandoned.pk).exists())
+        self.assertFalse(os.path.exists(part_path(abandoned)))
+        self.assertTrue(os.path.exists(part_path(active)))
+
+
+class BulkIngestionTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    @mock.patch('apps.documents.views.schedule_batch')
+    def test_archive_and_files_become_one_batch(self, schedule_batch):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('specs/a.pdf', b'%PDF-1.4 a')
+            zf.writestr('specs/b.pdf', b'%PDF-1.4 b')
+            zf.writestr('logo.png', b'\x89PNG not a document')
+
+        response = self.client.post('/api/documents/batches/', {
+            'archive': SimpleUploadedFile('specs.zip', archive.getvalue(), content_type='application/zip'),
+            'files': [SimpleUploadedFile('c.pdf', b'%PDF-1.4 c', content_type='application/pdf')],
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['stages'], {'UPLOADED': 3})
+        self.assertEqual([item['file_name'] for item in response.data['skipped']], ['logo.png'])
+        schedule_batch.assert_called_once()
+        self.assertEqual(len(schedule_batch.call_args.args[0]), 3)
+
+        progress = self.client.get(f"/api/documents/batches/{response.data['batch_id']}/")
+        self.assertEqual(progress.status_code, 200)
+        self.assertEqual(progress.data['finished'], 0)
+        self.assertEqual(len(progress.data['documents']), 3)
+
+    @mock.patch('apps.documents.views.schedule_batch')
+    def test_identical_files_are_processed_once(self, schedule_batch):
+        in_progress = Document.objects.create(
+            file_name='c.pdf', content_hash=hashlib.sha256(b'%PDF-1.4 c').hexdigest()
+        )
+        in_progress.transition_to('EXTRACTING')
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('a.pdf', b'%PDF-1.4 a')
+            zf.writestr('copy/a.pdf', b'%PDF-1.4 a')
+
+        response = self.client.post('/api/documents/batches/', {
+            'archive': SimpleUploadedFile('specs.zip', archive.getvalue(), content_type='application/zip'),
+            'files': [SimpleUploadedFile('c.pdf', b'%PDF-1.4 c', content_type='application/pdf')],
+        }, format='multipart')
+
+        self.assertEqual(response.data['total'], 3)
+        [leader] = schedule_batch.call_args.args[0]
+        copies = Document.objects.filter(batch_id=response.data['batch_id']).exclude(pk=leader)
+        self.assertEqual(
+            sorted(copies.values_list('copy_of_id', flat=True)), sorted([leader, in_progress.pk])
+        )
+
+        in_progress.transition_to('FAILED', processing_error='corrupt file')
+        release_copies(in_progress)
+        copy = Document.objects.get(copy_of=in_progress)
+        self.assertEqual(copy.processing_stage, 'FAILED')
+        self.assertIn('corrupt file', copy.processing_error)
+
+
+class ExtractionTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_format_is_sniffed_from_content(self):
+        path = os.path.join(self.directory, 'export.bin')
+        workbook = Workbook()
+        workbook.active.append(['Export invoices', 'nightly'])
+        workbook.save(path)
+
+        self.assertEqual(get_extractor(path, 'export.bin').name, 'xlsx')
+        self.assertTrue(is_supported('Spec.DOCX'))
+        self.assertFalse(is_supported('logo.png'))
+
+    @override_settings(EXTRACTION_WORKER_MEMORY_MB=1024)
+    def test_pooled_extraction_runs_under_the_memory_limit(self):
+        path = os.path.join(self.directory, 'invoices.xlsx')
+        workbook = Workbook()
+        workbook.active.title = 'Invoices'
+        for row in range(200):
+            workbook.active.append([f'INV-{row}', 'Export to CSV', row * 10])
+        workbook.save(path)
+
+        content, timings = extract_text(path, 'invoices.xlsx')
+
+        self.assertEqual(timings['format'], 'xlsx')
+        self.assertTrue(content.startswith('Invoices\nINV-0\tExport to CSV\t0'))
+        self.assertIn('INV-199', content)
+
+    @override_settings(EXTRACTION_MAX_CHARS=30)
+    def test_text_is_extracted_in_units_up_to_the_cap(self):
+        path = os.path.join(self.directory, 'notes.txt')
+        with open(path, 'w') as f:
+            f.write('Export invoices to CSV.\nSend a reset link by email.\n')
+
+        content, timings = extract_text(path, 'notes.txt')
+
+        self.assertEqual(timings['format'], 'text')
+        self.assertTrue(timings['truncated'])
+        self.assertEqual(content, 'Export invoices to CSV.\nSend a\n')
+        self.assertEqual(timings['pages'][0]['page'], 1)
+
+
+class StubHTTPServer:
+    """
+    Local HTTP stand-in for Jira and GitLab. respond(method, path, body)
+    returns (status, headers, payload) for each request, and every request
+    is recorded as (method, path, body).
+    """
+
+    def __init__(self, respond):
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null')
+                stub.requests.append((self.command, self.path, body))
+                status, headers, payload = respond(self.command, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in {'Content-Type': 'application/json', **headers}.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_ticket(ticket_id, title):
+    return SimpleNamespace(id=ticket_id, title=title, description='Details', priority='HIGH')
+
+
+@override_settings(GITLAB_URL='https://gitlab.example.com', GITLAB_TOKEN='from-settings')
+class ClientRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        clients.invalidate_client('gitlab')
+        self.addCleanup(clients.invalidate_client, 'gitlab')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.token_file = os.path.join(directory.name, 'gitlab-token')
+
+    def write_token(self, token):
+        with open(self.token_file, 'w') as f:
+            f.write(f'{token}\n')
+
+    def test_client_is_shared_until_the_token_file_changes(self):
+        self.write_token('first')
+        with mock.patch.dict(os.environ, {'GITLAB_TOKEN_FILE': self.token_file}):
+            client = clients.get_gitlab_client()
+            self.assertIs(clients.get_gitlab_client(), client)
+            self.assertEqual(client.private_token, 'first')
+
+            self.write_token('rotated')
+            rotated = clients.get_gitlab_client()
+
+        self.assertIsNot(rotated, client)
+        self.assertEqual(rotated.private_token, 'rotated')
+
+    def test_setting_is_used_without_a_token_file(self):
+        self.assertEqual(clients.get_gitlab_client().private_token, 'from-settings')
+
+
+@override_settings(PUSH_MAX_RETRIES=3, PUSH_RETRY_BASE_DELAY=1.0, JIRA_BULK_BATCH_SIZE=50, GITLAB_PUSH_CONCURRENCY=4)
+@mock.patch('apps.documents.push.random.uniform', return_value=0)
+@mock.patch('apps.documents.push.time.sleep')
+class PushTests(SimpleTestCase):
+
+    def setUp(self):
+        for name in ('jira_limiter', 'gitlab_limiter'):
+            patcher = mock.patch.object(push, name, push.RateLimiter(name[:-len('_limiter')], 0))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def serve(self, respond):
+        server = StubHTTPServer(respond)
+        self.enterContext(server)
+        self.enterContext(override_settings(
+            JIRA_URL=server.url, JIRA_EMAIL='bot@example.com', JIRA_API_TOKEN='token',
+            GITLAB_URL=server.url, GITLAB_TOKEN='token'
+        ))
+        return server
+
+    def results_for(self, tickets):
+        return {
+            ticket.id: {'ticket_id': ticket.id, 'jira_key': None, 'gitlab_iid': None, 'errors': []}
+            for ticket in tickets
+        }
+
+    def test_jira_bulk_create_honours_retry_after(self, sleep, uniform):
+        responses = iter([
+            (429, {'Retry-After': '7'}, {'errorMessages': ['Rate limit exceeded']}),
+            (201, {}, {'issues': [
+                {'id': '1', 'key': 'OPS-1', 'self': 'http://jira/1'},
+                {'id': '2', 'key': 'OPS-2', 'self': 'http://jira/2'},
+            ], 'errors': []}),
+        ])
+        server = self.serve(lambda method, path, body: next(responses))
+        tickets = [make_ticket(1, 'Login'), make_ticket(2, 'Logout')]
+        results = self.results_for(tickets)
+
+        push.push_to_jira(clients.get_jira_client(), 'OPS', tickets, results)
+
+        self.assertEqual([path for _, path, _ in server.requests], ['/rest/api/2/issue/bulk'] * 2)
+        sleep.assert_called_once_with(7.0)
+        self.assertEqual([results[1]['jira_key'], results[2]['jira_key']], ['OPS-1', 'OPS-2'])
+
+    def test_jira_bulk_create_reports_partial_failure(self, sleep, uniform):
+        server = self.serve(lambda method, path, body: (207, {}, {
+            'issues': [{'id': '1', 'key': 'OPS-1', 'self': 'http://jira/1'}],
+            'errors': [{
+                'status': 400,
+                'failedElementNumber': 1,
+                'elementErrors': {'errorMessages': [], 'errors': {'summary': 'Summary is required'}},
+            }],
+        }))
+        tickets = [make_ticket(1, 'Login'), make_ticket(2, '')]
+        results = self.results_for(tickets)
+
+        push.push_to_jira(clients.get_jira_client(), 'OPS', tickets, results)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(results[1]['jira_key'], 'OPS-1')
+        self.assertEqual(results[1]['errors'], [])
+        self.assertIsNone(results[2]['jira_key'])
+        self.assertIn('Summary is required', results[2]['errors'][0])
+
+    def test_gitlab_fan_out_creates_every_issue(self, sleep, uniform):
+        server = self.serve(lambda method, path, body: (201, {}, {
+            'id': int(body['title'].split()[-1]), 'iid': int(body['title'].split()[-1]), 'title': body['title'],
+        }))
+        tickets = [make_ticket(i, f'Ticket {i}') for i in range(1, 9)]
+        results = self.results_for(tickets)
+        results[3]['jira_key'] = 'OPS-3'
+        project = clients.get_gitlab_client().projects.get(42, lazy=True)
+
+        push.push_to_gitlab(project, tickets, results)
+
+        self.assertEqual(len(server.requests), 8)
+        self.assertEqual({path for _, path, _ in server.requests}, {'/api/v4/projects/42/issues'})
+        self.assertEqual([results[i]['gitlab_iid'] for i in range(1, 9)], list(range(1, 9)))
+        descriptions = {body['title']: body['description'] for _, _, body in server.requests}
+        self.assertEqual(descriptions['Ticket 3'], 'Details\n\nJira Reference: OPS-3')
+        self.assertEqual(descriptions['Ticket 4'], 'Details')
+
+    def test_gitlab_create_is_not_retried_on_server_error(self, sleep, uniform):
+        server = self.serve(lambda method, path, body: (502, {}, {'message': 'Bad Gateway'}))
+        tickets = [make_ticket(1, 'Ticket 1')]
+        results = self.results_for(tickets)
+        project = clients.get_gitlab_client().projects.get(42, lazy=True)
+
+        push.push_to_gitlab(project, tickets, results)
+
+        self.assertEqual(len(server.requests), 1)
+        sleep.assert_not_called()
+        self.assertIsNone(results[1]['gitlab_iid'])
+        self.assertTrue(results[1]['errors'][0].startswith('GitLab: '))
+
+    def test_idempotent_call_backs_off_on_server_errors(self, sleep, uniform):
+        responses = iter([(503, {}, {}), (503, {}, {}), (200, {}, {'ok': True})])
+        server = self.serve(lambda method, path, body: next(responses))
+
+        def fetch():
+            response = requests.get(f'{server.url}/status')
+            response.raise_for_status()
+            return response.json()
+
+        self.assertEqual(push.call_with_retries(fetch, push.gitlab_limiter, idempotent=True), {'ok': True})
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1.0, 2.0])
+
+    def test_refused_connection_is_retried(self, sleep, uniform):
+        server = StubHTTPServer(None)
+        url = server.url
+        server.server.server_close()
+
+        def create():
+            return requests.post(f'{url}/issues', timeout=1)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            push.call_with_retries(create, push.gitlab_limiter)
+        self.assertEqual(sleep.call_count, 2)
+
+
+class FileDeliveryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'spec.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'0123456789')
+        self.factory = RequestFactory()
+
+    def serve(self, **headers):
+        request = self.factory.get('/file/', headers=headers)
+        return serve_file(request, self.path, 'documents/spec.txt', 'text/plain')
+
+    def test_parse_range(self):
+        self.assertEqual(_parse_range('bytes=0-4', 10), (0, 4))
+        self.assertEqual(_parse_range('bytes=5-', 10), (5, 9))
+        self.assertEqual(_parse_range('bytes=2-100', 10), (2, 9))
+        self.assertEqual(_parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(_parse_range('bytes=-30', 10), (0, 9))
+        self.assertEqual(_parse_range('bytes=-5', 0), 'unsatisfiable')
+        self.assertEqual(_parse_range('bytes=-0', 10), 'unsatisfiable')
+        self.assertEqual(_parse_range('bytes=10-', 10), 'unsatisfiable')
+        self.assertEqual(_parse_range('bytes=6-3', 10), 'unsatisfiable')
+        self.assertIsNone(_parse_range('bytes=0-1,3-4', 10))
+        self.assertIsNone(_parse_range('items=0-4', 10))
+
+    def test_range_is_served_as_partial_content(self):
+        response = self.serve(Range='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(Range='bytes=20-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_suffix_range_on_empty_file_is_unsatisfiable(self):
+        open(self.path, 'wb').close()
+
+        response = self.serve(Range='bytes=-5')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.serve()['ETag']
+
+        response = self.serve(If_None_Match=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response = self.serve(Range='bytes=2-5', If_Range='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+        response = self.serve(Range='bytes=2-5', If_Range=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+
+    @override_settings(FILE_DELIVERY_MODE='x-accel', FILE_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect_is_percent_encoded(self):
+        request = self.factory.get('/file/')
+        response = serve_file(request, self.path, 'documents/Q3 plan?#é.pdf', 'application/pdf')
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/documents/Q3%20plan%3F%23%C3%A9.pdf')
+        self.assertIn("filename*=utf-8''Q3%20plan%3F%23%C3%A9.pdf", response['Content-Disposition'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PROJECT_LISTING_TTL=300,
+    PROJECT_LISTING_STALE_TTL=3600
+)
+class ProjectListingTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.projects = [{'key': 'OPS', 'name': 'Operations'}]
+        self.fetch = mock.Mock(side_effect=lambda: [
+            {'value': project['key'], 'label': project['name']} for project in self.projects
+        ])
+        patcher = mock.patch.dict('apps.documents.project_cache.FETCHERS', {'jira': self.fetch})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_etag_revalidation(self):
+        response = self.client.get('/api/documents/jira-projects/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'value': 'OPS', 'label': 'Operations'}])
+
+        etag = response['ETag']
+        response = self.client.get('/api/documents/jira-projects/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_refresh_parameter_fetches_again(self):
+        etag = self.client.get('/api/documents/jira-projects/')['ETag']
+        self.projects.append({'key': 'WEB', 'name': 'Website'})
+
+        response = self.client.get('/api/documents/jira-projects/', {'refresh': 'true'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    @mock.patch('apps.documents.tasks.refresh_project_listing.delay')
+    def test_stale_listing_is_served_while_one_refresh_is_queued(self, delay):
+        entry = refresh_listing('jira')
+        cache.set('project-listing:jira', dict(entry, fetched_at=entry['fetched_at'] - 301))
+
+        for _ in range(2):
+            response = self.client.get('/api/documents/jira-projects/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], f'"{entry["etag"]}"')
+
+        delay.assert_called_once_with('jira')
+        self.assertEqual(self.fetch.call_count, 1)
@@ -0,0 +1,243 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from .models import Document, DocumentPage, UploadSession
+from apps.tickets.models import Ticket
+from apps.tickets.dedup import store_buckets
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def hash_chunks(chunks):
+    """
+    SHA-256 of the concatenated chunks, so the content hash does not depend
+    on how the file was split
+    """
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hash_chunks(iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b''))
+
+
+def part_path(session):
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{session.id}.part')
+
+
+def resolve_previous_revision(document_id):
+    """
+    Validate the id of the document a new upload revises
+    """
+    if document_id in (None, ''):
+        return None
+    try:
+        document_id = int(document_id)
+    except (TypeError, ValueError):
+        raise UploadError('previous_revision must be a document id')
+    if not Document.objects.filter(pk=document_id).exists():
+        raise UploadError('previous_revision does not exist', 404)
+    return document_id
+
+
+def start_session(file_name, total_size=None, previous_revision_id=None):
+    if total_size is not None and total_size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(f'File exceeds the {settings.UPLOAD_MAX_SIZE} byte limit', 413)
+    session = UploadSession.objects.create(
+        file_name=os.path.basename(file_name) or 'untitled',
+        total_size=total_size,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        previous_revision_id=previous_revision_id
+    )
+    os.makedirs(os.path.dirname(part_path(session)), exist_ok=True)
+    return session
+
+
+def append_chunk(session_id, offset, data):
+    """
+    Write one chunk at the given offset.
+
+    The offset must equal the bytes received so far; a client that lost
+    its connection reads received_bytes from the session and resumes there.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != 'ACTIVE':
+            raise UploadError('Upload is already finalized', 409)
+        if offset != session.received_bytes:
+            raise UploadError(f'Expected offset {session.received_bytes}', 409)
+        if not data:
+            raise UploadError('Empty chunk')
+        if session.received_bytes % session.chunk_size:
+            raise UploadError('The final chunk has already been received', 409)
+
+        end = offset + len(data)
+        is_last = session.total_size is not None and end == session.total_size
+        if len(data) > session.chunk_size or (len(data) < session.chunk_size and session.total_size is not None and not is_last):
+            raise UploadError(f'Chunks must be {session.chunk_size} bytes except the last one')
+        if end > (session.total_size if session.total_size is not None else settings.UPLOAD_MAX_SIZE):
+            raise UploadError('Chunk exceeds the declared file size', 413)
+
+        # Write at the offset and truncate, so a retried chunk overwrites a half-written one
+        path = part_path(session)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+        session.received_bytes = end
+        session.save(update_fields=['received_bytes', 'updated_at'])
+    return session
+
+
+def find_processed_duplicate(content_hash, exclude_pk=None):
+    return Document.objects.filter(
+        content_hash=content_hash, processing_stage='PROCESSED'
+    ).exclude(pk=exclude_pk).order_by('-uploaded_at').first()
+
+
+def reuse_processed_document(document, source):
+    """
+    Give a freshly uploaded document the extraction and tickets of an
+    identical, already processed one instead of running the pipeline again
+    """
+    with transaction.atomic():
+        Document.objects.filter(pk=document.pk).update(
+            content=source.content,
+            scope_summary=source.scope_summary,
+            clarifying_questions=source.clarifying_questions,
+            jira_status='PROCESSED',
+            processing_stage='PROCESSED'
+        )
+        # Copies keep the source's section hashes and its own near-duplicate
+        # links; being exact copies they are not flagged as duplicates of the
+        # source, so pushing the new document still pushes its tickets
+        copies = Ticket.objects.bulk_create([
+            Ticket(
+                document=document,
+                title=ticket.title,
+                description=ticket.description,
+                priority=ticket.priority,
+                estimated_hours=ticket.estimated_hours,
+                source_hash=ticket.source_hash,
+                minhash=ticket.minhash,
+                duplicate_of_id=ticket.duplicate_of_id,
+                duplicate_score=ticket.duplicate_score
+            )
+            for ticket in source.tickets.defer('search_vector').order_by('created_at')
+        ])
+        store_buckets(copies)
+        # Page hashes let a later revision of this upload carry tickets over
+        DocumentPage.objects.bulk_create([
+            DocumentPage(document=document, number=page.number, content_hash=page.content_hash)
+            for page in DocumentPage.objects.filter(document=source)
+        ])
+    document.refresh_from_db()
+    return document
+
+
+def release_copies(source):
+    """
+    Settle the documents waiting on an identical one once it has finished:
+    they reuse its results, or fail with its error. Copies another worker
+    is already releasing are locked and skipped.
+    """
+    with transaction.atomic():
+        copies = list(source.copies.select_for_update(skip_locked=True).filter(
+            processing_stage='UPLOADED'
+        ).defer('content', 'search_vector'))
+        if not copies:
+            return
+        source = Document.objects.defer('search_vector').get(pk=source.pk)
+        if source.processing_stage == 'PROCESSED':
+            for copy in copies:
+                reuse_processed_document(copy, source)
+        elif source.processing_stage == 'FAILED':
+            Document.objects.filter(pk__in=[copy.pk for copy in copies]).update(
+                processing_stage='FAILED',
+                jira_status='ERROR',
+                processing_error=f'Identical document {source.pk} failed: {source.processing_error}'
+            )
+
+
+def finalize_session(session_id):
+    """
+    Move the assembled file into document storage and create its Document.
+    Returns (document, source) where source is the processed duplicate
+    whose results were reused, or None when the document needs processing.
+    """
+    moved = None
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+            if session.status != 'ACTIVE':
+                raise UploadError('Upload is already finalized', 409)
+            if not session.received_bytes:
+                raise UploadError('No data received')
+            if session.total_size is not None and session.received_bytes != session.total_size:
+                raise UploadError(f'Received {session.received_bytes} of {session.total_size} bytes', 409)
+
+            name = default_storage.get_available_name(f'documents/{session.file_name}')
+            document = Document.objects.create(
+                file=name,
+                file_name=session.file_name,
+                content_hash=hash_file(part_path(session)),
+                previous_revision_id=session.previous_revision_id,
+                jira_status='UNPROCESSED'
+            )
+            session.status = 'COMPLETED'
+            session.document = document
+            session.save(update_fields=['status', 'document', 'updated_at'])
+
+            # Moved only once the rows are written, and moved back below if
+            # the commit fails, so no stored file is left without a Document
+            os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+            os.replace(part_path(session), default_storage.path(name))
+            moved = (default_storage.path(name), part_path(session))
+    except BaseException:
+        if moved:
+            os.replace(*moved)
+        raise
+
+    source = find_processed_duplicate(document.content_hash, exclude_pk=document.pk)
+    if source:
+        reuse_processed_document(document, source)
+    return document, source
+
+
+def expire_sessions():
+    """
+    Delete upload sessions idle for over UPLOAD_SESSION_TTL seconds, with
+    the part files of those never finalized. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    expired = 0
+    for session_id in UploadSession.objects.filter(updated_at__lt=cutoff).values_list('pk', flat=True):
+        with transaction.atomic():
+            # A session a client is appending to right now is skipped
+            session = UploadSession.objects.select_for_update(skip_locked=True).filter(
+                pk=session_id, updated_at__lt=cutoff
+            ).first()
+            if session is None:
+                continue
+            if session.status == 'ACTIVE' and os.path.exists(part_path(session)):
+                os.remove(part_path(session))
+            session.delete()
+            expired += 1
+    if expired:
+        logger.info("Expired upload sessions", extra={'count': expired})
+    return expired
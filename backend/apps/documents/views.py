@@ -1,25 +1,57 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Document
-from .serializers import DocumentSerializer
-import fitz
-import os
-from django.http import FileResponse
-from jira import JIRA
+from .models import Document, IngestionBatch, UploadSession
+from .serializers import DocumentSerializer, DocumentListSerializer, DocumentSearchSerializer
+from .pagination import DocumentCursorPagination, SearchResultsPagination
+from .search import attach_document_headlines, build_query, search_documents
+from .file_delivery import serve_file
+from .extraction import is_supported
+from .uploads import (
+    UploadError, append_chunk, finalize_session, find_processed_duplicate,
+    hash_chunks, resolve_previous_revision, reuse_processed_document, start_session,
+)
 from django.conf import settings
+from .async_pipeline import schedule_batch, schedule_processing
+from .ingestion import batch_progress, ingest_files
+from .push import push_tickets
+from .clients import get_jira_client, get_gitlab_client, invalidate_client
+from .project_cache import get_listing
+import logging
+import mimetypes
+import os
+from django.db.models import Count
+from django.shortcuts import get_object_or_404
 import gitlab
-from apps.tickets.ai_service import generate_tickets_from_content, generate_scope_summary, generate_clarifying_questions
+from jira.exceptions import JIRAError
+
+logger = logging.getLogger(__name__)
 
 class DocumentViewSet(viewsets.ModelViewSet):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
+    pagination_class = DocumentCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset().defer('search_vector')
+        if self.action == 'list':
+            return queryset.defer(
+                'content', 'scope_summary', 'clarifying_questions'
+            ).annotate(tickets_count=Count('tickets'))
+        if self.action == 'retrieve':
+            return queryset.prefetch_related('tickets')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return DocumentListSerializer
+        return super().get_serializer_class()
 
     def list(self, request):
-        """Get all documents"""
-        documents = self.get_queryset()
-        serializer = self.get_serializer(documents, many=True)
-        return Response(serializer.data)
+        """Get a page of documents, newest first"""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk=None):
         """Get a specific document"""
@@ -35,7 +67,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['POST'])
     def upload(self, request):
-        """Upload and process a document"""
+        """Upload a document and queue it for processing"""
         if 'file' not in request.FILES:
             return Response(
                 {'error': 'No file provided'}, 
@@ -43,91 +75,185 @@ class DocumentViewSet(viewsets.ModelViewSet):
             )
         
         file_obj = request.FILES['file']
+        try:
+            previous_revision_id = resolve_previous_revision(request.data.get('previous_revision'))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
         
         try:
             document = Document.objects.create(
                 file=file_obj,
                 file_name=file_obj.name,
+                content_hash=hash_chunks(file_obj.chunks(settings.UPLOAD_CHUNK_SIZE)),
+                previous_revision_id=previous_revision_id,
                 jira_status='UNPROCESSED'
             )
+            source = find_processed_duplicate(document.content_hash, exclude_pk=document.pk)
+            if source:
+                reuse_processed_document(document, source)
+            return self._processing_response(document, source)
             
-            if file_obj.name.endswith('.pdf'):
-                try:
-                    # Get the file path
-                    file_path = document.file.path
-                    print(f"Processing PDF: {file_path}")
-                    
-                    # Open and extract text with PyMuPDF
-                    pdf_document = fitz.open(file_path)
-                    content = ""
-                    
-                    for page_num in range(pdf_document.page_count):
-                        page = pdf_document[page_num]
-                        content += page.get_text() + "\n"
-                    
-                    pdf_document.close()
-                    
-                    print(f"Extracted content length: {len(content)}")
-                    print(f"Content preview: {content[:200]}")
-
-                    if content.strip():
-                        # Save the content to document
-                        document.content = content
-                        document.save()
-                        
-                        # Generate tickets using your existing service
-                        tickets = generate_tickets_from_content(document)
+        except Exception as e:
+            logger.exception("Upload error")
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
-                        # Generate summary and clarifying questions
-                        summary = generate_scope_summary(document)
-                        questions = generate_clarifying_questions(document)
-                        
-                        # Save the summary and questions to the document
-                        document.scope_summary = summary
-                        document.save()
-                        document.clarifying_questions = questions
-                        document.save()
-                        
-                        document.jira_status = 'PROCESSED'
-                        document.save()
-                        
-                        return Response({
-                            'id': document.id,
-                            'message': 'Content extracted and tickets generated successfully',
-                            'jira_status': document.jira_status,
-                            'tickets_count': len(tickets),
-                            'content_preview': content[:500] + '...' if len(content) > 500 else content
-                        }, status=status.HTTP_201_CREATED)
-                        
-                    else:
-                        return Response({
-                            'id': document.id,
-                            'message': 'PDF uploaded but no text content extracted',
-                            'jira_status': 'ERROR'
-                        }, status=status.HTTP_201_CREATED)
-                        
-                        
-                except Exception as pdf_error:
-                    print(f"PDF extraction error: {str(pdf_error)}")
-                    return Response({
-                        'id': document.id,
-                        'message': f'PDF upload successful but extraction failed: {str(pdf_error)}',
-                        'jira_status': 'ERROR'
-                    }, status=status.HTTP_201_CREATED)
-            
+    def _processing_response(self, document, source):
+        """Queue a new upload for processing, or report the duplicate whose results it reused"""
+        if source:
             return Response({
                 'id': document.id,
-                'message': 'Document uploaded successfully',
-                'jira_status': document.jira_status
+                'message': 'Identical document already processed, reused its tickets',
+                'deduplicated_from': source.id,
+                'jira_status': document.jira_status,
+                'processing_stage': document.processing_stage
             }, status=status.HTTP_201_CREATED)
-            
+
+        if is_supported(document.file_name):
+            schedule_processing(document.id)
+            return Response({
+                'id': document.id,
+                'message': 'Document uploaded and queued for processing',
+                'jira_status': document.jira_status,
+                'processing_stage': document.processing_stage
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        return Response({
+            'id': document.id,
+            'message': 'Document uploaded successfully',
+            'jira_status': document.jira_status
+        }, status=status.HTTP_201_CREATED)
+
+    def _upload_session_data(self, session):
+        return {
+            'upload_id': str(session.id),
+            'file_name': session.file_name,
+            'chunk_size': session.chunk_size,
+            'total_size': session.total_size,
+            'received_bytes': session.received_bytes,
+            'status': session.status
+        }
+
+    @action(detail=False, methods=['POST'], url_path='uploads')
+    def start_upload(self, request):
+        """Start a chunked, resumable upload"""
+        file_name = request.data.get('file_name')
+        if not file_name:
+            return Response({'error': 'file_name is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            total_size = request.data.get('total_size')
+            total_size = int(total_size) if total_size not in (None, '') else None
+            session = start_session(
+                file_name, total_size, resolve_previous_revision(request.data.get('previous_revision'))
+            )
+        except ValueError:
+            return Response({'error': 'total_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response(self._upload_session_data(session), status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['POST'], url_path='batches')
+    def create_batch(self, request):
+        """
+        Ingest many documents at once, as repeated 'files' parts and/or zip
+        'archive' parts, and queue them for bounded concurrent processing
+        """
+        uploaded_files = request.FILES.getlist('files') + request.FILES.getlist('archive')
+        if not uploaded_files:
+            return Response(
+                {'error': 'No files provided'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            batch, to_process = ingest_files(uploaded_files)
         except Exception as e:
-            print(f"Upload error: {str(e)}")
+            logger.exception("Bulk ingestion error")
             return Response(
-                {'error': str(e)}, 
+                {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        schedule_batch(to_process)
+        return Response(batch_progress(batch), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['GET'], url_path=r'batches/(?P<batch_id>[0-9a-f-]+)')
+    def batch_status(self, request, batch_id=None):
+        """Get aggregate and per-document progress of a bulk ingestion batch"""
+        batch = get_object_or_404(IngestionBatch, pk=batch_id)
+        return Response(batch_progress(batch))
+
+    @action(detail=False, methods=['GET'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)')
+    def upload_progress(self, request, upload_id=None):
+        """Get how much of a chunked upload has been received, to resume it"""
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        return Response(self._upload_session_data(session))
+
+    @action(detail=False, methods=['PUT'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/chunk')
+    def upload_chunk(self, request, upload_id=None):
+        """
+        Append one chunk. The raw request body is the chunk and the
+        Upload-Offset header gives its byte offset in the file.
+        """
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({'error': 'Upload-Offset header is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = append_chunk(upload_id, offset, request.body)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response(self._upload_session_data(session))
+
+    @action(detail=False, methods=['POST'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/finalize')
+    def finalize_upload(self, request, upload_id=None):
+        """Assemble a chunked upload into a document and queue it, unless an identical one was processed"""
+        try:
+            document, source = finalize_session(upload_id)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return self._processing_response(document, source)
+
+    @action(detail=False, methods=['GET'])
+    def search(self, request):
+        """Full-text search over document names and content, best match first"""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response(
+                {'error': 'Query parameter q is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        query = build_query(text)
+        paginator = SearchResultsPagination()
+        page = paginator.paginate_queryset(search_documents(query), request, view=self)
+        attach_document_headlines(page, query)
+        serializer = DocumentSearchSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['GET'], url_path='status')
+    def processing_status(self, request, pk=None):
+        """Get the processing progress of a document"""
+        document = get_object_or_404(Document.objects.defer('content', 'scope_summary', 'clarifying_questions', 'search_vector'), pk=pk)
+        return Response({
+            'id': document.id,
+            'jira_status': document.jira_status,
+            'processing_stage': document.processing_stage,
+            'processing_error': document.processing_error,
+            'extracting_started_at': document.extracting_started_at,
+            'extracting_finished_at': document.extracting_finished_at,
+            'generating_started_at': document.generating_started_at,
+            'generating_finished_at': document.generating_finished_at,
+            'stage_durations': document.stage_durations(),
+            'tickets_count': document.tickets.count()
+        })
+
     @action(detail=True, methods=['GET'])
     def content(self, request, pk=None):
         """Get document content"""
@@ -141,15 +267,12 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['GET'], url_path='view')
     def view_pdf(self, request, pk=None):
-        """View the PDF document"""
-        document = self.get_object()
-        file_path = document.file.path
+        """View the uploaded document"""
+        document = get_object_or_404(Document.objects.only('id', 'file'), pk=pk)
         
-        if os.path.exists(file_path):
-            return FileResponse(
-                open(file_path, 'rb'),
-                content_type='application/pdf'
-            )
+        if document.file and os.path.exists(document.file.path):
+            content_type = mimetypes.guess_type(document.file.name)[0] or 'application/octet-stream'
+            return serve_file(request, document.file.path, document.file.name, content_type)
         
         return Response(
             {'error': 'PDF file not found'}, 
@@ -165,82 +288,83 @@ class DocumentViewSet(viewsets.ModelViewSet):
             jira_project = request.data.get('project_key')
             gitlab_project_id = request.data.get('gitlab_project_id')
             
-            # Initialize clients
-            jira = JIRA(
-                server=settings.JIRA_URL,
-                basic_auth=(settings.JIRA_EMAIL, settings.JIRA_API_TOKEN)
-            )
-            
-            gl = gitlab.Gitlab(
-                settings.GITLAB_URL, 
-                private_token=settings.GITLAB_TOKEN
-            )
+            # Shared, pooled clients
+            jira = get_jira_client()
+            gl = get_gitlab_client()
             gitlab_project = gl.projects.get(gitlab_project_id)
             
-            # Create tickets/issues
-            for ticket in document.tickets.all():
-                # Create Jira issue
-                jira_issue = jira.create_issue(
-                    project=jira_project,
-                    summary=ticket.title,
-                    description=ticket.description,
-                    issuetype={'name': 'Task'}
-                )
-                
-                # Create GitLab issue
-                gitlab_issue = gitlab_project.issues.create({
-                    'title': ticket.title,
-                    'description': f"{ticket.description}\n\nJira Reference: {jira_issue.key}",
-                    'labels': [ticket.priority.lower()]
+            # Near-duplicates of tickets already generated elsewhere can be left out
+            tickets = document.tickets.all()
+            skipped = []
+            if str(request.data.get('skip_duplicates', '')).lower() in ('1', 'true'):
+                skipped = [ticket.id for ticket in tickets if ticket.duplicate_of_id]
+                tickets = [ticket for ticket in tickets if not ticket.duplicate_of_id]
+
+            # Create tickets/issues: Jira in bulk, GitLab concurrently
+            results = push_tickets(tickets, jira, jira_project, gitlab_project)
+            failed = [result for result in results if result['errors']]
+            for result in failed:
+                logger.warning("Push failed for ticket", extra={
+                    'document_id': document.id,
+                    'ticket_id': result['ticket_id'],
+                    'errors': result['errors']
                 })
-                
-                print(f"Created Jira issue: {jira_issue.key}")
-                print(f"Created GitLab issue: #{gitlab_issue.iid}")
             
-            document.jira_status = 'PUSHED'
-            document.save()
+            document.jira_status = 'FAILED' if failed else 'PUSHED'
+            document.save(update_fields=['jira_status'])
+            
+            if failed:
+                return Response({
+                    'status': 'partial',
+                    'message': f'{len(failed)} of {len(results)} tickets failed to push',
+                    'results': results,
+                    'skipped_duplicates': skipped
+                }, status=status.HTTP_207_MULTI_STATUS)
             
             return Response({
                 'status': 'success',
-                'message': 'Successfully pushed to Jira and GitLab'
+                'message': 'Successfully pushed to Jira and GitLab',
+                'results': results,
+                'skipped_duplicates': skipped
             })
             
         except Exception as e:
-            print(f"Push Error: {str(e)}")
+            if isinstance(e, gitlab.exceptions.GitlabAuthenticationError):
+                invalidate_client('gitlab')
+            logger.exception("Push error", extra={'document_id': document.id})
             document.jira_status = 'FAILED'
-            document.save()
+            document.save(update_fields=['jira_status'])
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
             
+    def _listing_response(self, request, service):
+        """Serve a cached project listing with ETag revalidation"""
+        force_refresh = request.query_params.get('refresh', '').lower() in ('1', 'true')
+        entry = get_listing(service, force_refresh=force_refresh)
+        etag = f'"{entry["etag"]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if request.headers.get('If-None-Match') == etag and not force_refresh:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry['data'], headers=headers)
+
     @action(detail=False, methods=['GET'], url_path='jira-projects')
     def jira_projects(self, request):
         """Get available Jira projects"""
         try:
-            jira = JIRA(
-                server=settings.JIRA_URL,
-                basic_auth=(settings.JIRA_EMAIL, settings.JIRA_API_TOKEN)
+            return self._listing_response(request, 'jira')
+        except JIRAError as e:
+            if e.status_code != 401:
+                logger.exception("Unexpected Jira error")
+                return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.warning("Jira authentication error", extra={'error': str(e)})
+            invalidate_client('jira')
+            return Response(
+                {'error': 'Invalid Jira credentials'},
+                status=status.HTTP_401_UNAUTHORIZED
             )
-            projects = jira.projects()
-            
-            return Response([{
-                'value': project.key,
-                'label': project.name
-            } for project in projects])
-
-            # temp
-            # return Response([
-            # {
-            #     'value': 'TEST',
-            #     'label': 'Test Project'
-            # },
-            # {
-            #     'value': 'TEST2',
-            #     'label': 'Test Project 2'
-            # }
-            # ])
-            
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
@@ -250,51 +374,18 @@ class DocumentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['GET'], url_path='gitlab-projects')
     def gitlab_projects(self, request):
         """Get available GitLab projects"""
-        print("\n=== Starting GitLab Projects Fetch ===")
-        print(f"GitLab URL: {settings.GITLAB_URL}")
-        print(f"Token exists: {bool(settings.GITLAB_TOKEN)}")
-        print(f"Token preview: {settings.GITLAB_TOKEN[:4]}..." if settings.GITLAB_TOKEN else "No token")
-        
         try:
-            print("\nInitializing GitLab client...")
-            gl = gitlab.Gitlab(
-                url=settings.GITLAB_URL,
-                private_token=settings.GITLAB_TOKEN,
-                per_page=100,
-                api_version='4'
-            )
-            
-            print("\nAttempting authentication...")
-            gl.auth()
-            print("Authentication successful!")
-            
-            print("\nFetching projects...")
-            projects = gl.projects.list(membership=True, all=True)
-            print(f"Found {len(projects)} projects")
-            
-            for project in projects[:3]:  # Print first 3 projects for debugging
-                print(f"\nProject found: {project.path_with_namespace}")
-                print(f"Project ID: {project.id}")
-            
-            response_data = [{
-                'value': str(project.id),
-                'label': project.path_with_namespace
-            } for project in projects]
-            
-            print(f"\nReturning {len(response_data)} projects")
-            return Response(response_data)
-            
+            return self._listing_response(request, 'gitlab')
         except gitlab.exceptions.GitlabAuthenticationError as e:
-            print(f"\n❌ GitLab Authentication Error: {str(e)}")
-            print("Token used:", settings.GITLAB_TOKEN[:4] + "..." if settings.GITLAB_TOKEN else None)
+            logger.warning("GitLab authentication error", extra={'error': str(e)})
+            invalidate_client('gitlab')
             return Response(
                 {'error': 'Invalid GitLab credentials'}, 
                 status=status.HTTP_401_UNAUTHORIZED
             )
         except Exception as e:
-            print(f"\n❌ Unexpected GitLab Error: {str(e)}")
-            print(f"Error type: {type(e)}")
+            logger.exception("Unexpected GitLab error")
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class TelemetryConfig(AppConfig):
+    name = 'apps.telemetry'
+    label = 'telemetry'
+
+    def ready(self):
+        from .tracing import configure_tracing
+        configure_tracing()
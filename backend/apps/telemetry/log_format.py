@@ -0,0 +1,30 @@
+from opentelemetry import trace
+import json
+import logging
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with ``extra`` fields and the active trace ids
+    """
+
+    def format(self, record):
+        payload = {
+            'timestamp': self.formatTime(record, '%Y-%m-%dT%H:%M:%S%z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            payload['trace_id'] = format(span_context.trace_id, '032x')
+            payload['span_id'] = format(span_context.span_id, '016x')
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
@@ -0,0 +1,163 @@
+"""
+Minimal in-process metrics registry rendered in the Prometheus text format.
+
+Each process (web worker or Celery worker) keeps its own counters; scrape
+every process, or aggregate at the collector.
+"""
+
+from bisect import bisect_left
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", le))} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}'
+
+
+def render():
+    """
+    All registered metrics in the Prometheus text exposition format
+    """
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+stage_duration = Histogram(
+    'ticketflow_stage_duration_seconds',
+    'Latency of pipeline stages, LLM calls, DB writes and Jira/GitLab calls',
+    ('stage',)
+)
+stage_errors = Counter(
+    'ticketflow_stage_errors_total',
+    'Errors raised per pipeline stage',
+    ('stage', 'error')
+)
+llm_tokens = Counter(
+    'ticketflow_llm_tokens_total',
+    'OpenAI tokens consumed',
+    ('model', 'kind')
+)
+llm_cache_lookups = Counter(
+    'ticketflow_llm_cache_lookups_total',
+    'LLM response cache lookups by result',
+    ('result',)
+)
+llm_rate_limit_wait = Histogram(
+    'ticketflow_llm_rate_limit_wait_seconds',
+    'Time OpenAI calls waited for the shared request and token budget',
+    ('model',)
+)
+llm_retries = Counter(
+    'ticketflow_llm_retries_total',
+    'OpenAI calls retried after 429s, 5xx or connection errors',
+    ('model', 'status')
+)
+llm_ticket_responses = Counter(
+    'ticketflow_llm_ticket_responses_total',
+    'Ticket responses by parse result: parsed, repaired (by json_repair) or unparseable',
+    ('result',)
+)
+llm_ticket_items = Counter(
+    'ticketflow_llm_ticket_items_total',
+    'Generated tickets by schema validation result: valid, invalid, repaired or dropped',
+    ('result',)
+)
+llm_wasted_calls = Counter(
+    'ticketflow_llm_wasted_calls_total',
+    'OpenAI calls whose output had to be thrown away',
+    ('reason',)
+)
+extraction_duration = Histogram(
+    'ticketflow_extraction_seconds',
+    'Text extraction time per document by format',
+    ('format',)
+)
+extraction_bytes = Counter(
+    'ticketflow_extraction_bytes_total',
+    'Bytes of uploaded documents extracted, by format',
+    ('format',)
+)
+extraction_chars = Counter(
+    'ticketflow_extraction_chars_total',
+    'Characters of text extracted, by format',
+    ('format',)
+)
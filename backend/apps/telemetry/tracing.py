@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from .metrics import stage_duration, stage_errors
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer('ticketflowai')
+_configured = False
+
+
+def configure_tracing():
+    """
+    Install an SDK tracer provider exporting over OTLP when
+    OTEL_EXPORTER_OTLP_ENDPOINT is set; otherwise spans stay no-ops
+    """
+    global _configured
+    if _configured or not os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'):
+        return
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    provider = TracerProvider(resource=Resource.create({
+        'service.name': os.getenv('OTEL_SERVICE_NAME', 'ticketflowai-backend')
+    }))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _configured = True
+    logger.info('OpenTelemetry tracing enabled', extra={'endpoint': os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')})
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Trace a unit of work as a span and record its latency and errors under
+    the given stage name
+    """
+    started = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        except Exception as e:
+            stage_errors.inc(stage=name, error=type(e).__name__)
+            span.record_exception(e)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, str(e)))
+            raise
+        finally:
+            stage_duration.observe(time.perf_counter() - started, stage=name)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from .metrics import render
+import hmac
+
+
+def _allowed(request):
+    """
+    True when the request bears METRICS_TOKEN or comes from one of
+    METRICS_ALLOWED_IPS
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint. The registry belongs to this process only, so
+    with several uvicorn workers each scrape sees one worker's counters.
+    """
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
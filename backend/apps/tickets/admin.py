@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Ticket
+from .models import Ticket, LLMResponse
 
 # Register your models here.
 @admin.register(Ticket)
@@ -8,3 +8,9 @@ class TicketAdmin(admin.ModelAdmin):
     list_filter = ('priority', 'status')
     search_fields = ('title', 'description')
     date_hierarchy = 'created_at'
+
+
+@admin.register(LLMResponse)
+class LLMResponseAdmin(admin.ModelAdmin):
+    list_display = ('key', 'model', 'hit_count', 'last_hit_at', 'expires_at')
+    search_fields = ('key', 'model')
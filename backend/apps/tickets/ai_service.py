@@ -1,100 +1,366 @@
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
+from django.conf import settings
+from django.db import connection, transaction
 from .models import Ticket
+from .dedup import flag_duplicates, store_buckets
+from .chunking import Section, chunk_text, truncate_to_tokens
+from . import llm_cache
+from .rate_limit import call_with_limits
+from .schemas import TICKET_TOOL_OPTIONS, validate_tickets
+from apps.telemetry.metrics import llm_ticket_items, llm_ticket_responses, llm_tokens, llm_wasted_calls
+from apps.telemetry.tracing import stage
 import json
+import json_repair
+import logging
 import os
+import re
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+logger = logging.getLogger(__name__)
 
-def generate_tickets_from_content(document):
+VALID_PRIORITIES = {value for value, _ in Ticket.PRIORITY_CHOICES}
+
+def chat_completion(system_prompt, user_prompt, model="gpt-3.5-turbo", temperature=0.7, bypass_cache=False, **options):
     """
-    Generate tickets using OpenAI's API directly
+    Run a chat completion and return the message content, serving repeats of
+    the same request from the LLM response cache unless bypass_cache is set
     """
-    try:
-        print(f"Document content preview: {document.content[:200]}")
+    use_cache = settings.LLM_CACHE_ENABLED and not bypass_cache
+    key = llm_cache.make_cache_key(model, system_prompt, user_prompt, temperature, **options)
 
-        prompt = f"""
-        Create actionable tickets from this document content:
-        
-        {document.content[:4000]}
-        
-        Create 3-5 specific tickets. Return them in this exact JSON format:
-        [
-            {{
-                "title": "Short, clear title",
-                "description": "Detailed description of what needs to be done",
-                "priority": "HIGH",
-                "estimated_hours": 2.5
-            }}
-        ]
-        
-        Important: Return ONLY the JSON array, no other text.
-        """
+    if use_cache:
+        cached = llm_cache.lookup(key)
+        if cached is not None:
+            return cached
+    else:
+        llm_cache.record_bypass()
 
-        print("Sending request to OpenAI...")
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+    with stage('llm.chat_completion', model=model):
+        response = call_with_limits(
+            client.chat.completions.create,
+            model=model,
             messages=[
-                {"role": "system", "content": "You are a project manager who creates clear, actionable tickets from document content."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
             ],
-            temperature=0.7
+            temperature=temperature,
+            **options
         )
+    result = message_text(response.choices[0].message)
+    record_usage(response, model)
 
-        result = response.choices[0].message.content
-        print(f"Raw OpenAI Response: {result}")
-
-        # Clean up the response
-        result = result.strip()
-        if result.startswith('```json'):
-            result = result[7:]  # Remove ```json
-        if result.startswith('```'):
-            result = result[3:]  # Remove ```
-        if result.endswith('```'):
-            result = result[:-3]  # Remove trailing ```
-        
-        result = result.strip()
-        print(f"Cleaned response: {result}")
+    if result:
+        llm_cache.store(key, model, result)
+    return result
 
-        tickets_data = json.loads(result)
-        print(f"Parsed tickets data: {tickets_data}")
-        
-        created_tickets = []
-        for ticket_data in tickets_data:
-            try:
-                # Validate ticket data
-                if not all(key in ticket_data for key in ['title', 'description']):
-                    print(f"Skipping invalid ticket data: {ticket_data}")
-                    continue
-
-                # Create ticket with proper error handling
-                ticket = Ticket.objects.create(
-                    document=document,
-                    title=ticket_data['title'][:200],
-                    description=ticket_data['description'],
-                    priority=ticket_data.get('priority', 'MEDIUM').upper(),
-                    estimated_hours=float(ticket_data.get('estimated_hours', 0))
-                )
-                print(f"Created ticket: {ticket.id} - {ticket.title}")
-                created_tickets.append(ticket)
-            except Exception as e:
-                print(f"Error creating ticket: {str(e)}")
-                print(f"Problematic ticket data: {ticket_data}")
+def message_text(message):
+    """
+    The message content, or the arguments of its first tool call
+    """
+    tool_calls = getattr(message, 'tool_calls', None)
+    if tool_calls:
+        return tool_calls[0].function.arguments
+    return message.content
 
-        print(f"Successfully created {len(created_tickets)} tickets")
-        return created_tickets
+def record_usage(response, model):
+    """
+    Count the prompt and completion tokens reported for a completion
+    """
+    if getattr(response, 'usage', None):
+        llm_tokens.inc(response.usage.prompt_tokens, model=model, kind='prompt')
+        llm_tokens.inc(response.usage.completion_tokens, model=model, kind='completion')
 
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {str(e)}")
-        print(f"Raw response: {result}")
+def clean_json_response(result):
+    """
+    Strip markdown code fences the model sometimes wraps around JSON output
+    """
+    result = result.strip()
+    if result.startswith('```json'):
+        result = result[7:]  # Remove ```json
+    if result.startswith('```'):
+        result = result[3:]  # Remove ```
+    if result.endswith('```'):
+        result = result[:-3]  # Remove trailing ```
+    return result.strip()
+
+def clean_ticket_data(ticket):
+    """
+    Validate and normalise one ticket dictionary against the TicketDraft
+    schema, returning None when it is unusable
+    """
+    valid, _ = validate_tickets([ticket])
+    return valid[0] if valid else None
+
+def clean_tickets_data(tickets_data):
+    """
+    Validate a list of ticket dictionaries, dropping the invalid ones
+    """
+    cleaned_tickets = []
+    for ticket_data in tickets_data:
+        cleaned_ticket = clean_ticket_data(ticket_data)
+        if cleaned_ticket is None:
+            logger.warning("Skipping invalid ticket data", extra={'ticket_data': ticket_data})
+            continue
+        cleaned_tickets.append(cleaned_ticket)
+    return cleaned_tickets
+
+def build_tickets(document, tickets_data, source_hash=None):
+    """
+    Validate parsed ticket dictionaries into unsaved tickets for a document
+    """
+    return [
+        Ticket(document=document, source_hash=source_hash, **ticket_data)
+        for ticket_data in clean_tickets_data(tickets_data)
+    ]
+
+def save_tickets(document, tickets):
+    """
+    Insert unsaved tickets in a single bulk INSERT inside one transaction,
+    flagging near-duplicates of existing tickets. Returns the created
+    tickets with their primary keys set.
+    """
+    if not tickets:
         return []
-    except Exception as e:
-        print(f"Error generating tickets: {str(e)}")
-        print(f"Type of error: {type(e)}")
+
+    with stage('db.create_tickets', document_id=document.pk), transaction.atomic():
+        created_tickets = Ticket.objects.bulk_create(flag_duplicates(tickets))
+        store_buckets(created_tickets)
+
+    logger.info("Created tickets", extra={
+        'document_id': document.pk,
+        'count': len(created_tickets),
+        'duplicates': sum(1 for ticket in created_tickets if ticket.duplicate_of_id)
+    })
+    return created_tickets
+
+def create_tickets(document, tickets_data):
+    """
+    Validate parsed ticket dictionaries and save them for a document
+    """
+    return save_tickets(document, build_tickets(document, tickets_data))
+
+def run_in_worker(func, *args, **kwargs):
+    """
+    Call func in a pool thread and release that thread's DB connection afterwards
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connection.close()
+
+TICKET_SYSTEM_PROMPT = "You are a project manager who creates clear, actionable tickets from document content."
+
+def build_ticket_prompt(chunk):
+    return f"""
+    Create actionable tickets from this document content:
+    
+    {chunk}
+    
+    Create 3-5 specific tickets and return them by calling create_tickets.
+    """
+
+TICKET_REPAIR_SYSTEM_PROMPT = "You are a project manager who fixes tickets that failed validation."
+
+def build_ticket_repair_prompt(chunk, invalid):
+    items = "\n".join(
+        f"{index}. {json.dumps(item, default=str)}\n       Problems: {errors}"
+        for index, (item, errors) in enumerate(invalid, 1)
+    )
+    return f"""
+    These tickets were created from the document content below but failed validation:
+
+    {items}
+
+    Document content:
+
+    {chunk}
+
+    Call create_tickets with one corrected ticket for each of them, in the same order.
+    Keep what is already valid and fill in what is missing from the document content.
+    """
+
+def generate_tickets_for_chunk(chunk, bypass_cache=False):
+    """
+    Ask OpenAI for tickets covering one chunk of document content and
+    return the validated ticket dictionaries. A response that cannot be
+    parsed at all is requested once more; tickets that fail validation are
+    sent back for repair on their own.
+    """
+    prompt = build_ticket_prompt(chunk)
+    try:
+        items = parse_ticket_response(
+            chat_completion(TICKET_SYSTEM_PROMPT, prompt, bypass_cache=bypass_cache, **TICKET_TOOL_OPTIONS)
+        )
+    except ValueError:
+        # Bypass the cache, which holds the unparseable response
+        items = parse_ticket_response(
+            chat_completion(TICKET_SYSTEM_PROMPT, prompt, bypass_cache=True, **TICKET_TOOL_OPTIONS)
+        )
+    tickets, invalid = split_tickets(items)
+    return tickets + repair_tickets(chunk, invalid, bypass_cache)
+
+def parse_ticket_response(result):
+    """
+    Parse the tickets returned for one chunk: the create_tickets arguments
+    or a bare JSON array. Malformed JSON goes through json_repair first; a
+    response that still holds no list of tickets raises ValueError.
+    """
+    logger.debug("Raw OpenAI response", extra={'response_chars': len(result or '')})
+
+    result = clean_json_response(result or '')
+    try:
+        tickets_data, outcome = json.loads(result), 'parsed'
+    except ValueError:
+        tickets_data, outcome = json_repair.loads(result), 'repaired'
+    if isinstance(tickets_data, dict):
+        tickets_data = tickets_data.get('tickets')
+    if not isinstance(tickets_data, list):
+        llm_ticket_responses.inc(result='unparseable')
+        llm_wasted_calls.inc(reason='unparseable')
+        raise ValueError(f"Expected a list of tickets, got {type(tickets_data).__name__}")
+    llm_ticket_responses.inc(result=outcome)
+    return tickets_data
+
+def split_tickets(items):
+    """
+    Validate generated tickets, returning the valid ones and the invalid
+    ones with their errors
+    """
+    valid, invalid = validate_tickets(items)
+    llm_ticket_items.inc(len(valid), result='valid')
+    if invalid:
+        llm_ticket_items.inc(len(invalid), result='invalid')
+        logger.warning("Generated tickets failed validation", extra={
+            'count': len(invalid),
+            'errors': [errors for _, errors in invalid]
+        })
+    return valid, invalid
+
+def apply_ticket_repair(pending, result):
+    """
+    Validate a repair response for the ``pending`` invalid tickets. Returns
+    the fixed tickets and those still invalid.
+    """
+    try:
+        fixed, still_invalid = validate_tickets(parse_ticket_response(result))
+    except ValueError:
+        return [], pending
+    fixed = fixed[:len(pending)]
+    if not fixed:
+        llm_wasted_calls.inc(reason='repair_failed')
+    llm_ticket_items.inc(len(fixed), result='repaired')
+    return fixed, still_invalid
+
+def record_dropped(invalid, repaired):
+    dropped = len(invalid) - len(repaired)
+    if dropped > 0:
+        llm_ticket_items.inc(dropped, result='dropped')
+        logger.warning("Dropped tickets that could not be repaired", extra={'count': dropped})
+
+def repair_tickets(content, invalid, bypass_cache=False):
+    """
+    Send only the tickets that failed validation back to the model, up to
+    TICKET_REPAIR_ATTEMPTS times, and return the repaired ones
+    """
+    pending, repaired = invalid, []
+    for _ in range(settings.TICKET_REPAIR_ATTEMPTS if invalid else 0):
+        result = chat_completion(
+            TICKET_REPAIR_SYSTEM_PROMPT,
+            build_ticket_repair_prompt(content, pending),
+            bypass_cache=bypass_cache,
+            **TICKET_TOOL_OPTIONS
+        )
+        fixed, pending = apply_ticket_repair(pending, result)
+        repaired.extend(fixed)
+        if not pending:
+            break
+    record_dropped(invalid, repaired)
+    return repaired
+
+def _ticket_key(ticket_data):
+    return re.sub(r'[^a-z0-9]+', ' ', str(ticket_data.get('title', '')).lower()).strip()
+
+
+def merge_ticket_batches(batches, seen=None):
+    """
+    Flatten per-chunk ticket lists, keeping the first ticket for each
+    normalised title; pass the same ``seen`` set to merge across calls
+    """
+    merged = []
+    seen = set() if seen is None else seen
+    for batch in batches:
+        for ticket_data in batch:
+            if not isinstance(ticket_data, dict):
+                continue
+            key = _ticket_key(ticket_data)
+            if key and key in seen:
+                continue
+            seen.add(key)
+            merged.append(ticket_data)
+    return merged
+
+
+def generate_tickets_from_content(document, bypass_cache=False, sections=None):
+    """
+    Generate tickets using OpenAI's API directly.
+
+    The content is split into token-bounded chunks which are sent to the
+    model concurrently (at most AI_CHUNK_CONCURRENCY at a time); the
+    per-chunk results are merged and de-duplicated before saving. A failed
+    chunk is logged and skipped, but when every chunk fails the first error
+    is raised, so the caller records the stage as failed.
+
+    With ``sections`` (see chunking.build_sections) only their text is sent,
+    and each ticket records the hash of the section it came from.
+    """
+    if sections is None:
+        sections = [Section(None, document.content, [])]
+    chunks = [
+        (section, chunk)
+        for section in sections
+        for chunk in chunk_text(section.text, settings.AI_CHUNK_TOKENS)
+    ]
+    logger.info("Generating tickets", extra={
+        'document_id': document.pk,
+        'sections': len(sections),
+        'chunks': len(chunks)
+    })
+    if not chunks:
         return []
 
+    batches = {section.hash: [] for section in sections}
+    failures = []
+    with ThreadPoolExecutor(max_workers=min(settings.AI_CHUNK_CONCURRENCY, len(chunks))) as executor:
+        futures = [
+            executor.submit(run_in_worker, generate_tickets_for_chunk, chunk, bypass_cache)
+            for _, chunk in chunks
+        ]
+        for index, ((section, _), future) in enumerate(zip(chunks, futures)):
+            try:
+                batches[section.hash].append(future.result())
+            except ValueError as e:
+                logger.warning("JSON parsing error in chunk", extra={'chunk': index, 'error': str(e)})
+                failures.append(e)
+            except Exception as e:
+                logger.exception("Error generating tickets for chunk", extra={'chunk': index})
+                failures.append(e)
+    if len(failures) == len(chunks):
+        raise failures[0]
+
+    tickets, seen = [], set()
+    for source_hash, section_batches in batches.items():
+        tickets.extend(build_tickets(document, merge_ticket_batches(section_batches, seen), source_hash))
+    logger.info("Merged chunk tickets", extra={
+        'document_id': document.pk,
+        'generated': sum(len(batch) for section_batches in batches.values() for batch in section_batches),
+        'merged': len(tickets)
+    })
+
+    return save_tickets(document, tickets)
+
 def process_crew_result(result):
     """
     Process the crew's result into a list of ticket dictionaries.
@@ -109,108 +375,143 @@ def process_crew_result(result):
             tickets_data = json.loads(json_str)
             
             # Validate and clean each ticket
-            cleaned_tickets = []
-            for ticket in tickets_data:
-                if isinstance(ticket, dict) and 'title' in ticket and 'description' in ticket:
-                    cleaned_ticket = {
-                        'title': ticket['title'][:200],  # Limit title length
-                        'description': ticket['description'],
-                        'priority': ticket.get('priority', 'MEDIUM').upper(),
-                        'estimated_hours': float(ticket.get('estimated_hours', 0))
-                    }
-                    cleaned_tickets.append(cleaned_ticket)
+            cleaned_tickets = clean_tickets_data(tickets_data)
             
             return cleaned_tickets
     except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {str(e)}")
-    except Exception as e:
-        print(f"Error processing crew result: {str(e)}")
+        logger.warning("JSON parsing error in crew result", extra={'error': str(e)})
+    except Exception:
+        logger.exception("Error processing crew result")
     
     return []
 
-def generate_clarifying_questions(document):
+QUESTIONS_SYSTEM_PROMPT = "You are a senior project manager who identifies potential risks and ambiguities in requirements."
+
+def build_questions_prompt(content):
+    return f"""
+    Review this document content and generate important clarifying questions:
+    
+    {truncate_to_tokens(content, settings.AI_CHUNK_TOKENS)}
+    
+    Create 3-5 specific questions that would help clarify requirements or potential ambiguities.
+    For each question:
+    1. What needs to be clarified?
+    2. Why is this important?
+    3. What impact could this have on the project?
+
+    Write in a clear, natural format.
+    """
+
+SUMMARY_SYSTEM_PROMPT = "You are a project manager who creates clear, concise scope summaries."
+
+def build_summary_prompt(content):
+    return f"""
+    Create a concise project scope summary from this document:
+    
+    {truncate_to_tokens(content, settings.AI_CHUNK_TOKENS)}
+    
+    Include:
+    1. Project Overview (2-3 sentences)
+    2. Key Deliverables (bullet points)
+    3. Major Constraints or Dependencies
+    4. Out of Scope Items (if any)
+    
+    Write in a clear, natural format.
+    """
+
+def generate_clarifying_questions(document, bypass_cache=False):
     """
     Generate clarifying questions from document content
     """
-    print("\n=== Starting Clarifying Questions Generation ===")
-    print(f"Document content length: {len(document.content) if document.content else 'No content'}")
-    
-    try:
-        prompt = f"""
-        Review this document content and generate important clarifying questions:
-        
-        {document.content[:4000]}
-        
-        Create 3-5 specific questions that would help clarify requirements or potential ambiguities.
-        For each question:
-        1. What needs to be clarified?
-        2. Why is this important?
-        3. What impact could this have on the project?
+    logger.info("Generating clarifying questions", extra={
+        'document_id': document.pk,
+        'content_chars': len(document.content or '')
+    })
 
-        Write in a clear, natural format.
-        """
+    return chat_completion(
+        QUESTIONS_SYSTEM_PROMPT,
+        build_questions_prompt(document.content),
+        bypass_cache=bypass_cache
+    ).strip()
 
-        print("Sending request to OpenAI for questions...")
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a senior project manager who identifies potential risks and ambiguities in requirements."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+def generate_scope_summary(document, bypass_cache=False):
+    """
+    Generate a concise scope summary from document content
+    """
+    logger.info("Generating scope summary", extra={
+        'document_id': document.pk,
+        'content_chars': len(document.content or '')
+    })
 
-        result = response.choices[0].message.content.strip()
-        print(f"Raw OpenAI Response (Questions): {result[:200]}...")
-        
-        return result
+    return chat_completion(
+        SUMMARY_SYSTEM_PROMPT,
+        build_summary_prompt(document.content),
+        bypass_cache=bypass_cache
+    ).strip()
+
+ARTIFACTS_SYSTEM_PROMPT = "You are a senior project manager who creates clear, actionable tickets, scope summaries and clarifying questions from document content."
+
+def build_artifacts_prompt(content):
+    return f"""
+    Analyse this document content:
+
+    {truncate_to_tokens(content, settings.AI_CHUNK_TOKENS)}
+
+    Return a JSON object with exactly these keys:
+    {{
+        "tickets": [
+            {{
+                "title": "Short, clear title",
+                "description": "Detailed description of what needs to be done",
+                "priority": "HIGH",
+                "estimated_hours": 2.5
+            }}
+        ],
+        "scope_summary": "Project overview, key deliverables, major constraints or dependencies and out of scope items",
+        "clarifying_questions": "3-5 specific questions that would help clarify requirements or potential ambiguities"
+    }}
 
-    except Exception as e:
-        print(f"❌ Error generating questions: {str(e)}")
-        print(f"Error type: {type(e)}")
-        return "Error generating clarifying questions"
+    Create 3-5 specific tickets. Write the summary and questions in a clear, natural format.
+    Important: Return ONLY the JSON object, no other text.
+    """
 
-def generate_scope_summary(document):
+def parse_artifacts_response(result):
     """
-    Generate a concise scope summary from document content
+    Parse the combined JSON object into raw ticket dictionaries plus the
+    scope summary and clarifying questions as text
     """
-    print("\n=== Starting Scope Summary Generation ===")
-    print(f"Document content length: {len(document.content) if document.content else 'No content'}")
-    
-    try:
-        prompt = f"""
-        Create a concise project scope summary from this document:
-        
-        {document.content[:4000]}
-        
-        Include:
-        1. Project Overview (2-3 sentences)
-        2. Key Deliverables (bullet points)
-        3. Major Constraints or Dependencies
-        4. Out of Scope Items (if any)
-        
-        Write in a clear, natural format.
-        """
+    artifacts = json.loads(clean_json_response(result))
 
-        print("Sending request to OpenAI for scope summary...")
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a project manager who creates clear, concise scope summaries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+    def as_text(value):
+        if isinstance(value, list):
+            return "\n\n".join(str(item) for item in value)
+        return str(value or '').strip()
 
-        result = response.choices[0].message.content.strip()
-        print(f"Raw OpenAI Response (Scope): {result[:200]}...")
-        print("Successfully generated scope summary")
-        
-        return result
+    return {
+        'tickets': artifacts.get('tickets') or [],
+        'scope_summary': as_text(artifacts.get('scope_summary')),
+        'clarifying_questions': as_text(artifacts.get('clarifying_questions'))
+    }
+
+def generate_document_artifacts(document, bypass_cache=False, source_hash=None):
+    """
+    Generate tickets, scope summary and clarifying questions in a single
+    OpenAI call that returns all three as one JSON object
+    """
+    logger.info("Generating combined artifacts", extra={'document_id': document.pk})
+
+    result = chat_completion(
+        ARTIFACTS_SYSTEM_PROMPT,
+        build_artifacts_prompt(document.content),
+        bypass_cache=bypass_cache,
+        response_format={"type": "json_object"}
+    )
 
-    except Exception as e:
-        print(f"❌ Error generating scope summary: {str(e)}")
-        print(f"Error type: {type(e)}")
-        return "Error generating scope summary"
\ No newline at end of file
+    artifacts = parse_artifacts_response(result)
+    tickets_data, invalid = split_tickets(artifacts['tickets'])
+    if invalid:
+        # Repair against the same truncated text the artifacts prompt saw
+        content = truncate_to_tokens(document.content, settings.AI_CHUNK_TOKENS)
+        tickets_data += repair_tickets(content, invalid, bypass_cache)
+    artifacts['tickets'] = save_tickets(document, build_tickets(document, tickets_data, source_hash))
+    return artifacts
@@ -0,0 +1,221 @@
+from asgiref.sync import sync_to_async
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from django.conf import settings
+from .chunking import Section, chunk_text, truncate_to_tokens
+from . import llm_cache
+from .rate_limit import acall_with_limits
+from .schemas import TICKET_TOOL_OPTIONS
+from apps.telemetry.tracing import stage
+from .ai_service import (
+    ARTIFACTS_SYSTEM_PROMPT,
+    QUESTIONS_SYSTEM_PROMPT,
+    SUMMARY_SYSTEM_PROMPT,
+    TICKET_REPAIR_SYSTEM_PROMPT,
+    TICKET_SYSTEM_PROMPT,
+    apply_ticket_repair,
+    build_artifacts_prompt,
+    build_tickets,
+    build_questions_prompt,
+    build_summary_prompt,
+    build_ticket_prompt,
+    build_ticket_repair_prompt,
+    merge_ticket_batches,
+    message_text,
+    parse_artifacts_response,
+    parse_ticket_response,
+    record_dropped,
+    record_usage,
+    save_tickets,
+    split_tickets,
+)
+import asyncio
+import logging
+import os
+
+load_dotenv()
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+logger = logging.getLogger(__name__)
+
+async def achat_completion(system_prompt, user_prompt, model="gpt-3.5-turbo", temperature=0.7, bypass_cache=False, **options):
+    """
+    Async counterpart of ai_service.chat_completion: awaits the completion
+    instead of holding a thread, sharing the same LLM response cache
+    """
+    use_cache = settings.LLM_CACHE_ENABLED and not bypass_cache
+    key = llm_cache.make_cache_key(model, system_prompt, user_prompt, temperature, **options)
+
+    if use_cache:
+        cached = await sync_to_async(llm_cache.lookup)(key)
+        if cached is not None:
+            return cached
+    else:
+        llm_cache.record_bypass()
+
+    with stage('llm.chat_completion', model=model):
+        response = await acall_with_limits(
+            client.chat.completions.create,
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=temperature,
+            **options
+        )
+    result = message_text(response.choices[0].message)
+    record_usage(response, model)
+
+    if result:
+        await sync_to_async(llm_cache.store)(key, model, result)
+    return result
+
+async def asave_tickets(document, tickets):
+    """
+    Async counterpart of ai_service.save_tickets. Flagging, the bulk INSERT
+    and the LSH buckets run in one thread inside a single transaction, so a
+    failure part-way leaves nothing half-saved.
+    """
+    return await sync_to_async(save_tickets)(document, tickets)
+
+async def acreate_tickets(document, tickets_data):
+    """
+    Validate parsed ticket dictionaries and save them for a document
+    """
+    return await asave_tickets(document, build_tickets(document, tickets_data))
+
+async def agenerate_tickets_for_chunk(chunk, bypass_cache=False):
+    """
+    Ask OpenAI for tickets covering one chunk of document content and
+    return the validated ticket dictionaries, repairing invalid ones as
+    ai_service.generate_tickets_for_chunk does
+    """
+    prompt = build_ticket_prompt(chunk)
+    try:
+        items = parse_ticket_response(
+            await achat_completion(TICKET_SYSTEM_PROMPT, prompt, bypass_cache=bypass_cache, **TICKET_TOOL_OPTIONS)
+        )
+    except ValueError:
+        items = parse_ticket_response(
+            await achat_completion(TICKET_SYSTEM_PROMPT, prompt, bypass_cache=True, **TICKET_TOOL_OPTIONS)
+        )
+    tickets, invalid = split_tickets(items)
+    return tickets + await arepair_tickets(chunk, invalid, bypass_cache)
+
+async def arepair_tickets(content, invalid, bypass_cache=False):
+    """
+    Async counterpart of ai_service.repair_tickets
+    """
+    pending, repaired = invalid, []
+    for _ in range(settings.TICKET_REPAIR_ATTEMPTS if invalid else 0):
+        result = await achat_completion(
+            TICKET_REPAIR_SYSTEM_PROMPT,
+            build_ticket_repair_prompt(content, pending),
+            bypass_cache=bypass_cache,
+            **TICKET_TOOL_OPTIONS
+        )
+        fixed, pending = apply_ticket_repair(pending, result)
+        repaired.extend(fixed)
+        if not pending:
+            break
+    record_dropped(invalid, repaired)
+    return repaired
+
+async def agenerate_tickets_from_content(document, bypass_cache=False, sections=None):
+    """
+    Generate and save tickets for a document, awaiting at most
+    AI_CHUNK_CONCURRENCY chunk completions at a time. With ``sections`` only
+    their text is sent and tickets record their section's hash. As in the
+    sync version, the first error is raised when every chunk fails.
+    """
+    if sections is None:
+        sections = [Section(None, document.content, [])]
+    chunks = [
+        (section, chunk)
+        for section in sections
+        for chunk in chunk_text(section.text, settings.AI_CHUNK_TOKENS)
+    ]
+    logger.info("Generating tickets", extra={
+        'document_id': document.pk,
+        'sections': len(sections),
+        'chunks': len(chunks)
+    })
+    if not chunks:
+        return []
+
+    limit = asyncio.Semaphore(settings.AI_CHUNK_CONCURRENCY)
+
+    async def generate(chunk):
+        async with limit:
+            return await agenerate_tickets_for_chunk(chunk, bypass_cache)
+
+    batches = {section.hash: [] for section in sections}
+    failures = []
+    results = await asyncio.gather(*(generate(chunk) for _, chunk in chunks), return_exceptions=True)
+    for index, ((section, _), result) in enumerate(zip(chunks, results)):
+        if isinstance(result, ValueError):
+            logger.warning("JSON parsing error in chunk", extra={'chunk': index, 'error': str(result)})
+            failures.append(result)
+        elif isinstance(result, Exception):
+            logger.error("Error generating tickets for chunk", exc_info=result, extra={'chunk': index})
+            failures.append(result)
+        else:
+            batches[section.hash].append(result)
+    if len(failures) == len(chunks):
+        raise failures[0]
+
+    tickets, seen = [], set()
+    for source_hash, section_batches in batches.items():
+        tickets.extend(build_tickets(document, merge_ticket_batches(section_batches, seen), source_hash))
+    logger.info("Merged chunk tickets", extra={
+        'document_id': document.pk,
+        'generated': sum(len(batch) for section_batches in batches.values() for batch in section_batches),
+        'merged': len(tickets)
+    })
+
+    return await asave_tickets(document, tickets)
+
+async def agenerate_clarifying_questions(document, bypass_cache=False):
+    """
+    Generate clarifying questions from document content
+    """
+    result = await achat_completion(
+        QUESTIONS_SYSTEM_PROMPT,
+        build_questions_prompt(document.content),
+        bypass_cache=bypass_cache
+    )
+    return result.strip()
+
+async def agenerate_scope_summary(document, bypass_cache=False):
+    """
+    Generate a concise scope summary from document content
+    """
+    result = await achat_completion(
+        SUMMARY_SYSTEM_PROMPT,
+        build_summary_prompt(document.content),
+        bypass_cache=bypass_cache
+    )
+    return result.strip()
+
+async def agenerate_document_artifacts(document, bypass_cache=False, source_hash=None):
+    """
+    Generate tickets, scope summary and clarifying questions in a single
+    OpenAI call that returns all three as one JSON object
+    """
+    logger.info("Generating combined artifacts", extra={'document_id': document.pk})
+
+    result = await achat_completion(
+        ARTIFACTS_SYSTEM_PROMPT,
+        build_artifacts_prompt(document.content),
+        bypass_cache=bypass_cache,
+        response_format={"type": "json_object"}
+    )
+
+    artifacts = parse_artifacts_response(result)
+    tickets_data, invalid = split_tickets(artifacts['tickets'])
+    if invalid:
+        # Repair against the same truncated text the artifacts prompt saw
+        content = truncate_to_tokens(document.content, settings.AI_CHUNK_TOKENS)
+        tickets_data += await arepair_tickets(content, invalid, bypass_cache)
+    artifacts['tickets'] = await asave_tickets(document, build_tickets(document, tickets_data, source_hash))
+    return artifacts
@@ -0,0 +1,158 @@
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from unittest import mock
+from django.db import transaction
+from django.test import override_settings
+from apps.documents.extraction import extract_text
+from apps.documents.models import Document
+from . import ai_service, chunking, llm_cache
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+import fitz
+
+PAGE_COUNTS = (10, 100, 1000)
+
+PAGE_TEXT = (
+    "Section {page}: User management\n\n"
+    "The system shall allow administrators to create, update and deactivate user accounts. "
+    "Each account has a role that controls access to projects, documents and tickets. "
+    "Password resets are sent by email and expire after 24 hours.\n\n"
+    "Acceptance criteria: audit every change, support bulk import from CSV, "
+    "and expose the same operations through the REST API.\n"
+)
+
+
+class FakeOpenAIClient:
+    """
+    Stand-in for the OpenAI client returning a canned, fenced JSON ticket list
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+class FakeEncoding:
+    """
+    Whitespace tokenizer standing in for tiktoken, whose encodings are
+    downloaded on first use
+    """
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+
+def fake_ticket_response(count):
+    tickets = [{
+        'title': f'Implement requirement {i}',
+        'description': PAGE_TEXT.format(page=i),
+        'priority': ('HIGH', 'MEDIUM', 'LOW')[i % 3],
+        'estimated_hours': 2.5
+    } for i in range(count)]
+    return f"```json\n{json.dumps(tickets, indent=2)}\n```"
+
+
+def make_synthetic_pdf(path, pages):
+    document = fitz.open()
+    for page_num in range(pages):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), PAGE_TEXT.format(page=page_num + 1), fontsize=10)
+    document.save(path)
+    document.close()
+
+
+def measure(func, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - started)
+    return {
+        'rounds': rounds,
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'mean_s': statistics.fmean(timings),
+    }
+
+
+def run_benchmarks(rounds=5, page_counts=PAGE_COUNTS, include_db=True):
+    """
+    Run every benchmark offline and return {name: stats}
+    """
+    with mock.patch.object(chunking, 'get_encoding', return_value=FakeEncoding()):
+        return _run_benchmarks(rounds, page_counts, include_db)
+
+
+def _run_benchmarks(rounds, page_counts, include_db):
+    results = {}
+    response = fake_ticket_response(50)
+    fake_client = FakeOpenAIClient(response)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = os.path.join(tmp, f'synthetic-{pages}.pdf')
+            make_synthetic_pdf(path, pages)
+            results[f'extract_text[{pages}p]'] = measure(lambda: extract_text(path), rounds)
+
+    chunk = PAGE_TEXT.format(page=1) * 40
+    results['build_ticket_prompt'] = measure(
+        lambda: [ai_service.build_ticket_prompt(chunk) for _ in range(1000)], rounds
+    )
+    results['clean_and_parse_response'] = measure(
+        lambda: [json.loads(ai_service.clean_json_response(response)) for _ in range(100)], rounds
+    )
+    results['process_crew_result'] = measure(
+        lambda: [ai_service.process_crew_result(response) for _ in range(100)], rounds
+    )
+
+    with mock.patch.object(ai_service, 'client', fake_client), \
+            override_settings(OPENAI_RATE_LIMIT_ENABLED=False), \
+            mock.patch.object(llm_cache, 'store'), \
+            mock.patch.object(llm_cache, 'lookup', return_value=None):
+        results['generate_tickets_for_chunk[fake_client]'] = measure(
+            lambda: [ai_service.generate_tickets_for_chunk(chunk) for _ in range(100)], rounds
+        )
+
+    if include_db:
+        tickets_data = json.loads(ai_service.clean_json_response(response)) * 4
+
+        def persist():
+            with transaction.atomic():
+                document = Document.objects.create(file_name='benchmark.pdf')
+                ai_service.create_tickets(document, tickets_data)
+                transaction.set_rollback(True)
+
+        results['create_tickets[200]'] = measure(persist, rounds)
+
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    Return the benchmarks whose median is more than threshold (a fraction)
+    slower than the baseline median
+    """
+    regressions = {}
+    for name, stats in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        ratio = stats['median_s'] / expected['median_s'] if expected['median_s'] else 0
+        if ratio > 1 + threshold:
+            regressions[name] = {
+                'baseline_median_s': expected['median_s'],
+                'median_s': stats['median_s'],
+                'ratio': ratio,
+            }
+    return regressions
@@ -0,0 +1,124 @@
+from collections import namedtuple
+from functools import lru_cache
+import hashlib
+import re
+import tiktoken
+
+SECTION_BREAK = re.compile(r'\f|\n\s*\n')
+
+# A run of consecutive pages generated as one unit; hash identifies its content
+Section = namedtuple('Section', ['hash', 'text', 'pages'])
+
+# Once a section is half full, a page whose hash is divisible by this ends it
+SECTION_BOUNDARY_MODULUS = 2
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model="gpt-3.5-turbo"):
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    return len(get_encoding(model).encode(text))
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-3.5-turbo"):
+    """
+    Cut text down to at most max_tokens tokens
+    """
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def split_sections(text):
+    """
+    Split text on page breaks and blank lines, dropping empty sections
+    """
+    return [section.strip() for section in SECTION_BREAK.split(text) if section.strip()]
+
+
+def _split_oversized(section, max_tokens, model):
+    """
+    Break a single section larger than the budget on line boundaries,
+    falling back to raw token windows for very long lines
+    """
+    encoding = get_encoding(model)
+    pieces, current, current_tokens = [], [], 0
+    for line in section.splitlines():
+        line_tokens = len(encoding.encode(line))
+        if line_tokens > max_tokens:
+            tokens = encoding.encode(line)
+            pieces.extend(
+                encoding.decode(tokens[i:i + max_tokens])
+                for i in range(0, len(tokens), max_tokens)
+            )
+            continue
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def chunk_text(text, max_tokens, model="gpt-3.5-turbo"):
+    """
+    Pack sections of text into chunks of at most max_tokens tokens,
+    only splitting inside a section when it cannot fit on its own
+    """
+    chunks, current, current_tokens = [], [], 0
+    for section in split_sections(text or ""):
+        section_tokens = count_tokens(section, model)
+        parts = [section] if section_tokens <= max_tokens else _split_oversized(section, max_tokens, model)
+        for part in parts:
+            part_tokens = section_tokens if len(parts) == 1 else count_tokens(part, model)
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def build_sections(content, pages, max_tokens, model="gpt-3.5-turbo"):
+    """
+    Group extracted pages into sections of at most max_tokens tokens.
+
+    pages are the per-page entries from extraction (start/end offsets into
+    content and a text hash). Boundaries are content-defined: a section ends
+    after a page whose hash is divisible by SECTION_BOUNDARY_MODULUS once it
+    holds half the budget, or before a page that would overflow it. An edit
+    therefore only changes the hash of its own section and perhaps the next,
+    instead of shifting every later boundary the way fixed-size packing does.
+    Blank pages are skipped.
+    """
+    sections, current, current_tokens = [], [], 0
+
+    def close():
+        if current:
+            text = "".join(f"{content[page['start']:page['end']]}\n" for page in current)
+            digest = hashlib.sha256("".join(page['hash'] for page in current).encode()).hexdigest()
+            sections.append(Section(digest, text, [page['page'] for page in current]))
+
+    for page in pages:
+        text = content[page['start']:page['end']]
+        if not text.strip():
+            continue
+        page_tokens = count_tokens(text, model)
+        if current and current_tokens + page_tokens > max_tokens:
+            close()
+            current, current_tokens = [], 0
+        current.append(page)
+        current_tokens += page_tokens
+        if current_tokens >= max_tokens // 2 and int(page['hash'][:8], 16) % SECTION_BOUNDARY_MODULUS == 0:
+            close()
+            current, current_tokens = [], 0
+    close()
+    return sections
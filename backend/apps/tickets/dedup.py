@@ -0,0 +1,178 @@
+"""
+Near-duplicate detection for tickets with MinHash signatures and LSH buckets.
+
+Each ticket's title and description are normalised and split into character
+shingles; a MinHash signature of NUM_PERM values estimates the Jaccard
+similarity of two tickets' shingle sets. The signature is cut into BANDS
+bands of ROWS values and each band is hashed to a bucket key stored in
+TicketLSHBucket, so the candidates for a ticket are the tickets sharing at
+least one key: one indexed ``key IN (...)`` lookup instead of a scan.
+
+With 16 bands of 8 rows, pairs above ~0.7 similarity are very likely to
+share a bucket. Changing NUM_PERM, BANDS or SHINGLE_SIZE invalidates the
+stored index; rebuild it with ``manage.py rebuild_ticket_index``.
+"""
+from collections import defaultdict
+from django.conf import settings
+from apps.telemetry.tracing import stage
+from .models import Ticket, TicketLSHBucket
+import mmh3
+import numpy as np
+import re
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# Fixed seed: signatures must be comparable across processes and restarts
+_generator = np.random.RandomState(1)
+_A = _generator.randint(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _generator.randint(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalise(text):
+    return re.sub(r'[^a-z0-9]+', ' ', str(text or '').lower()).strip()
+
+
+def shingles(title, description):
+    text = normalise(f"{title} {description}")
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def signature(title, description):
+    """
+    MinHash signature of a ticket as NUM_PERM unsigned 32-bit values
+    """
+    hashes = np.fromiter(
+        (mmh3.hash(shingle, signed=False) for shingle in shingles(title, description)),
+        dtype=np.uint64
+    )
+    if not hashes.size:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint32)
+    # Universal hashing (a * x + b) mod p, one permutation per column
+    permuted = np.bitwise_and((np.outer(hashes, _A) + _B) % _MERSENNE_PRIME, _MAX_HASH)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def to_bytes(sig):
+    return sig.astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(bytes(data), dtype='<u4')
+
+
+def similarity(sig_a, sig_b):
+    """
+    Estimated Jaccard similarity of the two tickets' shingle sets
+    """
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+def band_keys(sig):
+    """
+    One signed 64-bit bucket key per band; the band number seeds the hash so
+    equal rows in different bands do not collide
+    """
+    data = to_bytes(sig)
+    width = ROWS * 4
+    return [mmh3.hash64(data[band * width:(band + 1) * width], seed=band)[0] for band in range(BANDS)]
+
+
+def _candidates(keys):
+    """
+    Map each ticket sharing any of the bucket keys to its (signature, root)
+    """
+    ticket_ids = set(TicketLSHBucket.objects.filter(key__in=keys).values_list('ticket_id', flat=True))
+    if not ticket_ids:
+        return {}
+    rows = Ticket.objects.filter(pk__in=ticket_ids, minhash__isnull=False).values_list(
+        'pk', 'minhash', 'duplicate_of_id'
+    )
+    return {pk: (from_bytes(minhash), duplicate_of_id or pk) for pk, minhash, duplicate_of_id in rows}
+
+
+def flag_duplicates(tickets, threshold=None):
+    """
+    Compute and set ``minhash`` on tickets that have no buckets yet, and
+    point each at the original of its closest indexed near-duplicate (or of
+    an earlier saved ticket in the same list) via ``duplicate_of``/``duplicate_score``.
+    Nothing is saved; pass the tickets to bulk_create or bulk_update and then
+    to store_buckets.
+    """
+    threshold = settings.TICKET_DUPLICATE_THRESHOLD if threshold is None else threshold
+    if not tickets:
+        return tickets
+
+    with stage('dedup.flag_duplicates', tickets=len(tickets)):
+        signatures = [signature(ticket.title, ticket.description) for ticket in tickets]
+        keys = [band_keys(sig) for sig in signatures]
+        indexed = _candidates({key for ticket_keys in keys for key in ticket_keys})
+        indexed_keys = defaultdict(set)
+        for pk, (sig, _) in indexed.items():
+            for key in band_keys(sig):
+                indexed_keys[key].add(pk)
+
+        # Saved tickets earlier in the list (when rebuilding) are not indexed yet
+        earlier, roots = defaultdict(list), []
+        for index, (ticket, sig, ticket_keys) in enumerate(zip(tickets, signatures, keys)):
+            ticket.minhash = to_bytes(sig)
+            ticket.duplicate_of_id, ticket.duplicate_score = None, None
+            best_score, best_root = 0.0, None
+
+            for pk in set().union(*(indexed_keys[key] for key in ticket_keys)):
+                if pk == ticket.pk:
+                    continue
+                candidate_sig, root = indexed[pk]
+                score = similarity(sig, candidate_sig)
+                if score > best_score:
+                    best_score, best_root = score, root
+
+            for other in {i for key in ticket_keys for i in earlier[key]}:
+                score = similarity(sig, signatures[other])
+                if score > best_score:
+                    best_score, best_root = score, roots[other]
+
+            if best_root is not None and best_score >= threshold:
+                ticket.duplicate_of_id = best_root
+                ticket.duplicate_score = round(best_score, 4)
+            roots.append(ticket.duplicate_of_id or ticket.pk)
+            if ticket.pk:
+                for key in ticket_keys:
+                    earlier[key].append(index)
+
+    return tickets
+
+
+def store_buckets(tickets):
+    """
+    Index saved tickets that carry a signature so later tickets can find them
+    """
+    TicketLSHBucket.objects.bulk_create([
+        TicketLSHBucket(ticket_id=ticket.pk, key=key)
+        for ticket in tickets
+        if ticket.minhash
+        for key in band_keys(from_bytes(ticket.minhash))
+    ])
+
+
+def find_similar(title, description, threshold=None, limit=10, exclude=None):
+    """
+    Indexed tickets similar to the given text, most similar first, as
+    (ticket_id, score) pairs
+    """
+    threshold = settings.TICKET_DUPLICATE_THRESHOLD if threshold is None else threshold
+    sig = signature(title, description)
+    scored = [
+        (pk, similarity(sig, candidate_sig))
+        for pk, (candidate_sig, _) in _candidates(band_keys(sig)).items()
+        if pk != exclude
+    ]
+    scored = [(pk, score) for pk, score in scored if score >= threshold]
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:limit]
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import LLMResponse
+from apps.telemetry.metrics import llm_cache_lookups
+import hashlib
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'bypassed': 0}
+
+
+def make_cache_key(model, system_prompt, user_prompt, temperature, **options):
+    """
+    Content-addressed key for a chat completion request
+    """
+    payload = json.dumps({
+        'model': model,
+        'system': system_prompt,
+        'user': user_prompt,
+        'temperature': temperature,
+        'options': options,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _record(counter):
+    with _lock:
+        _stats[counter] += 1
+    llm_cache_lookups.inc(result=counter)
+
+
+def get_cache_stats():
+    """
+    Hit/miss counters for this process
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_entries'] = len(_memory)
+    return stats
+
+
+def _memory_get(key):
+    with _lock:
+        if key not in _memory:
+            return None
+        expires_at, value = _memory[key]
+        if expires_at <= timezone.now():
+            # Expired in the database tier too; drop it rather than serve it
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return value
+
+
+def _memory_set(key, value, expires_at):
+    with _lock:
+        _memory[key] = (expires_at, value)
+        _memory.move_to_end(key)
+        while len(_memory) > settings.LLM_CACHE_MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _db_get(key):
+    now = timezone.now()
+    entry = LLMResponse.objects.filter(key=key, expires_at__gt=now).only('response', 'expires_at').first()
+    if entry is None:
+        return None
+    LLMResponse.objects.filter(key=key).update(last_hit_at=now, hit_count=F('hit_count') + 1)
+    return entry
+
+
+def _db_set(key, model, value, expires_at):
+    LLMResponse.objects.update_or_create(
+        key=key,
+        defaults={
+            'model': model,
+            'response': value,
+            'expires_at': expires_at,
+            'last_hit_at': timezone.now(),
+        }
+    )
+
+
+def prune_expired(now=None):
+    """
+    Drop expired rows and trim the table to LLM_CACHE_MAX_ENTRIES, least
+    recently used first. Runs on a schedule (tasks.prune_llm_cache) rather
+    than on every write, since it scans the table.
+    """
+    now = now or timezone.now()
+    LLMResponse.objects.filter(expires_at__lte=now).delete()
+    stale_keys = LLMResponse.objects.order_by('-last_hit_at').values_list(
+        'key', flat=True
+    )[settings.LLM_CACHE_MAX_ENTRIES:]
+    stale_keys = list(stale_keys)
+    if stale_keys:
+        LLMResponse.objects.filter(key__in=stale_keys).delete()
+
+
+def lookup(key):
+    """
+    Look a response up in the in-process LRU, then in the database tier
+    """
+    value = _memory_get(key)
+    if value is not None:
+        _record('memory_hits')
+        return value
+
+    try:
+        entry = _db_get(key)
+    except Exception:
+        logger.exception("LLM cache lookup failed")
+        entry = None
+
+    if entry is None:
+        _record('misses')
+        return None
+
+    _record('db_hits')
+    _memory_set(key, entry.response, entry.expires_at)
+    return entry.response
+
+
+def store(key, model, value):
+    """
+    Store a response in both tiers
+    """
+    expires_at = timezone.now() + timedelta(seconds=settings.LLM_CACHE_TTL)
+    _memory_set(key, value, expires_at)
+    try:
+        _db_set(key, model, value, expires_at)
+    except Exception:
+        logger.exception("LLM cache write failed")
+
+
+def record_bypass():
+    _record('bypassed')
+
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.tickets.benchmarks import PAGE_COUNTS, compare_to_baseline, run_benchmarks
+import json
+import os
+import platform
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmark_baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Run the offline extraction, prompting, parsing and persistence benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--pages', type=int, nargs='+', default=list(PAGE_COUNTS))
+        parser.add_argument('--skip-db', action='store_true', help='Skip the ticket persistence benchmark')
+        parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed slowdown over the baseline median, as a fraction')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store these results as the new baseline')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(
+            rounds=options['rounds'],
+            page_counts=options['pages'],
+            include_db=not options['skip_db']
+        )
+        report = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'benchmarks': results,
+        }
+
+        baseline_path = options['baseline']
+        if options['update_baseline']:
+            os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+            with open(baseline_path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stderr.write(f'Baseline written to {baseline_path}')
+        elif os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)['benchmarks']
+            report['regressions'] = compare_to_baseline(results, baseline, options['threshold'])
+        else:
+            self.stderr.write(f'No baseline at {baseline_path}, skipping comparison')
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if report.get('regressions'):
+            raise CommandError(
+                'Performance regressions: ' + ', '.join(sorted(report['regressions']))
+            )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.tickets.dedup import flag_duplicates, store_buckets
+from apps.tickets.models import Ticket, TicketLSHBucket
+
+
+class Command(BaseCommand):
+    help = 'Recompute MinHash signatures, LSH buckets and duplicate flags for every ticket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Similarity above which a ticket is flagged (default: TICKET_DUPLICATE_THRESHOLD)')
+
+    def handle(self, *args, **options):
+        TicketLSHBucket.objects.all().delete()
+
+        # Oldest first, so each ticket is compared only with tickets created before it
+        queryset = Ticket.objects.only('id', 'title', 'description', 'duplicate_of', 'duplicate_score').order_by('id')
+        processed = duplicates = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                flag_duplicates(batch, threshold=options['threshold'])
+                Ticket.objects.bulk_update(batch, ['minhash', 'duplicate_of', 'duplicate_score'])
+                store_buckets(batch)
+            processed += len(batch)
+            duplicates += sum(1 for ticket in batch if ticket.duplicate_of_id)
+            last_id = batch[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {processed} tickets, {duplicates} flagged as near-duplicates'))
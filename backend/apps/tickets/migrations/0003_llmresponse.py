@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0002_alter_ticket_options_remove_ticket_estimate_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResponse',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100)),
+                ('response', models.TextField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(db_index=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_llmresponse'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['document', 'created_at'], name='ticket_document_created_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_ticket_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='tickets.ticket'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='duplicate_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='minhash',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='TicketLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='tickets.ticket')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_ticket_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
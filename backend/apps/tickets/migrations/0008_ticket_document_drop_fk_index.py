@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_ingestionbatch_document_batch'),
+        ('tickets', '0007_ticket_source_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='document',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='documents.document'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from apps.documents.models import Document
 
@@ -14,7 +16,8 @@ class Ticket(models.Model):
         ('HIGH', 'High')
     ]
 
-    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='tickets')
+    # ticket_document_created_idx leads with document, so no separate FK index
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='tickets', db_index=False)
     title = models.CharField(max_length=200)
     description = models.TextField()
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='MEDIUM')
@@ -22,6 +25,45 @@ class Ticket(models.Model):
     estimated_hours = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Hash of the document section the ticket was generated from, see documents/revisions.py
+    source_hash = models.CharField(max_length=64, null=True, blank=True)
+    # MinHash signature and nearest earlier near-duplicate, see dedup.py
+    minhash = models.BinaryField(null=True, editable=False)
+    duplicate_of = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates'
+    )
+    duplicate_score = models.FloatField(null=True, blank=True)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config='english')
+            + SearchVector('description', weight='B', config='english')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['document', 'created_at'], name='ticket_document_created_idx'),
+            GinIndex(fields=['search_vector'], name='ticket_search_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+class TicketLSHBucket(models.Model):
+    # One LSH band of a ticket's MinHash signature; tickets sharing a key are near-duplicate candidates
+    key = models.BigIntegerField(db_index=True)
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='lsh_buckets')
+
+class LLMResponse(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    model = models.CharField(max_length=100)
+    response = models.TextField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.model} {self.key[:12]}"
@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+from django.conf import settings
+from .chunking import count_tokens
+from apps.telemetry.tracing import stage
+from opentelemetry import context as otel_context
+import logging
+from .ai_service import (
+    generate_tickets_from_content,
+    generate_scope_summary,
+    generate_clarifying_questions,
+    generate_document_artifacts,
+    run_in_worker,
+)
+from .async_ai_service import (
+    agenerate_tickets_from_content,
+    agenerate_scope_summary,
+    agenerate_clarifying_questions,
+    agenerate_document_artifacts,
+)
+
+logger = logging.getLogger(__name__)
+
+STAGES = {
+    'tickets': generate_tickets_from_content,
+    'scope_summary': generate_scope_summary,
+    'clarifying_questions': generate_clarifying_questions,
+}
+
+ASYNC_STAGES = {
+    'tickets': agenerate_tickets_from_content,
+    'scope_summary': agenerate_scope_summary,
+    'clarifying_questions': agenerate_clarifying_questions,
+}
+
+STAGE_FALLBACKS = {
+    'tickets': [],
+    'scope_summary': "Error generating scope summary",
+    'clarifying_questions': "Error generating clarifying questions",
+}
+
+
+def _fits_single_call(document, sections):
+    if sections is not None and len(sections) != 1:
+        return False
+    return count_tokens(document.content or "") <= settings.AI_CHUNK_TOKENS
+
+
+def _traced_stage(parent_context, name, generator, document, bypass_cache):
+    # Pool threads do not inherit the caller's trace context, so attach it explicitly
+    token = otel_context.attach(parent_context)
+    try:
+        with stage(f'generate.{name}', document_id=document.pk):
+            return generator(document, bypass_cache=bypass_cache)
+    finally:
+        otel_context.detach(token)
+
+
+def run_generation_stages(document, single_call=None, bypass_cache=False, sections=None):
+    """
+    Generate tickets, scope summary and clarifying questions for a document.
+
+    The three generators are independent, so they run concurrently on a
+    bounded thread pool. A failure in one stage is recorded in ``errors`` and
+    replaced by that stage's fallback value without affecting the others.
+
+    With ``single_call`` (defaults to ``settings.AI_SINGLE_CALL_GENERATION``)
+    all three artifacts are requested in one structured completion instead,
+    provided the content fits in one chunk; if that call fails, generation
+    falls back to the concurrent fan-out.
+    ``bypass_cache`` skips the LLM response cache for every call.
+
+    ``sections`` limits ticket generation to those sections of the content
+    and tags each ticket with its section hash; the single combined call is
+    then only used when there is exactly one section.
+    """
+    if single_call is None:
+        single_call = settings.AI_SINGLE_CALL_GENERATION
+
+    # A single combined call only sees one chunk, so long documents always fan out
+    if single_call and _fits_single_call(document, sections):
+        try:
+            artifacts = generate_document_artifacts(
+                document, bypass_cache=bypass_cache, source_hash=sections[0].hash if sections else None
+            )
+            artifacts['errors'] = {}
+            return artifacts
+        except Exception:
+            logger.exception("Combined generation failed, falling back to per-stage calls",
+                             extra={'document_id': document.pk})
+
+    generators = dict(STAGES, tickets=partial(generate_tickets_from_content, sections=sections))
+    results = {'errors': {}}
+    with ThreadPoolExecutor(max_workers=settings.AI_MAX_CONCURRENCY) as executor:
+        futures = {
+            name: executor.submit(
+                run_in_worker, _traced_stage, otel_context.get_current(), name, generator, document, bypass_cache
+            )
+            for name, generator in generators.items()
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.exception("Generation stage failed", extra={'document_id': document.pk, 'stage': name})
+                results['errors'][name] = str(e)
+                results[name] = STAGE_FALLBACKS[name]
+
+    return results
+
+
+async def _atraced_stage(name, generator, document, bypass_cache):
+    with stage(f'generate.{name}', document_id=document.pk):
+        return await generator(document, bypass_cache=bypass_cache)
+
+
+async def arun_generation_stages(document, single_call=None, bypass_cache=False, sections=None):
+    """
+    Async counterpart of run_generation_stages: the three stages are awaited
+    concurrently on the event loop instead of a thread pool, with the same
+    single-call shortcut, sections, per-stage fallbacks and ``errors`` reporting.
+    """
+    if single_call is None:
+        single_call = settings.AI_SINGLE_CALL_GENERATION
+
+    if single_call and _fits_single_call(document, sections):
+        try:
+            artifacts = await agenerate_document_artifacts(
+                document, bypass_cache=bypass_cache, source_hash=sections[0].hash if sections else None
+            )
+            artifacts['errors'] = {}
+            return artifacts
+        except Exception:
+            logger.exception("Combined generation failed, falling back to per-stage calls",
+                             extra={'document_id': document.pk})
+
+    generators = dict(ASYNC_STAGES, tickets=partial(agenerate_tickets_from_content, sections=sections))
+    outcomes = await asyncio.gather(
+        *(_atraced_stage(name, generator, document, bypass_cache) for name, generator in generators.items()),
+        return_exceptions=True
+    )
+
+    results = {'errors': {}}
+    for name, outcome in zip(generators, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Generation stage failed", exc_info=outcome,
+                         extra={'document_id': document.pk, 'stage': name})
+            results['errors'][name] = str(outcome)
+            results[name] = STAGE_FALLBACKS[name]
+        else:
+            results[name] = outcome
+
+    return results
@@ -0,0 +1,349 @@
+"""
+Cluster-wide rate limiting for OpenAI calls.
+
+Every web and Celery process shares, per model, two token buckets in Redis:
+one for requests per minute and one for tokens per minute, sized to the
+configured quota times OPENAI_RATE_LIMIT_HEADROOM. A call estimates its
+tokens with tiktoken (prompt plus expected completion) and takes from both
+buckets atomically in a Lua script; after the call the token bucket is
+corrected with the usage the API reports.
+
+Waiting callers queue in a Redis sorted set in arrival order and only the
+head of the queue may take from the buckets, so a large request cannot be
+starved by a stream of small ones. Callers that stop polling (crashed
+workers) drop out of the queue after a few seconds.
+
+On a 429 the retry delay from Retry-After (or exponential backoff with full
+jitter) is also published as a pause for the model, so every process holds
+off instead of each discovering the limit on its own.
+
+If Redis is unreachable the limiter fails open for a short cooldown and
+calls proceed unthrottled; the retry loop still handles 429s.
+"""
+from django.conf import settings
+from apps.telemetry.metrics import llm_rate_limit_wait, llm_retries
+from .chunking import count_tokens
+import asyncio
+import logging
+import openai
+import random
+import redis
+import redis.asyncio
+import threading
+import time
+import uuid
+import weakref
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# How long a queued caller may go without polling before it is dropped
+STALE_AFTER_MS = 5000
+KEY_TTL_SECONDS = 3600
+MAX_POLL_SECONDS = 1.0
+
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local member = ARGV[1]
+local ttl = tonumber(ARGV[8])
+
+if not redis.call('ZSCORE', KEYS[3], member) then
+  redis.call('ZADD', KEYS[3], redis.call('INCR', KEYS[6]), member)
+end
+redis.call('HSET', KEYS[4], member, now)
+for _, key in ipairs({KEYS[3], KEYS[4], KEYS[6]}) do redis.call('EXPIRE', key, ttl) end
+
+local head = nil
+for _, queued in ipairs(redis.call('ZRANGE', KEYS[3], 0, 99)) do
+  local seen = tonumber(redis.call('HGET', KEYS[4], queued) or '0')
+  if now - seen > tonumber(ARGV[7]) then
+    redis.call('ZREM', KEYS[3], queued)
+    redis.call('HDEL', KEYS[4], queued)
+  else
+    head = queued
+    break
+  end
+end
+
+local paused_until = tonumber(redis.call('GET', KEYS[5]) or '0')
+if paused_until > now then return paused_until - now end
+if head ~= member then return -(redis.call('ZRANK', KEYS[3], member) + 1) end
+
+local function refill(key, capacity, rate)
+  local state = redis.call('HMGET', key, 'level', 'ts')
+  local level, ts = tonumber(state[1]), tonumber(state[2])
+  if level == nil then return capacity end
+  return math.min(capacity, level + (now - ts) * rate / 1000)
+end
+
+local request_capacity, request_rate = tonumber(ARGV[2]), tonumber(ARGV[3])
+local token_capacity, token_rate = tonumber(ARGV[4]), tonumber(ARGV[5])
+local cost = math.min(tonumber(ARGV[6]), token_capacity)
+local requests = refill(KEYS[1], request_capacity, request_rate)
+local tokens = refill(KEYS[2], token_capacity, token_rate)
+
+local wait = 0
+if requests < 1 then wait = math.max(wait, (1 - requests) * 1000 / request_rate) end
+if tokens < cost then wait = math.max(wait, (cost - tokens) * 1000 / token_rate) end
+if wait > 0 then return math.ceil(wait) end
+
+redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+redis.call('HSET', KEYS[2], 'level', tokens - cost, 'ts', now)
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+redis.call('ZREM', KEYS[3], member)
+redis.call('HDEL', KEYS[4], member)
+return 0
+"""
+
+PAUSE_SCRIPT = """
+local t = redis.call('TIME')
+local until_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000) + tonumber(ARGV[1])
+if until_ms > tonumber(redis.call('GET', KEYS[1]) or '0') then
+  redis.call('SET', KEYS[1], until_ms, 'PX', ARGV[1])
+end
+return 0
+"""
+
+RECONCILE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('HINCRBYFLOAT', KEYS[1], 'level', -tonumber(ARGV[1]))
+end
+return 0
+"""
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+def estimate_tokens(model, messages, max_tokens=None):
+    """
+    Tokens a chat completion is expected to use: the prompt as counted by
+    tiktoken plus max_tokens, or OPENAI_COMPLETION_TOKEN_ESTIMATE when unset
+    """
+    prompt_tokens = sum(count_tokens(message['content'], model) + 4 for message in messages) + 3
+    return prompt_tokens + (max_tokens or settings.OPENAI_COMPLETION_TOKEN_ESTIMATE)
+
+
+def _keys(model):
+    prefix = f'openai-limit:{model}'
+    return [f'{prefix}:requests', f'{prefix}:tokens', f'{prefix}:queue',
+            f'{prefix}:heartbeats', f'{prefix}:pause', f'{prefix}:sequence']
+
+
+def _acquire_args(member, tokens):
+    headroom = settings.OPENAI_RATE_LIMIT_HEADROOM
+    requests_per_minute = settings.OPENAI_REQUESTS_PER_MINUTE * headroom
+    tokens_per_minute = settings.OPENAI_TOKENS_PER_MINUTE * headroom
+    return [member, requests_per_minute, requests_per_minute / 60, tokens_per_minute,
+            tokens_per_minute / 60, tokens, STALE_AFTER_MS, KEY_TTL_SECONDS]
+
+
+def _poll_delay(wait_ms):
+    """
+    Seconds to sleep for an acquire result: a positive wait is the time until
+    the buckets refill or a pause ends; a negative one is the queue position
+    """
+    if wait_ms > 0:
+        return min(wait_ms / 1000, MAX_POLL_SECONDS)
+    return min(0.05 * -wait_ms, MAX_POLL_SECONDS) * random.uniform(0.8, 1.2)
+
+
+def retry_delay(error, attempt):
+    """
+    Delay before retrying a failed call: the server's retry-after-ms or
+    Retry-After when given, otherwise exponential backoff with full jitter
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    for header, scale in (('retry-after-ms', 0.001), ('retry-after', 1)):
+        try:
+            return float(headers.get(header)) * scale
+        except (TypeError, ValueError):
+            continue
+    ceiling = min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.RateLimitError) and getattr(error, 'code', None) == 'insufficient_quota':
+        return False
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+class OpenAIRateLimiter:
+
+    def __init__(self):
+        self._client = None
+        self._scripts = {}
+        # An asyncio connection pool belongs to the loop that opened it, so
+        # each running loop gets its own client and scripts
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+        self._disabled_until = 0.0
+
+    def _available(self):
+        return settings.OPENAI_RATE_LIMIT_ENABLED and time.monotonic() >= self._disabled_until
+
+    def _fail_open(self, error):
+        self._disabled_until = time.monotonic() + settings.OPENAI_RATE_LIMIT_COOLDOWN
+        logger.warning("OpenAI rate limiter unavailable, calling unthrottled", extra={'error': str(error)})
+
+    def _script(self, name, source):
+        if self._client is None:
+            self._client = redis.Redis.from_url(
+                settings.OPENAI_RATE_LIMIT_REDIS_URL, socket_connect_timeout=1, socket_timeout=1
+            )
+        if name not in self._scripts:
+            self._scripts[name] = self._client.register_script(source)
+        return self._scripts[name]
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            if loop not in self._async_clients:
+                self._async_clients[loop] = (redis.asyncio.Redis.from_url(
+                    settings.OPENAI_RATE_LIMIT_REDIS_URL, socket_connect_timeout=1, socket_timeout=1
+                ), {})
+            return self._async_clients[loop]
+
+    def _async_script(self, name, source):
+        client, scripts = self._async_client()
+        if name not in scripts:
+            scripts[name] = client.register_script(source)
+        return scripts[name]
+
+    def acquire(self, model, tokens):
+        """
+        Block until one request and ``tokens`` tokens fit in the model's budget
+        """
+        if not self._available():
+            return
+        member, started = uuid.uuid4().hex, time.monotonic()
+        script = self._script('acquire', ACQUIRE_SCRIPT)
+        try:
+            while True:
+                wait_ms = script(keys=_keys(model), args=_acquire_args(member, tokens))
+                if wait_ms == 0:
+                    break
+                if time.monotonic() - started > settings.OPENAI_RATE_LIMIT_MAX_WAIT:
+                    self._client.zrem(_keys(model)[2], member)
+                    raise RateLimitTimeout(f"Waited over {settings.OPENAI_RATE_LIMIT_MAX_WAIT}s for the {model} budget")
+                time.sleep(_poll_delay(wait_ms))
+        except redis.RedisError as e:
+            self._fail_open(e)
+        llm_rate_limit_wait.observe(time.monotonic() - started, model=model)
+
+    async def aacquire(self, model, tokens):
+        """
+        Async counterpart of acquire, waiting with asyncio.sleep
+        """
+        if not self._available():
+            return
+        member, started = uuid.uuid4().hex, time.monotonic()
+        script = self._async_script('acquire', ACQUIRE_SCRIPT)
+        try:
+            while True:
+                wait_ms = await script(keys=_keys(model), args=_acquire_args(member, tokens))
+                if wait_ms == 0:
+                    break
+                if time.monotonic() - started > settings.OPENAI_RATE_LIMIT_MAX_WAIT:
+                    await self._async_client()[0].zrem(_keys(model)[2], member)
+                    raise RateLimitTimeout(f"Waited over {settings.OPENAI_RATE_LIMIT_MAX_WAIT}s for the {model} budget")
+                await asyncio.sleep(_poll_delay(wait_ms))
+        except redis.RedisError as e:
+            self._fail_open(e)
+        llm_rate_limit_wait.observe(time.monotonic() - started, model=model)
+
+    def pause(self, model, seconds):
+        """
+        Hold off every caller for the model, e.g. after a 429
+        """
+        if not self._available():
+            return
+        try:
+            self._script('pause', PAUSE_SCRIPT)(keys=[_keys(model)[4]], args=[max(1, int(seconds * 1000))])
+        except redis.RedisError as e:
+            self._fail_open(e)
+
+    def reconcile(self, model, estimated_tokens, response):
+        """
+        Charge the token bucket for the difference between the estimate and
+        the usage the API reported
+        """
+        usage = getattr(response, 'usage', None)
+        if not usage or not self._available():
+            return
+        try:
+            self._script('reconcile', RECONCILE_SCRIPT)(
+                keys=[_keys(model)[1]], args=[usage.total_tokens - estimated_tokens]
+            )
+        except redis.RedisError as e:
+            self._fail_open(e)
+
+
+limiter = OpenAIRateLimiter()
+
+
+def _log_retry(model, error, delay, attempt):
+    status_code = getattr(error, 'status_code', None)
+    llm_retries.inc(model=model, status=status_code or type(error).__name__)
+    logger.warning("Retrying OpenAI call", extra={
+        'model': model,
+        'status_code': status_code,
+        'delay_seconds': round(delay, 2),
+        'attempt': attempt
+    })
+
+
+def call_with_limits(create, model, messages, **options):
+    """
+    Run ``create(model=..., messages=..., **options)`` within the shared
+    budget, retrying 429s, 5xx and connection errors with backoff
+    """
+    tokens = estimate_tokens(model, messages, options.get('max_tokens'))
+    attempt = 0
+    while True:
+        limiter.acquire(model, tokens)
+        try:
+            response = create(model=model, messages=messages, **options)
+        except Exception as e:
+            attempt += 1
+            if not is_retryable(e) or attempt > settings.OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            if getattr(e, 'status_code', None) == 429:
+                limiter.pause(model, delay)
+            _log_retry(model, e, delay, attempt)
+            time.sleep(delay)
+            continue
+        limiter.reconcile(model, tokens, response)
+        return response
+
+
+async def acall_with_limits(create, model, messages, **options):
+    """
+    Async counterpart of call_with_limits for AsyncOpenAI
+    """
+    tokens = estimate_tokens(model, messages, options.get('max_tokens'))
+    attempt = 0
+    while True:
+        await limiter.aacquire(model, tokens)
+        try:
+            response = await create(model=model, messages=messages, **options)
+        except Exception as e:
+            attempt += 1
+            if not is_retryable(e) or attempt > settings.OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            if getattr(e, 'status_code', None) == 429:
+                await asyncio.to_thread(limiter.pause, model, delay)
+            _log_retry(model, e, delay, attempt)
+            await asyncio.sleep(delay)
+            continue
+        await asyncio.to_thread(limiter.reconcile, model, tokens, response)
+        return response
@@ -0,0 +1,78 @@
+"""
+Pydantic schema for generated tickets.
+
+The same model validates every ticket the LLM returns and, as JSON Schema,
+defines the ``create_tickets`` function the model is made to call, so its
+output is constrained to the shape we validate against.
+"""
+from typing import Literal
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+TITLE_MAX_LENGTH = 200
+
+
+class TicketDraft(BaseModel):
+    title: str = Field(min_length=1, description="Short, clear title")
+    description: str = Field(min_length=1, description="Detailed description of what needs to be done")
+    priority: Literal['HIGH', 'MEDIUM', 'LOW'] = 'MEDIUM'
+    estimated_hours: float = Field(default=0, ge=0, description="Estimated effort in hours")
+
+    @field_validator('title', 'description', mode='before')
+    @classmethod
+    def strip_text(cls, value):
+        return value.strip() if isinstance(value, str) else value
+
+    @field_validator('title')
+    @classmethod
+    def limit_title(cls, value):
+        return value[:TITLE_MAX_LENGTH]
+
+    @field_validator('priority', mode='before')
+    @classmethod
+    def normalise_priority(cls, value):
+        # An unknown priority is not worth a repair call
+        priority = str(value or 'MEDIUM').upper()
+        return priority if priority in ('HIGH', 'MEDIUM', 'LOW') else 'MEDIUM'
+
+    @field_validator('estimated_hours', mode='before')
+    @classmethod
+    def default_hours(cls, value):
+        return 0 if value in (None, '') else value
+
+
+class TicketBatch(BaseModel):
+    tickets: list[TicketDraft]
+
+
+TICKET_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "create_tickets",
+        "description": "Create actionable tickets from document content",
+        "parameters": TicketBatch.model_json_schema(),
+    },
+}
+
+# Options for chat completions that must answer by calling create_tickets
+TICKET_TOOL_OPTIONS = {
+    "tools": [TICKET_TOOL],
+    "tool_choice": {"type": "function", "function": {"name": "create_tickets"}},
+}
+
+
+def validate_tickets(items):
+    """
+    Validate ticket dictionaries one by one. Returns the valid tickets as
+    plain dictionaries and the invalid ones as (item, error message) pairs.
+    """
+    valid, invalid = [], []
+    for item in items:
+        try:
+            valid.append(TicketDraft.model_validate(item).model_dump())
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'ticket'}: {error['msg']}"
+                for error in e.errors()
+            )
+            invalid.append((item, errors))
+    return valid, invalid
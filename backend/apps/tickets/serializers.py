@@ -5,4 +5,15 @@ class TicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = ['id', 'title', 'description', 'priority', 'status', 
-                 'estimated_hours', 'created_at', 'updated_at']
\ No newline at end of file
+                 'estimated_hours', 'created_at', 'updated_at', 'duplicate_of', 'duplicate_score']
+        read_only_fields = ['duplicate_of', 'duplicate_score']
+
+class TicketSearchSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    title_headline = serializers.CharField(read_only=True, default='')
+    description_headline = serializers.CharField(read_only=True, default='')
+
+    class Meta:
+        model = Ticket
+        fields = ['id', 'document', 'title', 'priority', 'status', 'estimated_hours', 'created_at',
+                  'rank', 'title_headline', 'description_headline']
@@ -0,0 +1,223 @@
+"""
+Streaming ticket generation.
+
+The ticket prompt has the model call create_tickets, whose arguments hold a
+JSON array of ticket objects. Instead of waiting for the whole completion,
+TicketStreamParser follows the streamed text character by character and hands
+back each ticket object as soon as its closing brace arrives, so tickets can
+be validated, saved and sent to the client while the model is still writing
+the rest. Objects that do not parse cleanly, and one cut off at
+the end of the stream, go through json_repair.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from apps.telemetry.tracing import stage
+from .ai_service import (
+    TICKET_SYSTEM_PROMPT,
+    build_ticket_prompt,
+    build_tickets,
+    merge_ticket_batches,
+    parse_ticket_response,
+    record_usage,
+    split_tickets,
+)
+from .async_ai_service import arepair_tickets, asave_tickets
+from .chunking import chunk_text
+from .rate_limit import acall_with_limits
+from .schemas import TICKET_TOOL_OPTIONS
+from . import async_ai_service, llm_cache
+import asyncio
+import json
+import json_repair
+import logging
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_DONE = object()
+
+
+class TicketStreamParser:
+    """
+    Incremental parser for a streamed JSON array of ticket objects. Text
+    before the opening bracket (such as a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self._object_start = None
+
+    def feed(self, delta):
+        """
+        Consume the next piece of streamed text and return the ticket
+        dictionaries whose objects it completed
+        """
+        self.text += delta
+        tickets = []
+        while self._position < len(self.text):
+            char = self.text[self._position]
+            self._position += 1
+
+            if not self._started:
+                self._started = char == '['
+                self._depth = 1 if self._started else 0
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '[{':
+                if char == '{' and self._depth == 1:
+                    self._object_start = self._position - 1
+                self._depth += 1
+            elif char in ']}':
+                self._depth -= 1
+                if self._depth == 1 and self._object_start is not None:
+                    tickets.extend(self._parse(self.text[self._object_start:self._position]))
+                    self._object_start = None
+        return tickets
+
+    def close(self):
+        """
+        Return whatever the finished stream still holds: an object cut off
+        mid-way, or the whole response when it never contained an array
+        """
+        if self._object_start is not None:
+            partial, self._object_start = self.text[self._object_start:], None
+            return self._parse(partial)
+        if not self._started and self.text.strip():
+            repaired = json_repair.loads(self.text)
+            if isinstance(repaired, dict):
+                repaired = repaired.get('tickets', [repaired])
+            if isinstance(repaired, list):
+                return [ticket for ticket in repaired if isinstance(ticket, dict)]
+        return []
+
+    def _parse(self, text):
+        try:
+            ticket = json.loads(text)
+        except ValueError:
+            ticket = json_repair.loads(text)
+        if not isinstance(ticket, dict):
+            logger.warning("Skipping unparseable streamed ticket", extra={'ticket_chars': len(text)})
+            return []
+        return [ticket]
+
+
+async def astream_chunk_tickets(chunk, bypass_cache=False, model="gpt-3.5-turbo", temperature=0.7):
+    """
+    Yield validated ticket dictionaries for one chunk as the model streams
+    its create_tickets arguments; tickets failing validation are repaired
+    together once the stream ends. The full text is stored in the LLM
+    response cache under the same key as a non-streamed call, and a cached
+    response is replayed at once.
+    """
+    user_prompt = build_ticket_prompt(chunk)
+    key = llm_cache.make_cache_key(model, TICKET_SYSTEM_PROMPT, user_prompt, temperature, **TICKET_TOOL_OPTIONS)
+    invalid = []
+
+    if settings.LLM_CACHE_ENABLED and not bypass_cache:
+        cached = await sync_to_async(llm_cache.lookup)(key)
+        if cached is not None:
+            valid, invalid = split_tickets(parse_ticket_response(cached))
+            for ticket_data in valid + await arepair_tickets(chunk, invalid, bypass_cache):
+                yield ticket_data
+            return
+    else:
+        llm_cache.record_bypass()
+
+    with stage('llm.chat_completion_stream', model=model):
+        stream = await acall_with_limits(
+            async_ai_service.client.chat.completions.create,
+            model=model,
+            messages=[
+                {"role": "system", "content": TICKET_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            **TICKET_TOOL_OPTIONS
+        )
+
+    parser = TicketStreamParser()
+
+    def validated(tickets_data):
+        valid, failed = split_tickets(tickets_data)
+        invalid.extend(failed)
+        return valid
+
+    async for event in stream:
+        if event.usage:
+            record_usage(event, model)
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta
+        text = delta.tool_calls[0].function.arguments if delta.tool_calls else delta.content
+        if not text:
+            continue
+        for ticket_data in validated(parser.feed(text)):
+            yield ticket_data
+    for ticket_data in validated(parser.close()):
+        yield ticket_data
+
+    if parser.text:
+        await sync_to_async(llm_cache.store)(key, model, parser.text)
+    for ticket_data in await arepair_tickets(chunk, invalid, bypass_cache):
+        yield ticket_data
+
+
+async def astream_tickets(document, bypass_cache=False):
+    """
+    Generate tickets for a document, streaming up to AI_CHUNK_CONCURRENCY
+    chunks at once, and yield each ticket as soon as it has been saved.
+    Repeated titles across chunks are dropped as in generate_tickets_from_content.
+    """
+    chunks = chunk_text(document.content, settings.AI_CHUNK_TOKENS)
+    logger.info("Streaming tickets", extra={'document_id': document.pk, 'chunks': len(chunks)})
+
+    queue = asyncio.Queue()
+    limit = asyncio.Semaphore(settings.AI_CHUNK_CONCURRENCY)
+
+    async def produce(index, chunk):
+        try:
+            async with limit:
+                async for ticket_data in astream_chunk_tickets(chunk, bypass_cache):
+                    await queue.put(ticket_data)
+        except Exception:
+            logger.exception("Error streaming tickets for chunk", extra={'document_id': document.pk, 'chunk': index})
+        finally:
+            await queue.put(_CHUNK_DONE)
+
+    producers = [asyncio.create_task(produce(index, chunk)) for index, chunk in enumerate(chunks)]
+    try:
+        remaining, seen = len(producers), set()
+        while remaining:
+            ticket_data = await queue.get()
+            if ticket_data is _CHUNK_DONE:
+                remaining -= 1
+                continue
+            tickets = build_tickets(document, merge_ticket_batches([[ticket_data]], seen))
+            for ticket in await asave_tickets(document, tickets):
+                yield ticket
+    finally:
+        # The client may disconnect mid-stream; stop the remaining completions
+        for producer in producers:
+            producer.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+
+
+def sse_event(event, data):
+    """
+    Format one server-sent event with a JSON payload
+    """
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
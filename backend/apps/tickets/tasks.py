@@ -0,0 +1,10 @@
+from celery import shared_task
+from . import llm_cache
+
+
+@shared_task
+def prune_llm_cache():
+    """
+    Periodic cleanup of expired and least recently used LLM cache rows
+    """
+    llm_cache.prune_expired()
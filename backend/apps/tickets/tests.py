@@ -1,3 +1,346 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.testing import QueryBudgetMixin
+from apps.documents.models import Document
+from .benchmarks import FakeEncoding
+from .chunking import build_sections, chunk_text, count_tokens
+from .models import LLMResponse, Ticket
+from . import ai_service, async_ai_service, llm_cache, rate_limit
+from .orchestration import STAGE_FALLBACKS, arun_generation_stages, run_generation_stages
+from .streaming import TicketStreamParser
+import asyncio
+import httpx
+import json
+import openai
 
-# Create your tests here.
+
+class TicketQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.document = Document.objects.create(file_name='spec.pdf', content='Build a login page')
+        Ticket.objects.bulk_create([
+            Ticket(document=cls.document, title=f'Ticket {i}', description='Do the thing')
+            for i in range(10)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_tickets_budget(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(f'/api/tickets/document/{self.document.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 10)
+
+    def test_list_tickets_uses_index(self):
+        queryset = Ticket.objects.filter(document_id=self.document.id).order_by('created_at')
+        self.assertUsesIndex(queryset, 'ticket_document_created_idx')
+
+    @mock.patch('apps.tickets.async_ai_service.chunk_text', side_effect=lambda content, max_tokens: [content])
+    @mock.patch('apps.tickets.async_ai_service.agenerate_tickets_for_chunk', new_callable=mock.AsyncMock)
+    def test_generate_tickets_inserts_in_bulk(self, generate_for_chunk, chunk_text):
+        generate_for_chunk.return_value = [
+            {'title': f'Generated {i}', 'description': 'Details', 'priority': 'high'}
+            for i in range(20)
+        ]
+        # 1. document lookup
+        # 2. SAVEPOINT (save_tickets' atomic block nests in the test transaction)
+        # 3. LSH bucket lookup (no bucket matches, so no candidate ticket query)
+        # 4. bulk INSERT of the tickets
+        # 5. bulk INSERT of their LSH buckets
+        # 6. RELEASE SAVEPOINT
+        with self.assertMaxQueries(6):
+            response = self.client.post(f'/api/tickets/generate/{self.document.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['tickets']), 20)
+        self.assertTrue(all(ticket['id'] for ticket in response.json()['tickets']))
+
+    def test_search_tickets(self):
+        Ticket.objects.create(document=self.document, title='Password reset email', description='Send a reset link')
+        with self.assertMaxQueries(3):
+            response = self.client.get('/api/tickets/search/', {'q': 'reset', 'document': self.document.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertIn('<mark>', response.data['results'][0]['title_headline'])
+
+    def test_search_uses_gin_index(self):
+        from apps.documents.search import build_query, ranked
+        self.assertUsesIndex(ranked(Ticket.objects.all(), build_query('reset')), 'ticket_search_idx')
+
+
+
+class TicketDedupTests(TestCase):
+
+    def test_near_duplicates_are_flagged_across_documents(self):
+        from .ai_service import create_tickets
+
+        first = Document.objects.create(file_name='a.pdf')
+        second = Document.objects.create(file_name='b.pdf')
+        [original] = create_tickets(first, [{
+            'title': 'Add password reset flow',
+            'description': 'Users can request a reset link by email and choose a new password.'
+        }])
+        near, unrelated = create_tickets(second, [
+            {'title': 'Add password reset flow.',
+             'description': 'Users can request a reset link via email and choose a new password.'},
+            {'title': 'Export invoices', 'description': 'Nightly CSV export of all invoices.'},
+        ])
+
+        self.assertIsNone(original.duplicate_of_id)
+        self.assertEqual(near.duplicate_of_id, original.id)
+        self.assertGreaterEqual(near.duplicate_score, 0.8)
+        self.assertIsNone(unrelated.duplicate_of_id)
+
+class TicketStreamingTests(TestCase):
+
+    def test_parser_emits_each_ticket_as_its_object_closes(self):
+        parser = TicketStreamParser()
+        response = '```json\n[{"title": "Login {page}", "description": "Use \\"SSO\\""}, {"title": "Logout", "desc'
+        emitted = [parser.feed(response[i:i + 7]) for i in range(0, len(response), 7)]
+
+        tickets = [ticket for batch in emitted for ticket in batch]
+        self.assertEqual(tickets, [{'title': 'Login {page}', 'description': 'Use "SSO"'}])
+        self.assertEqual(parser.close()[0]['title'], 'Logout')
+
+    async def test_stream_endpoint_sends_saved_tickets(self):
+        document = await Document.objects.acreate(file_name='spec.pdf', content='Build a login page')
+
+        async def stream_chunk(chunk, bypass_cache=False):
+            for i in range(3):
+                yield {'title': f'Streamed {i}', 'description': 'Details'}
+
+        with mock.patch('apps.tickets.streaming.chunk_text', side_effect=lambda content, max_tokens: [content]), \
+                mock.patch('apps.tickets.streaming.astream_chunk_tickets', stream_chunk):
+            response = await self.async_client.post(f'/api/tickets/stream/{document.id}/')
+            body = ''.join([part.decode() async for part in response.streaming_content])
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(body.count('event: ticket'), 3)
+        self.assertIn('event: done\ndata: {"count": 3}', body)
+        self.assertEqual(await Ticket.objects.filter(document=document).acount(), 3)
+
+    async def test_stream_endpoint_rejects_get(self):
+        response = await self.async_client.get('/api/tickets/stream/1/')
+        self.assertEqual(response.status_code, 405)
+
+
+class TicketRepairTests(TestCase):
+
+    @mock.patch('apps.tickets.ai_service.chat_completion')
+    def test_only_invalid_tickets_are_sent_for_repair(self, chat_completion):
+        chat_completion.side_effect = [
+            json.dumps({'tickets': [
+                {'title': 'Login page', 'description': 'Email and password form', 'priority': 'high'},
+                {'title': 'Logout', 'estimated_hours': 'soon'},
+            ]}),
+            json.dumps({'tickets': [{'title': 'Logout', 'description': 'End the session', 'estimated_hours': 1}]}),
+        ]
+
+        tickets = ai_service.generate_tickets_for_chunk('Users log in and out')
+
+        self.assertEqual([ticket['title'] for ticket in tickets], ['Login page', 'Logout'])
+        self.assertEqual(tickets[0]['priority'], 'HIGH')
+        self.assertEqual(chat_completion.call_count, 2)
+        repair_prompt = chat_completion.call_args.args[1]
+        self.assertIn('"title": "Logout"', repair_prompt)
+        self.assertNotIn('Email and password form', repair_prompt)
+
+    def test_malformed_json_is_repaired_without_another_call(self):
+        tickets_data = ai_service.parse_ticket_response('{"tickets": [{"title": "Login", "description": "Form",}')
+        self.assertEqual(tickets_data, [{'title': 'Login', 'description': 'Form'}])
+
+
+@mock.patch('apps.tickets.chunking.get_encoding', return_value=FakeEncoding())
+class ChunkingTests(SimpleTestCase):
+
+    def test_sections_are_packed_whole_up_to_the_budget(self, get_encoding):
+        text = "a b c\n\nd e\f\n\nf g h i"
+
+        self.assertEqual(chunk_text(text, 5), ["a b c\n\nd e", "f g h i"])
+
+    def test_oversized_section_is_split_on_lines_then_token_windows(self, get_encoding):
+        text = "one two three\nfour five\nsix\n\nw1 w2 w3 w4 w5 w6 w7 w8 w9 w10"
+
+        chunks = chunk_text(text, 4)
+
+        self.assertEqual(chunks, ["one two three", "four five\nsix", "w1 w2 w3 w4", "w5 w6 w7 w8", "w9 w10"])
+        self.assertTrue(all(count_tokens(chunk) <= 4 for chunk in chunks))
+
+    def test_section_boundaries_follow_page_content(self, get_encoding):
+        odd, even = '1' * 64, '2' * 64
+
+        def sections_for(hashes):
+            content, pages = '', []
+            for number, page_hash in enumerate(hashes, 1):
+                text = f"page {number}" if number != 6 else "  "
+                pages.append({'page': number, 'start': len(content), 'end': len(content) + len(text), 'hash': page_hash})
+                content += text
+            return build_sections(content, pages, 4)
+
+        sections = sections_for([odd, even, odd, odd, even, odd])
+        self.assertEqual([section.pages for section in sections], [[1, 2], [3, 4], [5]])
+        self.assertEqual(sections[0].text, "page 1\npage 2\n")
+
+        edited = sections_for(['3' * 64, even, odd, odd, even, odd])
+        self.assertEqual([section.pages for section in edited], [[1, 2], [3, 4], [5]])
+        self.assertNotEqual(edited[0].hash, sections[0].hash)
+        self.assertEqual(edited[1:], sections[1:])
+
+    def test_tickets_repeated_across_chunks_are_merged(self, get_encoding):
+        seen = set()
+        merged = ai_service.merge_ticket_batches([
+            [{'title': 'Login page'}, {'title': 'Password reset'}],
+            [{'title': 'login  page!'}, 'not a ticket', {'title': 'Audit log'}],
+        ], seen)
+
+        self.assertEqual([ticket['title'] for ticket in merged], ['Login page', 'Password reset', 'Audit log'])
+        self.assertEqual(ai_service.merge_ticket_batches([[{'title': 'Audit Log'}]], seen), [])
+
+
+@mock.patch('apps.tickets.chunking.get_encoding', return_value=FakeEncoding())
+class GenerationStageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.document = SimpleNamespace(pk=1, content="Export invoices to CSV.\n\nSend a reset link by email.")
+
+    def assert_stage_failed(self, results, name, error):
+        self.assertEqual(results['errors'][name], error)
+        self.assertEqual(results[name], STAGE_FALLBACKS[name])
+
+    def test_failed_stages_are_reported_and_the_others_kept(self, get_encoding):
+        def complete(system_prompt, user_prompt, **options):
+            if system_prompt == ai_service.SUMMARY_SYSTEM_PROMPT:
+                return " Invoices can be exported. "
+            raise RuntimeError('quota exceeded')
+
+        with mock.patch('apps.tickets.ai_service.chat_completion', side_effect=complete):
+            results = run_generation_stages(self.document, single_call=False)
+
+        self.assert_stage_failed(results, 'tickets', 'quota exceeded')
+        self.assert_stage_failed(results, 'clarifying_questions', 'quota exceeded')
+        self.assertNotIn('scope_summary', results['errors'])
+        self.assertEqual(results['scope_summary'], "Invoices can be exported.")
+
+    def test_async_stage_failures_are_reported(self, get_encoding):
+        with mock.patch.object(async_ai_service, 'achat_completion', side_effect=RuntimeError('quota exceeded')):
+            results = asyncio.run(arun_generation_stages(self.document, single_call=False))
+
+        for name in STAGE_FALLBACKS:
+            self.assert_stage_failed(results, name, 'quota exceeded')
+
+
+class LLMCacheTests(TestCase):
+
+    def setUp(self):
+        llm_cache.clear_memory()
+        self.addCleanup(llm_cache.clear_memory)
+        self.key = llm_cache.make_cache_key('gpt-3.5-turbo', 'system', 'Build a login page', 0.7)
+
+    def test_database_tier_refills_the_memory_tier(self):
+        llm_cache.store(self.key, 'gpt-3.5-turbo', '[]')
+        llm_cache.clear_memory()
+        before = llm_cache.get_cache_stats()
+
+        self.assertEqual(llm_cache.lookup(self.key), '[]')
+        with self.assertNumQueries(0):
+            self.assertEqual(llm_cache.lookup(self.key), '[]')
+
+        stats = llm_cache.get_cache_stats()
+        self.assertEqual(stats['db_hits'] - before['db_hits'], 1)
+        self.assertEqual(stats['memory_hits'] - before['memory_hits'], 1)
+        self.assertEqual(LLMResponse.objects.get(key=self.key).hit_count, 1)
+
+    @override_settings(LLM_CACHE_TTL=60)
+    def test_expired_entries_are_not_served_from_either_tier(self):
+        llm_cache.store(self.key, 'gpt-3.5-turbo', '[]')
+        later = timezone.now() + timedelta(seconds=61)
+
+        with mock.patch('apps.tickets.llm_cache.timezone.now', return_value=later):
+            self.assertIsNone(llm_cache.lookup(self.key))
+        self.assertEqual(llm_cache.get_cache_stats()['memory_entries'], 0)
+
+    @override_settings(LLM_CACHE_MEMORY_SIZE=2)
+    def test_memory_tier_evicts_the_least_recently_used(self):
+        keys = [llm_cache.make_cache_key('gpt-3.5-turbo', 'system', str(i), 0.7) for i in range(3)]
+        for key in keys:
+            llm_cache.store(key, 'gpt-3.5-turbo', key)
+
+        self.assertEqual(llm_cache.get_cache_stats()['memory_entries'], 2)
+        with self.assertNumQueries(2):
+            self.assertEqual(llm_cache.lookup(keys[0]), keys[0])
+
+    @override_settings(LLM_CACHE_MAX_ENTRIES=1)
+    def test_prune_drops_expired_then_least_recently_used_rows(self):
+        now = timezone.now()
+        for key, last_hit, expires in (('expired', 0, -1), ('old', -120, 60), ('recent', -10, 60)):
+            LLMResponse.objects.create(
+                key=key, model='gpt-3.5-turbo', response='[]',
+                last_hit_at=now + timedelta(seconds=last_hit), expires_at=now + timedelta(seconds=expires)
+            )
+
+        llm_cache.prune_expired(now)
+
+        self.assertEqual(list(LLMResponse.objects.values_list('key', flat=True)), ['recent'])
+
+
+def rate_limit_error(headers=None):
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    response = httpx.Response(429, headers=headers or {}, request=request)
+    return openai.RateLimitError('Rate limit reached', response=response, body=None)
+
+
+@override_settings(OPENAI_RATE_LIMIT_ENABLED=False, OPENAI_MAX_RETRIES=2)
+@mock.patch('apps.tickets.rate_limit.estimate_tokens', return_value=1000)
+class OpenAIRateLimitTests(TestCase):
+
+    def test_retry_delay_honours_retry_after(self, estimate_tokens):
+        self.assertEqual(rate_limit.retry_delay(rate_limit_error({'retry-after-ms': '250'}), 1), 0.25)
+        self.assertEqual(rate_limit.retry_delay(rate_limit_error({'retry-after': '3'}), 1), 3)
+
+    @mock.patch('apps.tickets.rate_limit.time.sleep')
+    def test_call_retries_rate_limit_errors(self, sleep, estimate_tokens):
+        messages = [{'role': 'user', 'content': 'Build a login page'}]
+        create = mock.Mock(side_effect=[rate_limit_error({'retry-after': '2'}), 'response'])
+
+        self.assertEqual(rate_limit.call_with_limits(create, 'gpt-3.5-turbo', messages), 'response')
+        self.assertEqual(create.call_count, 2)
+        sleep.assert_called_once_with(2.0)
+
+    @mock.patch('apps.tickets.rate_limit.time.sleep')
+    def test_call_gives_up_after_max_retries(self, sleep, estimate_tokens):
+        messages = [{'role': 'user', 'content': 'Build a login page'}]
+        create = mock.Mock(side_effect=rate_limit_error())
+
+        with self.assertRaises(openai.RateLimitError):
+            rate_limit.call_with_limits(create, 'gpt-3.5-turbo', messages)
+        self.assertEqual(create.call_count, 3)
+
+    def test_async_redis_client_is_bound_to_its_event_loop(self, estimate_tokens):
+        limiter = rate_limit.OpenAIRateLimiter()
+
+        async def clients():
+            return limiter._async_client(), limiter._async_client()
+
+        first, again = asyncio.run(clients())
+        other, _ = asyncio.run(clients())
+        self.assertIs(first, again)
+        self.assertIsNot(first[0], other[0])
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    def test_suite_runs_offline_and_flags_regressions(self):
+        from .benchmarks import compare_to_baseline, run_benchmarks
+
+        results = run_benchmarks(rounds=1, page_counts=(10,))
+        self.assertIn('extract_text[10p]', results)
+        self.assertIn('create_tickets[200]', results)
+
+        baseline = {name: dict(stats, median_s=stats['median_s'] / 10) for name, stats in results.items()}
+        self.assertEqual(set(compare_to_baseline(results, baseline, 0.25)), set(results))
+        self.assertEqual(compare_to_baseline(results, results, 0.25), {})
@@ -3,5 +3,9 @@ from . import views
 
 urlpatterns = [
     path('generate/<int:document_id>/', views.generate_tickets, name='generate_tickets'),
+    path('stream/<int:document_id>/', views.stream_tickets, name='stream_tickets'),
     path('document/<int:document_id>/', views.list_tickets, name='list_tickets'),
+    path('<int:ticket_id>/similar/', views.similar_tickets, name='similar_tickets'),
+    path('search/', views.search_tickets, name='search_tickets'),
+    path('cache-stats/', views.llm_cache_stats, name='llm_cache_stats'),
 ]
\ No newline at end of file
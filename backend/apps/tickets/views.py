@@ -1,44 +1,168 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from apps.documents.models import Document
 from .models import Ticket
-from .serializers import TicketSerializer
-from .ai_service import generate_tickets_from_content
+from .serializers import TicketSerializer, TicketSearchSerializer
+from apps.documents.pagination import SearchResultsPagination
+from apps.documents.search import attach_headlines, build_query, ranked
+from .async_ai_service import agenerate_tickets_from_content
+from .streaming import astream_tickets, sse_event
+from .dedup import find_similar
+from . import llm_cache
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+@csrf_exempt
+@require_POST
+async def generate_tickets(request, document_id):
+    """
+    Native async view: the OpenAI calls are awaited on the event loop, so a
+    single ASGI process can hold many generations in flight at once
+    """
+    try:
+        document = await Document.objects.aget(pk=document_id)
+    except Document.DoesNotExist:
+        return JsonResponse(
+            {'error': 'Document not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
 
-@api_view(['POST'])
-def generate_tickets(request, document_id):
     try:
-        print(f"Generating tickets for document {document_id}")
-        document = Document.objects.get(pk=document_id)
-        
-        # Generate tickets
-        tickets = generate_tickets_from_content(document)
-        print(f"Generated {len(tickets)} tickets")
-        
-        # Verify tickets in database
-        db_tickets = Ticket.objects.filter(document=document)
-        print(f"Found {db_tickets.count()} tickets in database")
-        
+        # Generate tickets, skipping cached completions when a fresh run is requested
+        bypass_cache = str(_request_data(request).get('bypass_cache', '')).lower() in ('1', 'true')
+        tickets = await agenerate_tickets_from_content(document, bypass_cache=bypass_cache)
+        logger.info("Generated tickets", extra={'document_id': document_id, 'count': len(tickets)})
+
         serializer = TicketSerializer(tickets, many=True)
-        return Response({
+        return JsonResponse({
             'message': f'Generated {len(tickets)} tickets',
             'tickets': serializer.data
         })
+    except Exception as e:
+        logger.exception("Error in generate_tickets view", extra={'document_id': document_id})
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@csrf_exempt
+@require_POST
+async def stream_tickets(request, document_id):
+    """
+    Generate tickets as server-sent events: a ``ticket`` event per ticket as
+    soon as the model has finished writing and it has been saved, then a
+    ``done`` event with the count. POST only, like generate_tickets, since
+    it spends OpenAI quota and writes tickets; clients read the stream with
+    fetch rather than EventSource.
+    """
+    try:
+        document = await Document.objects.defer('search_vector').aget(pk=document_id)
     except Document.DoesNotExist:
-        return Response(
-            {'error': 'Document not found'}, 
+        return JsonResponse(
+            {'error': 'Document not found'},
             status=status.HTTP_404_NOT_FOUND
         )
+
+    bypass_cache = str(_request_data(request).get('bypass_cache', '')).lower() in ('1', 'true')
+    response = StreamingHttpResponse(_ticket_events(document, bypass_cache), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def _ticket_events(document, bypass_cache):
+    started, count = time.monotonic(), 0
+    try:
+        async for ticket in astream_tickets(document, bypass_cache=bypass_cache):
+            if not count:
+                logger.info("Streamed first ticket", extra={
+                    'document_id': document.pk,
+                    'seconds': round(time.monotonic() - started, 3)
+                })
+            count += 1
+            yield sse_event('ticket', TicketSerializer(ticket).data)
     except Exception as e:
-        print(f"Error in generate_tickets view: {str(e)}")
-        return Response(
-            {'error': str(e)}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        logger.exception("Error streaming tickets", extra={'document_id': document.pk})
+        yield sse_event('error', {'error': str(e)})
+        return
+
+    logger.info("Streamed tickets", extra={
+        'document_id': document.pk,
+        'count': count,
+        'seconds': round(time.monotonic() - started, 3)
+    })
+    yield sse_event('done', {'count': count})
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
 
 @api_view(['GET'])
 def list_tickets(request, document_id):
-    tickets = Ticket.objects.filter(document_id=document_id)
+    tickets = Ticket.objects.filter(document_id=document_id).order_by('created_at')
     serializer = TicketSerializer(tickets, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+@api_view(['GET'])
+def search_tickets(request):
+    """
+    Full-text search over ticket titles and descriptions, best match first
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response(
+            {'error': 'Query parameter q is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    query = build_query(text)
+    queryset = ranked(Ticket.objects.defer('description', 'search_vector'), query)
+    document_id = request.query_params.get('document', '')
+    if document_id:
+        if not document_id.isdigit():
+            return Response(
+                {'error': 'document must be a document id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = queryset.filter(document_id=document_id)
+
+    paginator = SearchResultsPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    attach_headlines(page, query, title_headline='title', description_headline='description')
+    serializer = TicketSearchSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+def similar_tickets(request, ticket_id):
+    """
+    Near-duplicates of a ticket from the MinHash LSH index, most similar first
+    """
+    ticket = get_object_or_404(Ticket.objects.only('id', 'title', 'description'), pk=ticket_id)
+    matches = dict(find_similar(ticket.title, ticket.description, exclude=ticket.id))
+    similar = sorted(
+        Ticket.objects.filter(pk__in=matches).defer('minhash', 'search_vector'),
+        key=lambda match: matches[match.id],
+        reverse=True
+    )
+    data = TicketSerializer(similar, many=True).data
+    for item, match in zip(data, similar):
+        item['document'] = match.document_id
+        item['similarity'] = matches[match.id]
+    return Response(data)
+
+@api_view(['GET'])
+def llm_cache_stats(request):
+    return Response(llm_cache.get_cache_stats())
@@ -3,14 +3,43 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Besides HTTP, the callable answers the ASGI lifespan protocol: on startup it
+binds the server's event loop for async document processing, and on shutdown
+it waits for documents still being processed there.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler  # noqa: E402
+from apps.documents import async_pipeline  # noqa: E402  (needs the app registry)
+
+if settings.DEBUG:
+    # runserver served static files itself; uvicorn does not
+    django_application = ASGIStaticFilesHandler(django_application)
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'lifespan':
+        await django_application(scope, receive, send)
+        return
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            async_pipeline.bind_event_loop(asyncio.get_running_loop())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_pipeline.drain(timeout=settings.ASYNC_PROCESSING_SHUTDOWN_TIMEOUT)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
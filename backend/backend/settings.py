@@ -42,12 +42,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
 
     # apps
     'apps.tickets',
     'apps.documents',
+    'apps.telemetry',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -183,3 +185,167 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'apps.telemetry.log_format.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['console'],
+            'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Metrics. /metrics/ answers only requests from METRICS_ALLOWED_IPS or bearing
+# METRICS_TOKEN. Counters live in each process: run a single uvicorn worker
+# per container (as the Dockerfile does) or scrape every worker separately.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',') if ip.strip()]
+
+# Celery
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+
+# AI generation
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '3'))
+AI_SINGLE_CALL_GENERATION = os.getenv('AI_SINGLE_CALL_GENERATION', 'False') == 'True'
+AI_CHUNK_TOKENS = int(os.getenv('AI_CHUNK_TOKENS', '3000'))
+AI_CHUNK_CONCURRENCY = int(os.getenv('AI_CHUNK_CONCURRENCY', '4'))
+
+# 'celery' queues uploads on the worker; 'asgi' processes them as coroutines
+# on the uvicorn event loop, so in-flight OpenAI calls do not hold a worker
+DOCUMENT_PROCESSING_BACKEND = os.getenv('DOCUMENT_PROCESSING_BACKEND', 'celery')
+ASYNC_PROCESSING_MAX_IN_FLIGHT = int(os.getenv('ASYNC_PROCESSING_MAX_IN_FLIGHT', '200'))
+ASYNC_PROCESSING_SHUTDOWN_TIMEOUT = int(os.getenv('ASYNC_PROCESSING_SHUTDOWN_TIMEOUT', '30'))
+
+# LLM response cache
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True') == 'True'
+LLM_CACHE_MEMORY_SIZE = int(os.getenv('LLM_CACHE_MEMORY_SIZE', '256'))
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 60 * 60)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+# Seconds between scheduled prunes of expired and excess cache rows
+LLM_CACHE_PRUNE_INTERVAL = int(os.getenv('LLM_CACHE_PRUNE_INTERVAL', '3600'))
+
+# OpenAI rate limiting, shared by every process through Redis. Limits are the
+# account's per-model quota; HEADROOM keeps the budget just under it.
+OPENAI_RATE_LIMIT_ENABLED = os.getenv('OPENAI_RATE_LIMIT_ENABLED', 'True') == 'True'
+OPENAI_RATE_LIMIT_REDIS_URL = os.getenv('OPENAI_RATE_LIMIT_REDIS_URL', os.getenv('CACHE_URL', 'redis://redis:6379/1'))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '3500'))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', '160000'))
+OPENAI_RATE_LIMIT_HEADROOM = float(os.getenv('OPENAI_RATE_LIMIT_HEADROOM', '0.95'))
+OPENAI_RATE_LIMIT_MAX_WAIT = float(os.getenv('OPENAI_RATE_LIMIT_MAX_WAIT', '300'))
+OPENAI_RATE_LIMIT_COOLDOWN = float(os.getenv('OPENAI_RATE_LIMIT_COOLDOWN', '30'))
+OPENAI_COMPLETION_TOKEN_ESTIMATE = int(os.getenv('OPENAI_COMPLETION_TOKEN_ESTIMATE', '1000'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '5'))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv('OPENAI_RETRY_BASE_DELAY', '1.0'))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv('OPENAI_RETRY_MAX_DELAY', '60'))
+
+# Generated tickets failing schema validation are sent back to the model for
+# repair (only the invalid ones) up to this many times before being dropped
+TICKET_REPAIR_ATTEMPTS = int(os.getenv('TICKET_REPAIR_ATTEMPTS', '1'))
+
+# Near-duplicate tickets (estimated Jaccard similarity of MinHash signatures)
+TICKET_DUPLICATE_THRESHOLD = float(os.getenv('TICKET_DUPLICATE_THRESHOLD', '0.8'))
+
+# PDF extraction
+PDF_PARALLEL_THRESHOLD_PAGES = int(os.getenv('PDF_PARALLEL_THRESHOLD_PAGES', '100'))
+PDF_PAGES_PER_WORKER_CHUNK = int(os.getenv('PDF_PAGES_PER_WORKER_CHUNK', '50'))
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', str(os.cpu_count() or 2)))
+
+# Document extraction (all formats). DOCX, PPTX and XLSX each get their own
+# process pool; workers are capped at EXTRACTION_WORKER_MEMORY_MB and
+# replaced after EXTRACTION_TASKS_PER_WORKER documents
+EXTRACTION_MAX_CHARS = int(os.getenv('EXTRACTION_MAX_CHARS', '5000000'))
+EXTRACTION_WORKER_MEMORY_MB = int(os.getenv('EXTRACTION_WORKER_MEMORY_MB', '1024'))
+EXTRACTION_TASKS_PER_WORKER = int(os.getenv('EXTRACTION_TASKS_PER_WORKER', '50'))
+EXTRACTION_POOL_WORKERS = {
+    name: int(os.getenv(f'EXTRACTION_{name.upper()}_WORKERS', default))
+    for name, default in (('docx', '2'), ('pptx', '2'), ('xlsx', '1'))
+}
+
+# Jira / GitLab push
+JIRA_BULK_BATCH_SIZE = int(os.getenv('JIRA_BULK_BATCH_SIZE', '50'))
+JIRA_REQUESTS_PER_SECOND = float(os.getenv('JIRA_REQUESTS_PER_SECOND', '5'))
+GITLAB_REQUESTS_PER_SECOND = float(os.getenv('GITLAB_REQUESTS_PER_SECOND', '10'))
+GITLAB_PUSH_CONCURRENCY = int(os.getenv('GITLAB_PUSH_CONCURRENCY', '4'))
+PUSH_MAX_RETRIES = int(os.getenv('PUSH_MAX_RETRIES', '4'))
+PUSH_RETRY_BASE_DELAY = float(os.getenv('PUSH_RETRY_BASE_DELAY', '1.0'))
+
+# Jira / GitLab API clients
+API_CLIENT_CONNECT_TIMEOUT = float(os.getenv('API_CLIENT_CONNECT_TIMEOUT', '5'))
+API_CLIENT_READ_TIMEOUT = float(os.getenv('API_CLIENT_READ_TIMEOUT', '30'))
+API_CLIENT_POOL_CONNECTIONS = int(os.getenv('API_CLIENT_POOL_CONNECTIONS', '4'))
+API_CLIENT_POOL_MAXSIZE = int(os.getenv('API_CLIENT_POOL_MAXSIZE', '16'))
+
+# Upload sessions idle for UPLOAD_SESSION_TTL seconds are deleted with their
+# part files by a task run every UPLOAD_SESSION_EXPIRE_INTERVAL seconds
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 60 * 60)))
+UPLOAD_SESSION_EXPIRE_INTERVAL = int(os.getenv('UPLOAD_SESSION_EXPIRE_INTERVAL', '3600'))
+
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+
+# Project listings are fresh for PROJECT_LISTING_TTL seconds and served stale
+# (while refreshing in the background) for up to PROJECT_LISTING_STALE_TTL
+PROJECT_LISTING_TTL = int(os.getenv('PROJECT_LISTING_TTL', '300'))
+PROJECT_LISTING_STALE_TTL = int(os.getenv('PROJECT_LISTING_STALE_TTL', '86400'))
+PROJECT_LISTING_REFRESH_INTERVAL = int(os.getenv('PROJECT_LISTING_REFRESH_INTERVAL', '240'))
+
+CELERY_BEAT_SCHEDULE = {
+    'refresh-project-listings': {
+        'task': 'apps.documents.tasks.refresh_project_listings',
+        'schedule': PROJECT_LISTING_REFRESH_INTERVAL,
+    },
+    'prune-llm-cache': {
+        'task': 'apps.tickets.tasks.prune_llm_cache',
+        'schedule': LLM_CACHE_PRUNE_INTERVAL,
+    },
+    'expire-upload-sessions': {
+        'task': 'apps.documents.tasks.expire_upload_sessions',
+        'schedule': UPLOAD_SESSION_EXPIRE_INTERVAL,
+    },
+}
+
+# File delivery: 'django' streams through the app, 'x-accel' hands off to nginx
+# (internal location at FILE_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT), 'x-sendfile' to Apache/lighttpd
+FILE_DELIVERY_MODE = os.getenv('FILE_DELIVERY_MODE', 'django')
+FILE_ACCEL_REDIRECT_PREFIX = os.getenv('FILE_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# Uploads
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(500 * 1024 * 1024)))
+# Raw chunk bodies are read into memory, so allow one chunk plus headroom
+DATA_UPLOAD_MAX_MEMORY_SIZE = UPLOAD_CHUNK_SIZE + 1024 * 1024
+
+# Bulk ingestion
+BULK_INGEST_MAX_FILES = int(os.getenv('BULK_INGEST_MAX_FILES', '200'))
+BULK_PROCESSING_CONCURRENCY = int(os.getenv('BULK_PROCESSING_CONCURRENCY', '4'))
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_INGEST_MAX_FILES
@@ -0,0 +1,45 @@
+"""
+Shared helpers for API tests.
+
+QueryBudgetMixin lets endpoint tests pin the maximum number of queries a
+request may run and check that the query plans behind hot paths can use
+their indexes, so N+1 patterns and missing indexes fail the suite.
+"""
+
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > max_queries:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f'{executed} queries executed, budget is {max_queries}:\n{queries}')
+
+    def explain(self, queryset):
+        """
+        EXPLAIN a queryset with sequential scans disabled, so the plan shows
+        whether an index can serve it even on the tiny tables used in tests.
+        The table is analyzed first so the choice between indexes does not
+        depend on statistics left behind by earlier tests.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(queryset.model._meta.db_table)}')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            try:
+                return queryset.explain()
+            finally:
+                cursor.execute('SET LOCAL enable_seqscan = on')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan, f'Expected plan to use {index_name}:\n{plan}')
@@ -8,4 +8,5 @@ urlpatterns = [
     path('api/documents/', include('apps.documents.urls')),
     path('api/tickets/', include('apps.tickets.urls')),
     path('api/auth/', include('apps.auth.urls')),
+    path('metrics/', include('apps.telemetry.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -21,31 +21,50 @@ interface Ticket {
 interface Document {
   id: number
   file_name: string
-  content: string
   uploaded_at: string
   jira_status: string
-  tickets: Ticket[]
+  processing_stage: string
+  tickets_count: number
 }
 
 export default function TicketsPage() {
   const [documents, setDocuments] = useState<Document[]>([])
+  const [nextPage, setNextPage] = useState<string | null>(null)
+  const [tickets, setTickets] = useState<Record<number, Ticket[]>>({})
   const [loading, setLoading] = useState(true)
   const [expandedDoc, setExpandedDoc] = useState<number | null>(null)
 
+  const fetchDocuments = async (url: string = '/documents/') => {
+    try {
+      const response = await api.get(url)
+      setDocuments(prev => url === '/documents/' ? response.data.results : [...prev, ...response.data.results])
+      setNextPage(response.data.next)
+    } catch (error) {
+      console.error('Failed to fetch documents:', error)
+    } finally {
+      setLoading(false)
+    }
+  }
+
   useEffect(() => {
-    const fetchDocuments = async () => {
+    fetchDocuments()
+  }, [])
+
+  const toggleDocument = async (documentId: number) => {
+    if (expandedDoc === documentId) {
+      setExpandedDoc(null)
+      return
+    }
+    setExpandedDoc(documentId)
+    if (!tickets[documentId]) {
       try {
-        const response = await api.get('/documents/')
-        setDocuments(response.data)
+        const response = await api.get(`/tickets/document/${documentId}/`)
+        setTickets(prev => ({ ...prev, [documentId]: response.data }))
       } catch (error) {
         console.error('Failed to fetch tickets:', error)
-      } finally {
-        setLoading(false)
       }
     }
-
-    fetchDocuments()
-  }, [])
+  }
 
   const getPriorityColor = (priority: string) => {
     switch (priority.toUpperCase()) {
@@ -153,7 +172,7 @@ export default function TicketsPage() {
                 </span>
               </div>
               <p className="text-sm text-gray-700">
-                {document.tickets.length} tickets • Generated {new Date(document.uploaded_at).toLocaleDateString()}
+                {document.tickets_count} tickets • Generated {new Date(document.uploaded_at).toLocaleDateString()}
               </p>
             </div>
             
@@ -182,7 +201,7 @@ export default function TicketsPage() {
               
               {/* Expand/Collapse Button */}
               <button
-                onClick={() => setExpandedDoc(expandedDoc === document.id ? null : document.id)}
+                onClick={() => toggleDocument(document.id)}
                 className="p-2 text-indigo-600 hover:text-indigo-800 hover:bg-indigo-50 rounded-full transition-colors"
                 title={expandedDoc === document.id ? 'Hide Tickets' : 'Show Tickets'}
               >
@@ -208,7 +227,7 @@ export default function TicketsPage() {
                   </tr>
                 </thead>
                 <tbody className="bg-white divide-y divide-gray-200">
-                  {document.tickets.map((ticket) => (
+                  {(tickets[document.id] || []).map((ticket) => (
                     <tr key={ticket.id} className="hover:bg-gray-50">
                       <td className="px-6 py-4 whitespace-nowrap">
                         <div className="text-sm font-medium text-gray-900">{ticket.title}</div>
@@ -235,6 +254,14 @@ export default function TicketsPage() {
           )}
         </div>
       ))}
+
+      {nextPage && (
+        <div className="flex justify-center">
+          <Button variant="secondary" size="sm" onClick={() => fetchDocuments(nextPage)}>
+            Load more
+          </Button>
+        </div>
+      )}
     </div>
   )
 }
\ No newline at end of file